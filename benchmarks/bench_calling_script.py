@@ -0,0 +1,133 @@
+''' Cost of sg_wrapper_util.get_calling_script on a synthetic 200 frames stack, versus the
+    inspect.stack based version it replaced, with the number of filesystem checks per call.
+
+    The frames come from modules generated in a package folder (<tools>/myTool/1.0/package.py)
+    nested a few folders deep, like the tools of a DCC session.
+'''
+
+import inspect
+import os
+import shutil
+import sys
+import tempfile
+import types
+
+import common
+
+import sg_wrapper_util
+
+depth = 200
+moduleCount = 10
+number = 50
+
+moduleSource = '''
+def call(modules, index, depth, func):
+    if depth <= 1:
+        return func()
+    return modules[(index + 1) % len(modules)].call(modules, index + 1, depth - 1, func)
+'''
+
+
+def legacy_get_calling_script():
+    ''' get_calling_script before sys._getframe and the memoized package folders '''
+    convertedStack = []
+    for frame in inspect.stack():
+        if frame[3] == '__load_apps':
+            break
+        path = frame[1]
+        if path.startswith('python') or '<stdin>' == path:
+            convertedStack.append((None, None))
+            continue
+
+        filename = os.path.abspath(path)
+        name = os.path.splitext(os.path.basename(filename))[0]
+        packageName = None
+        lastFolder = filename
+        folder = os.path.dirname(filename)
+        while folder != lastFolder:
+            if os.path.exists(os.path.join(folder, 'package.py')):
+                packageName = os.path.basename(os.path.dirname(folder))
+                break
+            lastFolder = folder
+            folder = os.path.dirname(folder)
+        convertedStack.append((name, packageName))
+
+    cmdFileName = os.path.splitext(os.path.basename(sys.argv[0]))[0]
+    for filename, scriptName in convertedStack[::-1]:
+        if filename and filename == cmdFileName:
+            return filename
+        if scriptName:
+            return scriptName
+        if filename:
+            return filename
+    return None
+
+
+def make_modules(folder):
+    ''' Write the modules the stack goes through, and return them '''
+    versionFolder = os.path.join(folder, 'myTool', '1.0')
+    moduleFolder = os.path.join(versionFolder, 'python', 'myTool', 'core', 'utils')
+    os.makedirs(moduleFolder)
+    open(os.path.join(versionFolder, 'package.py'), 'w').close()
+
+    modules = []
+    for i in range(moduleCount):
+        path = os.path.join(moduleFolder, 'module%d.py' % i)
+        with open(path, 'w') as f:
+            f.write(moduleSource)
+        module = types.ModuleType('module%d' % i)
+        exec(compile(moduleSource, path, 'exec'), module.__dict__)
+        modules.append(module)
+    return modules
+
+
+class CountingExists(object):
+    ''' Stand-in for os.path.exists counting its calls '''
+
+    def __init__(self):
+        self.exists = os.path.exists
+        self.calls = 0
+
+    def __call__(self, path):
+        self.calls += 1
+        return self.exists(path)
+
+
+def measure(modules, func):
+    ''' Return the result, the filesystem checks of a first and of a second call, and the best time per call '''
+    counter = CountingExists()
+    os.path.exists = counter
+    try:
+        result = modules[0].call(modules, 0, depth, func)
+        firstChecks = counter.calls
+        modules[0].call(modules, 0, depth, func)
+        nextChecks = counter.calls - firstChecks
+    finally:
+        os.path.exists = counter.exists
+
+    duration = common.best_of(lambda: modules[0].call(modules, 0, depth, func), number=number)
+    return result, firstChecks, nextChecks, duration
+
+
+def main():
+    folder = tempfile.mkdtemp()
+    try:
+        modules = make_modules(folder)
+
+        rows = []
+        results = set()
+        for label, func in (('inspect.stack', legacy_get_calling_script),
+                            ('get_calling_script', sg_wrapper_util.get_calling_script)):
+            result, firstChecks, nextChecks, duration = measure(modules, func)
+            results.add(result)
+            rows.append((label, '%6.2f ms/call   %4d checks on first call, %4d on the next ones'
+                         % (duration * 1000, firstChecks, nextChecks)))
+
+        assert len(results) == 1, results
+        common.report('Calling script of a %d frames stack (%s)' % (depth, results.pop()), rows)
+    finally:
+        shutil.rmtree(folder)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+''' Cost of an entity type lookup as the schema grows: the EntityTypeRegistry of a handle
+    versus the linear scan of the entity list it replaced.
+
+    The looked up type is the last one of the schema, the worst case of the scan.
+'''
+
+import common
+
+import shotgun_api3
+
+import sg_wrapper
+
+sizes = (50, 200, 800)
+number = 20000
+
+
+def scan_real_type(entityList, entityType):
+    ''' The lookup of get_real_type before the registry '''
+    for e in entityList:
+        if entityType in [e['type'], e['name'], e['type_plural'], e['name_plural']]:
+            return e['type']
+    return None
+
+
+def main():
+    baseTypes = list(shotgun_api3.ENTITY_TYPES)
+
+    rows = []
+    for size in sizes:
+        shotgun_api3.ENTITY_TYPES = baseTypes + ['CustomEntity%02d' % i for i in range(1, size - len(baseTypes) + 1)]
+        shotgun_api3.reset()
+        sg = sg_wrapper.Shotgun(common.server, 'bench', 'key', disableApiAuthOverride=True, printInfo=False)
+
+        entityList = list(sg._entity_types)
+        last = entityList[-1]['name_plural']
+        assert sg.get_real_type(last) == scan_real_type(entityList, last)
+
+        scanTime = common.best_of(lambda: scan_real_type(entityList, last), number=number // 10)
+        registryTime = common.best_of(lambda: sg.get_real_type(last), number=number)
+        accessorTime = common.best_of(lambda: sg.is_entity_plural(last), number=number)
+
+        rows.append(('%d types' % len(entityList),
+                     'scan %8.2f us   get_real_type %5.2f us   is_entity_plural %5.2f us'
+                     % (scanTime * 1e6, registryTime * 1e6, accessorTime * 1e6)))
+
+    shotgun_api3.ENTITY_TYPES = baseTypes
+    common.report('Entity type lookup, per call', rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+''' Wall-clock time from the construction of a Shotgun handle to its first query, eager
+    versus lazy, against the in-memory server with a simulated round-trip latency.
+
+    The eager constructor reads the schema, sets the session uuid and resolves the script
+    auth before returning. The lazy one sends nothing: the handles never queried cost no
+    request, the others pay the same requests on their first query.
+'''
+
+import common
+
+import shotgun_api3
+
+import sg_wrapper
+
+latency = 0.02
+records = {'Shot': [{'id': 1, 'code': 'sh001'}],
+           'ApiUser': [{'id': 1, 'firstname': 'bench', 'sg_public_password': 'key'}]}
+
+
+def construct(lazy):
+    return sg_wrapper.Shotgun(common.server, 'bench', 'key', lazy=lazy, printInfo=False)
+
+
+def first_query(lazy):
+    construct(lazy).Shot(1)
+
+
+def main():
+    shotgun_api3.reset(records)
+    shotgun_api3.LATENCY = latency
+
+    rows = []
+    for lazy in (False, True):
+        mode = 'lazy' if lazy else 'eager'
+        del shotgun_api3.CALLS[:]
+        construct(lazy)
+        constructRequests = len(shotgun_api3.CALLS)
+        constructTime = common.best_of(lambda: construct(lazy), number=5)
+
+        del shotgun_api3.CALLS[:]
+        first_query(lazy)
+        queryRequests = len(shotgun_api3.CALLS)
+        queryTime = common.best_of(lambda: first_query(lazy), number=5)
+
+        rows.append(('%s construction' % mode, '%7.1f ms  %d requests' % (constructTime * 1000, constructRequests)))
+        rows.append(('%s to first query' % mode, '%7.1f ms  %d requests' % (queryTime * 1000, queryRequests)))
+
+    common.report('Shotgun handle construction, %d ms per request' % (latency * 1000), rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,36 @@
+''' Throughput of a large sg_find by number of workers, against the in-memory server with a
+    simulated round-trip latency: each worker fetches pages on its own connection of the pool.
+'''
+
+import common
+
+import shotgun_api3
+
+import sg_wrapper
+
+latency = 0.03
+count = 20000
+workerCounts = (1, 2, 4, 8)
+
+
+def main():
+    shotgun_api3.reset({'Version': [{'id': i, 'code': 'v%05d' % i} for i in range(1, count + 1)]})
+    shotgun_api3.LATENCY = latency
+    sg = sg_wrapper.Shotgun(common.server, 'bench', 'key', disableApiAuthOverride=True, printInfo=False,
+                            connectionPoolSize=max(workerCounts))
+
+    rows = []
+    for workers in workerCounts:
+        del shotgun_api3.CALLS[:]
+        assert len(sg.sg_find('Version', [], ['code'], workers=workers)) == count
+        requests = len(shotgun_api3.calls('find'))
+
+        duration = common.best_of(lambda: sg.sg_find('Version', [], ['code'], workers=workers))
+        rows.append(('%d worker(s)' % workers, '%6.0f ms  %7.0f rows/s  %d requests'
+                     % (duration * 1000, count / duration, requests)))
+
+    common.report('sg_find of %d rows, %d ms per request' % (count, latency * 1000), rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+''' Overhead per call of the wrappers of a Shotgun handle, on a no-op stand-in api: the
+    retryWrapper, the retryWrapper as it was before its hooks were cached, and the full path
+    of a handle request (poolWrapper checking out a retryWrapper connection).
+'''
+
+import common
+
+import shotgun_api3
+
+import sg_wrapper
+from sg_wrapper_retry import RetryPolicy
+
+number = 200000
+rows = [{'type': 'Shot', 'id': i, 'code': 'sh%03d' % i} for i in range(50)]
+
+
+# the stand-in api answers every request at once
+def find_one(self, entity_type, filters, fields=None, **kwargs):
+    return rows[0]
+
+
+def find(self, entity_type, filters, fields=None, **kwargs):
+    return rows
+
+
+class LegacyRetryWrapper(shotgun_api3.Shotgun):
+    ''' retryWrapper before its hooks were cached: one hasattr, one getattr and one closure per
+        attribute access, and an equality test of the results with the connection
+    '''
+
+    def __init__(self, sg, retryPolicy):
+        self._sg = sg
+        self.retryPolicy = retryPolicy
+        self.exceptionType = shotgun_api3.ProtocolError
+        self.printInfo = False
+
+    def __getattribute__(self, attr):
+        self_sg = object.__getattribute__(self, '_sg')
+        if not hasattr(self_sg, attr):
+            return object.__getattribute__(self, attr)
+
+        attribute = self_sg.__getattribute__(attr)
+        if not callable(attribute):
+            return attribute
+
+        def retryHook(*args, **kwargs):
+            res = self.retryPolicy.call(attr, attribute, args, kwargs, self.exceptionType, self.printInfo)
+            if res == self._sg:
+                return self
+            return res
+
+        return retryHook
+
+
+def main():
+    shotgun_api3.reset()
+    shotgun_api3.Shotgun.find_one = find_one
+    shotgun_api3.Shotgun.find = find
+
+    raw = shotgun_api3.Shotgun(common.server, 'bench', 'key')
+    policy = RetryPolicy()
+    legacy = LegacyRetryWrapper(raw, policy)
+    wrapped = sg_wrapper.retryWrapper(raw, 8, 2, 2, False, shotgun_api3.ProtocolError, policy)
+    sg = sg_wrapper.Shotgun(sg=shotgun_api3.Shotgun(common.server, 'bench', 'key'), lazy=True,
+                            disableApiAuthOverride=True, printInfo=False)
+    handle = sg._sg
+
+    report = []
+    for method in ('find_one', 'find'):
+        times = []
+        for api in (raw, legacy, wrapped, handle):
+            times.append(common.best_of(lambda: getattr(api, method)('Shot', []), number=number))
+
+        rawTime = times[0]
+        report.append(('find (%d rows)' % len(rows) if method == 'find' else method,
+                       'raw %5.2f us   legacy retry +%5.2f us   retry +%5.2f us   handle +%5.2f us'
+                       % tuple([rawTime * 1e6] + [(t - rawTime) * 1e6 for t in times[1:]])))
+
+    common.report('Wrapper overhead per call, %d calls' % number, report)
+
+
+if __name__ == '__main__':
+    main()
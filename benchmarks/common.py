@@ -0,0 +1,34 @@
+''' Shared setup of the benchmarks, run against the in-memory shotgun_api3 of the tests folder
+
+    Run a benchmark from the repository root, with python 2 or 3:
+
+        python benchmarks/bench_lazy_init.py
+'''
+
+import os
+import sys
+import time
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(root, 'tests'), root]
+
+server = 'https://bench.shotgunstudio.com'
+
+
+def best_of(func, repeat=3, number=1):
+    ''' Return the best time of repeat runs of number calls of func, in seconds per call '''
+    times = []
+    for _ in range(repeat):
+        start = time.time()
+        for _ in range(number):
+            func()
+        times.append((time.time() - start) / number)
+    return min(times)
+
+
+def report(title, rows):
+    ''' Print a title and rows of (label, value) '''
+    print(title)
+    width = max(len(label) for label, _ in rows)
+    for label, value in rows:
+        print('  %s  %s' % (label.ljust(width), value))
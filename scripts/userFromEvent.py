@@ -1,40 +1,167 @@
 #!/usr/bin/env python2.7
 
+import os
 import sys
+import json
+import time
+import errno
 import argparse
+import itertools
+
+from sg_wrapper_util import get_user_from_event, get_users_from_events, get_default_handle
+
+userInfos = [
+             'firstname',
+             'lastname',
+             'email',
+             'login',
+            ]
+
+
+def parse_event_ranges(tokens):
+    ''' Return the inclusive ranges of event ids of tokens, each being an id or a range of ids (ie 100-200)
+
+    :raises ValueError: on the first token which is not a positive id or a range of them
+    '''
+    ranges = []
+    for token in tokens:
+        try:
+            if '-' in token.strip('-'):
+                start, end = token.split('-', 1)
+                start, end = int(start), int(end)
+            else:
+                start = end = int(token)
+        except ValueError:
+            raise ValueError('Invalid event id: %s' % token)
+
+        if start <= 0 or end < start:
+            raise ValueError('Invalid event id: %s' % token)
+        ranges.append((start, end))
+    return ranges
+
+
+def parse_event_ids(tokens):
+    ''' Return an iterator over the event ids of tokens, all of them being validated first
+
+    :raises ValueError: on the first token which is not a positive id or a range of them
+    '''
+    ranges = parse_event_ranges(tokens)
+    return itertools.chain.from_iterable(xrange(start, end + 1) for start, end in ranges)
+
+
+def read_tokens(stream):
+    for line in stream:
+        for token in line.split():
+            yield token
+
+
+def iter_chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def print_user(eventId, user):
+    ''' Print the infos of the user of an event, in a human readable form '''
+    print 'Event %s user infos:' % eventId
+    for info in userInfos:
+        if info in user.fields():
+            print '%s: %s' % (info.title(), user.field(info))
+
+    if 'permission_rule_set' in user.fields():
+        perm = user.permission_rule_set
+        if 'display_name' in perm.fields():
+            print 'Permission group: %s' % perm.display_name
+
+
+def user_record(eventId, users, withInfos):
+    ''' Return the JSON record of an event, from the result of get_users_from_events '''
+    if eventId not in users:
+        return {'event_id': eventId, 'login': None, 'error': 'event not found'}
+
+    user = users[eventId]
+    if user is None:
+        return {'event_id': eventId, 'login': None, 'error': 'user not found'}
+
+    if not withInfos:
+        return {'event_id': eventId, 'login': user}
+
+    record = {'event_id': eventId}
+    for info in userInfos:
+        record[info] = user.field(info) if info in user.fields() else None
+    return record
 
-from sg_wrapper_util import get_user_from_event
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(
         description="Shotgun's EventLogEntry blame",
         formatter_class=argparse.ArgumentDefaultsHelpFormatter)
 
-    parser.add_argument('event_id', type=int, help='the id of the event you want to retrieve the username from')
+    parser.add_argument('event_ids', nargs='*', metavar='event_id',
+                        help=('the ids of the events you want to retrieve the username from, '
+                              'or ranges of ids (ie 100-200). Read from stdin if none is given or with -'))
+    parser.add_argument('--json', action='store_true',
+                        help='write one JSON line per event (always on for several events)')
+    parser.add_argument('--user-infos', action='store_true',
+                        help='write the firstname, lastname and email of the users along their login')
+    parser.add_argument('--chunk-size', type=int, default=500, help='number of events resolved per request')
+    parser.add_argument('--stats', action='store_true', help='print the number of events per second on stderr')
 
     args = parser.parse_args()
 
+    tokens = args.event_ids
+    if not tokens or tokens == ['-']:
+        tokens = read_tokens(sys.stdin)
+
+    # legacy output: a single event
+    if len(args.event_ids) == 1 and args.event_ids[0].isdigit() and not args.json:
+        eventId = int(args.event_ids[0])
+        try:
+            user = get_user_from_event(eventId, onlyUsername=False)
+        except (RuntimeError, ValueError) as e:
+            print e
+            sys.exit(1)
+
+        if not user:
+            print 'Could not retrieve the user from this event'
+            sys.exit(1)
+
+        print_user(eventId, user)
+        sys.exit(0)
+
+    # every id is validated before the first query
     try:
-        user = get_user_from_event(args.event_id, onlyUsername=False)
-    except RuntimeError as e:
-        print e
+        eventIds = parse_event_ids(tokens)
+    except ValueError as e:
+        print >> sys.stderr, e
         sys.exit(1)
 
-    if not user:
-        print 'Could not retrieve the user from this event'
+    try:
+        sgw = get_default_handle()
+    except RuntimeError as e:
+        print >> sys.stderr, e
         sys.exit(1)
 
-    print 'Event %s user infos:' % args.event_id
-    for info in [
-                 'firstname',
-                 'lastname',
-                 'email',
-                 'login',
-                ]:
-        if info in user.fields():
-            print '%s: %s' % (info.title(), user.field(info))
+    start = time.time()
+    count = 0
+    try:
+        for chunk in iter_chunks(eventIds, args.chunk_size):
+            users = get_users_from_events(chunk, sgw=sgw, onlyUsername=not args.user_infos,
+                                          chunkSize=args.chunk_size)
+            for eventId in chunk:
+                sys.stdout.write(json.dumps(user_record(eventId, users, args.user_infos)) + '\n')
+            sys.stdout.flush()
+            count += len(chunk)
 
-    if 'permission_rule_set' in user.fields():
-        perm = user.permission_rule_set
-        if 'display_name' in perm.fields():
-            print 'Permission group: %s' % perm.display_name
+            if args.stats:
+                elapsed = time.time() - start
+                print >> sys.stderr, '%d events in %.1fs (%.0f events/s)' % (
+                    count, elapsed, count / elapsed if elapsed else 0)
+    except IOError as e:
+        if e.errno != errno.EPIPE:
+            raise
+        # the output reader is gone (ie | head): stop, without failing on the flush at exit
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
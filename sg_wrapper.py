@@ -1,13 +1,33 @@
 import copy
+import json
 import os
 import sys
+import threading
 import time
 import uuid
+import weakref
+
+from contextlib import contextmanager
 
 import shotgun_api3
 
+from sg_wrapper_auth import AuthCache
+from sg_wrapper_buffer import WriteBehindBuffer
+from sg_wrapper_cache import QueryCache, SingleFlight, canonical_key, make_query_key
+from sg_wrapper_events import EventLogTailer
+from sg_wrapper_projection import DefaultProjection, compile_projection, rebuild_links
+from sg_wrapper_pool import ConnectionPool, clone_connection, copy_connection_config, iter_pages_parallel, map_parallel
+from sg_wrapper_profile import AccessProfiler, get_call_site
+from sg_wrapper_retry import CircuitBreaker, CircuitOpenError, RetryPolicy
+from sg_wrapper_schema import EntityTypeRegistry, SchemaCache
 from sg_wrapper_util import string_to_uuid, get_calling_script
 
+try:
+    basestring
+except NameError:
+    # python 3
+    basestring = str
+
 # The Primary Text Keys are the field names to check when not defined.
 # For example, calling sg.Project("my_project") will be the same as sg.Project(code = "my_project")
 primaryTextKeys = ["code", "login", "name"]
@@ -70,60 +90,183 @@ else:
     ignoredTables = []
     remapTables = {}
 
+# Number of entities fetched per request when streaming find results (Shotgun's maximum page size)
+streamPageSize = 500
+
+# Maximum number of ids per 'in' filter when resolving links in bulk (cf Shotgun.prefetch)
+prefetchChunkSize = 500
+
+# Number of requests per batch call when committing the modified entities (cf Shotgun.commit_all)
+commitBatchSize = 100
+
+# Maximum number of requests per batch call (cf Shotgun.batch)
+batchChunkSize = 500
+
+# Folder of the on-disk schema cache used when no schemaCache is given to sg_wrapper.Shotgun
+schemaCacheEnv = 'SG_WRAPPER_SCHEMA_CACHE'
+
+# Path of the script auth cache file used when no authCache is given to sg_wrapper.Shotgun
+authCacheEnv = 'SG_WRAPPER_AUTH_CACHE'
+
 
 class ShotgunWrapperError(Exception):
     pass
 
+class BatchError(ShotgunWrapperError):
+    ''' Raised by Shotgun.batch when some of its chunks failed
+
+        :ivar results: results of the requests, in order, None for the requests of a failed chunk
+        :ivar errors: (index of the first request, number of requests, exception) of every failed chunk
+    '''
+    def __init__(self, results, errors):
+        ShotgunWrapperError.__init__(self, '%d batch chunk(s) failed, first error: %s'
+                                     % (len(errors), errors[0][2]))
+        self.results = results
+        self.errors = errors
+
 class retryWrapper(shotgun_api3.Shotgun):
     ''' Wraps a shotgun_api3 object and retries any connection attempt when a 503 error si catched
         Subclasses shotgun_api3.Shotgun forces us to use getattribute instead of getattr but
         it allow isinstance to make the wrapper transparent
+
+        When and how long to wait before retrying is decided by a RetryPolicy (sg_wrapper_retry),
+        built from the legacy arguments if none is given.
+
+        The retrying callable of a method is built on its first access and reused, with the
+        policy, exception type and printInfo of that time.
     '''
-    def __init__(self, sg, maxConnectionAttempts, retryInitialSleep, retrySleepMultiplier, printInfo, exceptionType):
+
+    # methods which do not send a request, called without the policy (nor its circuit breaker)
+    localMethods = frozenset(['set_session_uuid', 'add_user_agent', 'reset_user_agent', 'close'])
+    # attributes of the wrapper, the other ones are set on the wrapped object
+    ownAttributes = frozenset(['_sg', 'maxConnectionAttempts', 'retryInitialSleep', 'retrySleepMultiplier',
+                               'printInfo', 'exceptionType', 'retryPolicy', '_hooks'])
+
+    def __init__(self, sg, maxConnectionAttempts, retryInitialSleep, retrySleepMultiplier, printInfo, exceptionType,
+                 retryPolicy=None):
         self._sg = sg
         self.maxConnectionAttempts = maxConnectionAttempts
         self.retryInitialSleep = retryInitialSleep
         self.retrySleepMultiplier = retrySleepMultiplier
         self.printInfo = printInfo
         self.exceptionType = exceptionType
+        if retryPolicy is None:
+            retryPolicy = RetryPolicy(maxAttempts=maxConnectionAttempts, initialSleep=retryInitialSleep,
+                                      multiplier=retrySleepMultiplier)
+        self.retryPolicy = retryPolicy
+        self._hooks = {}
 
     def __getattribute__(self, attr):
+        # the retrying callables are built once per method name
+        hook = object.__getattribute__(self, '_hooks').get(attr)
+        if hook is not None:
+            return hook
+
         self_sg = object.__getattribute__(self, '_sg')
-        if not hasattr(self_sg, attr):
+        try:
+            attribute = getattr(self_sg, attr)
+        except AttributeError:
             return object.__getattribute__(self, attr)
 
-        attribute = self_sg.__getattribute__(attr)
-        if not callable(attribute):
+        if not callable(attribute) or attr in retryWrapper.localMethods:
             return attribute
 
-        def retryHook(*args, **kwargs):
-            errorCount = 0
-            sleepDuration = self.retryInitialSleep
-            while True:
-                try:
-                    res = attribute(*args, **kwargs)
-                    break
+        hook = object.__getattribute__(self, '_make_hook')(attr, attribute, self_sg)
+        object.__getattribute__(self, '_hooks')[attr] = hook
+        return hook
+
+    def __setattr__(self, attr, value):
+        if attr in retryWrapper.ownAttributes:
+            object.__setattr__(self, attr, value)
+            return
 
-                except self.exceptionType, err:
-                    errorCount += 1
-                    if errorCount == self.maxConnectionAttempts:
-                        raise
+        setattr(object.__getattribute__(self, '_sg'), attr, value)
+        object.__getattribute__(self, '_hooks').pop(attr, None)
 
-                    if self.printInfo:
-                        print '[shotgun] Connection error [%d/%d] - will retry in %ss: %s' \
-                              % (errorCount, self.maxConnectionAttempts, sleepDuration, str(err))
+    def _make_hook(self, attr, attribute, self_sg):
+        retryPolicy = self.retryPolicy
+        exceptionType = self.exceptionType
+        printInfo = self.printInfo
 
-                    time.sleep(sleepDuration)
-                    sleepDuration *= self.retrySleepMultiplier
+        def retryHook(*args, **kwargs):
+            res = retryPolicy.call(attr, attribute, args, kwargs, exceptionType, printInfo)
 
             # prevent Shotgun instance returning itself to unwrap
-            if res == self._sg:
+            if res is self_sg:
                 return self
             return res
 
         return retryHook
 
 
+class poolWrapper(shotgun_api3.Shotgun):
+    ''' Wraps a pool of shotgun_api3 objects: every method call checks out a connection
+        of the pool for its duration, so the wrapper can be used by several threads at once.
+        Attributes which are not methods (ie config) are read from the primary connection,
+        attributes set on the wrapper are set on every connection of the pool.
+        Like retryWrapper, subclasses shotgun_api3.Shotgun to stay transparent to isinstance
+    '''
+
+    # methods applied to every connection of the pool
+    broadcastMethods = frozenset(['set_session_uuid'])
+
+    def __init__(self, pool):
+        self._pool = pool
+        self._hooks = {}
+
+    def __getattribute__(self, attr):
+        # the hooks are built once per method name
+        hook = object.__getattribute__(self, '_hooks').get(attr)
+        if hook is not None:
+            return hook
+
+        pool = object.__getattribute__(self, '_pool')
+        try:
+            attribute = getattr(pool.primary, attr)
+        except AttributeError:
+            return object.__getattribute__(self, attr)
+
+        if not callable(attribute):
+            return attribute
+
+        hook = object.__getattribute__(self, '_make_hook')(attr, pool)
+        object.__getattribute__(self, '_hooks')[attr] = hook
+        return hook
+
+    def __setattr__(self, attr, value):
+        if attr in ('_pool', '_hooks'):
+            object.__setattr__(self, attr, value)
+            return
+
+        object.__getattribute__(self, '_pool').set_attribute(attr, value)
+        object.__getattribute__(self, '_hooks').pop(attr, None)
+
+    def _make_hook(self, attr, pool):
+        if attr in poolWrapper.broadcastMethods:
+            def broadcastHook(*args, **kwargs):
+                for connection in pool.connections():
+                    res = getattr(connection, attr)(*args, **kwargs)
+                return res
+            return broadcastHook
+
+        acquire = pool.acquire
+        release = pool.release
+
+        def poolHook(*args, **kwargs):
+            connection = acquire()
+            try:
+                res = getattr(connection, attr)(*args, **kwargs)
+            finally:
+                release(connection)
+
+            # prevent Shotgun instance returning itself to unwrap
+            if res is connection:
+                return self
+            return res
+
+        return poolHook
+
+
 # This is the base Shotgun class. Everything is created from here, and it deals with talking to the
 # standard Shotgun API.
 class Shotgun(object):
@@ -131,7 +274,69 @@ class Shotgun(object):
     def __init__(self, sgServer='', sgScriptName='', sgScriptKey='', sg=None,
                  disableApiAuthOverride=False, printInfo=True,
                  maxConnectionAttempts=8, retryInitialSleep=2, retrySleepMultiplier=2,
-                 **kwargs):
+                 schemaCache=None, lazy=False, queryCacheSize=1000, cacheTtl=None,
+                 connectionPoolSize=1, defaultFields=None, learnDefaultFields=False,
+                 siblingFetch=False, retryPolicy=None, authCache=None, connectionFactory=None, **kwargs):
+        ''' Shotgun handle
+
+        :param schemaCache:
+            on-disk cache of the schema, shared between processes.
+            If none is provided, a cache is created in the folder defined by the
+            SG_WRAPPER_SCHEMA_CACHE environment variable, if set.
+        :type schemaCache: :class:`~sg_wrapper_schema.SchemaCache`
+        :param lazy:
+            defer the schema read and the session / auth info update until
+            the first operation requiring them
+        :type lazy: bool
+        :param queryCacheSize: maximum number of find_entity results kept in cache, None for no limit
+        :type queryCacheSize: int
+        :param cacheTtl:
+            number of seconds cached entities and find_entity results are valid, None if they never expire.
+            A dict gives a ttl per entity type (ie Cut or CustomEntity23), the None key being used for the other types
+        :type cacheTtl: int or dict
+        :param connectionPoolSize:
+            maximum number of connections opened to the server, None for no limit.
+            Each thread using this handle checks out a connection of the pool for every request,
+            the extra connections being opened when several threads request at the same time.
+            Defaults to the given connection only, the threads then sending one request at a time.
+            If an extra connection cannot be opened, the opened ones are shared instead
+        :type connectionPoolSize: int
+        :param connectionFactory:
+            callable returning a new connection (shotgun_api3.Shotgun, not wrapped) for the
+            extra connections of the pool, which then get the config of the given connection.
+            Defaults to a clone of the given connection (cf sg_wrapper_pool.clone_connection),
+            give one if its class takes other constructor arguments (ie a tank connection)
+        :type connectionFactory: callable
+        :param defaultFields:
+            fields fetched per real entity type when a query does not give its fields,
+            instead of every field of the type (cf set_default_fields)
+        :type defaultFields: dict
+        :param learnDefaultFields:
+            use the fields read so far on the entities of a type as its default fields,
+            for the types without explicit default fields, once a few queries of the type
+            ran without a new field being read
+        :type learnDefaultFields: bool
+        :param siblingFetch:
+            when an entity of a find_entity or iter_entities result misses a field, fetch it
+            for every entity of the same result with one 'in' query, instead of one query
+            per entity
+        :type siblingFetch: bool
+        :param retryPolicy:
+            when and how long to wait before retrying a request failing with a connection error,
+            shared by every connection of the pool. Defaults to a policy with full jitter built
+            from maxConnectionAttempts, retryInitialSleep and retrySleepMultiplier.
+            To fail fast while the server is down, give it a circuit breaker, ie
+            RetryPolicy(budget=60, circuitBreaker=CircuitBreaker.for_server(sgServer))
+        :type retryPolicy: :class:`~sg_wrapper_retry.RetryPolicy`
+        :param authCache:
+            on-disk cache of the script names and api keys resolved by the auth override,
+            shared between processes. If none is provided, a cache is stored in the file
+            defined by the SG_WRAPPER_AUTH_CACHE environment variable, if set.
+        :type authCache: :class:`~sg_wrapper_auth.AuthCache`
+
+        .. note:: In lazy mode, the script name used by the auth override is guessed from the
+                  stack of the first query instead of the stack of the constructor
+        '''
 
         if sg:
             self._sg = sg
@@ -145,19 +350,144 @@ class Shotgun(object):
         # the standard shotgunPythonApi module, or tkCore.tank_vendor.shotgun_api3
         # so we try to get the error type in the imported module, and we only wrap the api if we could
         shotgun_api_module = self._sg.__module__
+        self._retry_args = None
+        # error of a request rejected by the server (cf _batch_updates)
+        self._fault_type = shotgun_api3.Fault
+        self._connection_factory = connectionFactory
         if shotgun_api_module in sys.modules:
             exceptionType = sys.modules[shotgun_api_module].ProtocolError
-            self._sg = retryWrapper(self._sg, maxConnectionAttempts, retryInitialSleep, retrySleepMultiplier,
-                                    printInfo, exceptionType)
+            self._fault_type = sys.modules[shotgun_api_module].Fault
+            if retryPolicy is None:
+                retryPolicy = RetryPolicy(maxAttempts=maxConnectionAttempts, initialSleep=retryInitialSleep,
+                                          multiplier=retrySleepMultiplier)
+            self._retry_args = (maxConnectionAttempts, retryInitialSleep, retrySleepMultiplier,
+                                printInfo, exceptionType, retryPolicy)
+            self._sg = retryWrapper(self._sg, *self._retry_args)
+
+        # shotgun_api3 objects are not thread safe: every request checks out a connection
+        # of the pool, the extra connections being cloned from the provided one
+        self._connection_pool = ConnectionPool(self._new_connection, maxSize=connectionPoolSize,
+                                               primary=self._sg)
+        self._sg = poolWrapper(self._connection_pool)
+
+        if schemaCache is None and os.getenv(schemaCacheEnv):
+            schemaCache = SchemaCache(os.getenv(schemaCacheEnv))
+        self._schema_cache = schemaCache
+
+        if authCache is None and os.getenv(authCacheEnv):
+            authCache = AuthCache(os.getenv(authCacheEnv))
+        self._auth_cache = authCache
+
+        self._init_lock = threading.RLock()
+        self._entity_type_registry = None
+        self._session_ready = False
+        self._session_initializing = False
+        self._auth_override = not disableApiAuthOverride
+        self._auth_script_name = sgScriptName
+        self._print_info = printInfo
 
-        self._entity_types = self.get_entity_list()
         self._entity_fields = {}
         self._entities = {}
-        self._entity_searches = []
+        self._cache_lock = threading.RLock()
+        self._query_cache = QueryCache(queryCacheSize)
+        self._single_flight = SingleFlight()
+        self._default_projection = DefaultProjection(defaultFields, learn=learnDefaultFields)
+        self._profiler = None
+        self._sibling_fetch = siblingFetch
+        self._write_buffer = None
+        # depth of the fetches sent by the handle itself in the current thread (cf _internal_fetch)
+        self._internal_fetches = threading.local()
+
+        self._cache_ttl = {}
+        self._pending_cache_ttl = {}
+        if isinstance(cacheTtl, dict):
+            for entityType, ttl in cacheTtl.items():
+                self.set_cache_ttl(ttl, entityType)
+        else:
+            self.set_cache_ttl(cacheTtl)
+
+        if not lazy:
+            self._ensure_schema()
+            self._ensure_session()
+
+    def _ensure_schema(self):
+        ''' Read the entity types from the schema, if not done yet
+
+        :return: the entity types
+        :rtype: :class:`~sg_wrapper_schema.EntityTypeRegistry`
+        '''
+        if self._entity_type_registry is None:
+            with self._init_lock:
+                if self._entity_type_registry is None:
+                    self._entity_type_registry = self.get_entity_list()
+
+                    # ttl set per entity type before the schema was read
+                    pendingCacheTtl, self._pending_cache_ttl = self._pending_cache_ttl, {}
+                    for entityType, ttl in pendingCacheTtl.items():
+                        self.set_cache_ttl(ttl, entityType)
+        return self._entity_type_registry
 
-        self.update_user_info()
-        if not disableApiAuthOverride:
-            self.update_auth_info(sgScriptName, printInfo=printInfo)
+    # the entity types are read from the schema on first access in lazy mode
+    _entity_types = property(_ensure_schema)
+
+    def _ensure_session(self):
+        ''' Update the session uuid and the auth info of the shotgun handle, if not done yet
+
+        .. note:: The queries issued by the auth info update call this method again from
+                  the same thread: they are run without waiting for the update to end
+
+        .. note:: If the update fails, its error is raised and the next operation tries again
+        '''
+        if self._session_ready:
+            return
+
+        with self._init_lock:
+            if self._session_ready or self._session_initializing:
+                return
+
+            self._session_initializing = True
+            try:
+                with self._internal_fetch():
+                    self.update_user_info()
+                    if self._auth_override:
+                        self.update_auth_info(self._auth_script_name, printInfo=self._print_info)
+                self._session_ready = True
+            finally:
+                self._session_initializing = False
+
+    @contextmanager
+    def _internal_fetch(self):
+        ''' Tag the queries sent in the block as fetches of the handle (ie prefetch, reload, sibling fetch,
+            link resolution) instead of queries of the user: they do not count as queries of the
+            default fields warmup, and are not recorded by the profiler
+        '''
+        internal = self._internal_fetches
+        depth = getattr(internal, 'depth', 0)
+        internal.depth = depth + 1
+        try:
+            yield
+        finally:
+            internal.depth = depth
+
+    def _is_internal_fetch(self):
+        return getattr(self._internal_fetches, 'depth', 0) > 0
+
+    def _new_connection(self):
+        ''' Open a new connection to the server, with the auth, session and retry policy of this handle '''
+        sg = self._connection_pool.primary
+        if type(sg) is retryWrapper:
+            sg = object.__getattribute__(sg, '_sg')
+
+        if self._connection_factory is not None:
+            connection = self._connection_factory()
+            copy_connection_config(sg, connection)
+        else:
+            connection = clone_connection(sg)
+
+        if self._retry_args:
+            connection = retryWrapper(connection, *self._retry_args)
+
+        return connection
 
     def pluralise(self, name):
         if name in customPlural:
@@ -169,9 +499,21 @@ class Shotgun(object):
 
         return name + "s"
 
+    def _schema_server(self):
+        ''' Server url used as key in the schema cache '''
+        return self._sg.base_url
+
     def get_entity_list(self):
-        entitySchema = self._sg.schema_entity_read()
-        entities = []
+        entitySchema = None
+        if self._schema_cache:
+            entitySchema = self._schema_cache.read_entities(self._schema_server())
+
+        if entitySchema is None:
+            entitySchema = self._sg.schema_entity_read()
+            if self._schema_cache:
+                self._schema_cache.write_entities(self._schema_server(), entitySchema)
+
+        entities = EntityTypeRegistry()
         for e in entitySchema:
             if e in ignoredTables:
                 continue
@@ -182,10 +524,8 @@ class Shotgun(object):
                 entityTypesToRegister.append(remapTables[e])
 
             for entityTypeToRegister in entityTypesToRegister:
-                newEntity = {'type': e, 'name': entityTypeToRegister, 'fields': []}
-                newEntity['type_plural'] = self.pluralise(newEntity['type'])
-                newEntity['name_plural'] = self.pluralise(newEntity['name'])
-                entities.append(newEntity)
+                entities.register(e, entityTypeToRegister,
+                                  self.pluralise(e), self.pluralise(entityTypeToRegister))
 
         return entities
 
@@ -194,44 +534,88 @@ class Shotgun(object):
         ''' Translate entity type to 'real' entity type (ie. CustomEntity02 -> Master)
         '''
 
-        r = [ t for t in self._entity_types if t['type'] == entityType ]
+        r = self._entity_types.get_type(entityType)
 
         if not r:
             raise ValueError('Could not find entity of type %s' % entityType)
         else:
-            return r[0]['name']
+            return r['name']
 
 
     def get_entity_field_list(self, entityType):
         fields = self.get_entity_fields(entityType)
-        return fields.keys()
+        return list(fields.keys())
+
+    def get_default_field_list(self, entityType):
+        ''' Return the fields fetched when a query on an entity type does not give its fields:
+            its default fields if any, every field of the type otherwise
+        '''
+        fields = self._default_projection.get(entityType)
+        if fields is None:
+            return self.get_entity_field_list(entityType)
+        return list(fields)
+
+    def set_default_fields(self, entityType, fields):
+        ''' Set the fields fetched when a query on an entity type does not give its fields
+
+        The fields which are not fetched are still loaded on demand when read, and
+        counted as misses (cf projection_misses).
+
+        :param entityType: entity type
+        :type entityType: str
+        :param fields: default fields, None to fetch every field
+        :type fields: list
+        '''
+        self._default_projection.set(self.get_real_type(entityType, defaults_to_paramater=True), fields)
+
+    def projection_misses(self):
+        ''' Return the number of reads of a field which had not been fetched, per entity type and field
+
+        Use it to tune the default fields (cf set_default_fields)
+
+        :rtype: dict
+        '''
+        return self._default_projection.misses()
 
     def get_entity_fields(self, entityType):
-        if entityType not in self._entity_fields:
-            self._entity_fields[entityType] = self._sg.schema_field_read(entityType)
-        return self._entity_fields[entityType]
+        fields = self._entity_fields.get(entityType)
+        if fields is None:
+            # threads reading the fields of the same type at the same time wait for one schema read
+            fields = self._single_flight.do(('schema_field_read', entityType), self._read_entity_fields, entityType)
+        return fields
+
+    def _read_entity_fields(self, entityType):
+        # read by a call which ended after the check of get_entity_fields
+        if entityType in self._entity_fields:
+            return self._entity_fields[entityType]
+
+        fields = None
+        if self._schema_cache:
+            fields = self._schema_cache.read_fields(self._schema_server(), entityType)
+
+        if fields is None:
+            fields = self._sg.schema_field_read(entityType)
+            if self._schema_cache:
+                self._schema_cache.write_fields(self._schema_server(), entityType, fields)
+
+        self._entity_fields[entityType] = fields
+        return fields
 
     def get_valid_values(self, entityType, field):
         return self.get_entity_fields(entityType)[field].get('properties', {}).get('display_values', {}).get('value')
 
     def is_entity(self, entityType):
-        for e in self._entity_types:
-            if entityType in [e['type'], e['name']]:
-                return True
-        return False
+        return self._entity_types.get_singular(entityType) is not None
 
     def is_entity_plural(self, entityType):
-        for e in self._entity_types:
-            if entityType in [e['type_plural'], e['name_plural']]:
-                return True
-        return False
+        return self._entity_types.get_plural(entityType) is not None
 
     def get_real_type(self, entityType, defaults_to_paramater=False):
         ''' Translate given type to the real shotgun type (ie Cut => CustomEntity23)
         '''
-        for e in self._entity_types:
-            if entityType in [e['type'], e['name'], e['type_plural'], e['name_plural']]:
-                return e['type']
+        e = self._entity_types.get(entityType)
+        if e:
+            return e['type']
 
         if defaults_to_paramater:
             return entityType
@@ -259,12 +643,107 @@ class Shotgun(object):
         return entity
 
 
+    def _resolve_entity_type(self, entityType):
+        ''' Return the real type of an entity type and its field names
+
+        :return: (real type, field names), (None, None) if the entity type is unknown
+        :rtype: (str, list)
+        '''
+        e = self._entity_types.get(entityType)
+        if not e:
+            return (None, None)
+
+        if not e['fields']:
+            e['fields'] = self.get_entity_field_list(e['type'])
+        return (e['type'], e['fields'])
+
+    def _build_filters(self, entityType, entityFields, key, kwargs):
+        ''' Build the find_entity filters dict from its key and keyword arguments '''
+        filters = {}
+
+        if key:
+            if isinstance(key, int):
+                filters['id'] = key
+            elif isinstance(key, basestring):
+                foundPrimaryKey = False
+                for fieldName in primaryTextKeys:
+                    if fieldName in entityFields:
+                        filters[fieldName] = key
+                        foundPrimaryKey = True
+                        break
+                if not foundPrimaryKey:
+                    raise ShotgunWrapperError("Entity type '%s' does not have one of the defined primary keys(%s)." % (entityType, ", ".join(primaryTextKeys)))
+
+        for arg in kwargs:
+            filters[arg] = self.get_entity_description(kwargs[arg])
+
+        return filters
+
+    def _build_sg_order(self, order):
+        ''' Translate a sg_wrapper order, ie ('desc', 'created_at'), to a shotgun order '''
+        sgOrder = []
+        if order:
+
+            i=0
+            orderLen = len(order)
+            while True:
+                try:
+                    direction = order[i]
+                    field = order[i+1]
+                except IndexError:
+                    raise RuntimeError('Order error: %s' % str(order))
+                else:
+                    sgOrder.append({'field_name': field, 'direction': direction})
+                    i+=2
+                    if i >= orderLen:
+                        break
+
+        return sgOrder
+
+    def _build_sg_filters(self, filters):
+        ''' Translate a sg_wrapper filters dict to shotgun filters '''
+        sgFilters = []
+        for f in filters:
+
+            filterValue = filters[f]
+            if isinstance(filterValue, tuple):
+                op = filterValue[0]
+                value = self.get_entity_description(filterValue[1])
+
+                if op not in baseOperator:
+                    _op = op
+                    op = operatorMap.get(_op, None)
+
+                    if not op:
+                        raise ValueError('Unknown operator: %s' % _op)
+            else:
+                op = 'is'
+                value = filterValue
+
+            sgFilters.append([f, op, value])
+
+        return sgFilters
+
     def find_entity(self, entityType, key = None, find_one = True, fields = None,
-            order=None, exclude_fields = None, optional_filters=None, **kwargs):
+            order=None, exclude_fields = None, optional_filters=None, stream=False, workers=1,
+            include=None, **kwargs):
         ''' Find Shotgun entity
 
+        :param fields: fields to fetch (optional, default to all). A dict is a nested projection
+                       fetching the fields of linked entities in the same request, ie
+                       {'code': None, 'entity': ['code', 'sg_sequence']} (cf sg_wrapper_projection.compile_projection)
+        :type fields: list or dict
         :param optional_filters: filters only applied when the result is not available from the cache
         :type optional_filters: dict
+        :param stream: if find_one is False, return an iterator streaming the entities page by page
+                       instead of a list (cf iter_entities)
+        :type stream: bool
+        :param workers: if find_one is False, number of pages fetched concurrently (cf sg_find)
+        :type workers: int
+        :param include: link fields to resolve for every entity found, with one request per linked
+                        entity type (cf prefetch). A dict maps the link fields to the fields
+                        to fetch on the linked entities
+        :type include: list or dict
 
         .. note::
             the optional_filters params allows to bypass some of sg_wrapper's current cache limitations
@@ -295,33 +774,29 @@ class Shotgun(object):
                 we just updated the entity with
         '''
 
-        filters = {}
+        if stream and not find_one:
+            if optional_filters:
+                kwargs.update(optional_filters)
+            return self.iter_entities(entityType, key, fields=fields, order=order,
+                                      exclude_fields=exclude_fields, workers=workers,
+                                      include=include, **kwargs)
 
-        thisEntityType = None
-        thisEntityFields = None
+        if include:
+            result = self.find_entity(entityType, key, find_one=find_one, fields=fields, order=order,
+                                      exclude_fields=exclude_fields, optional_filters=optional_filters,
+                                      workers=workers, **kwargs)
+            entities = [result] if find_one and result else result or []
+            for linkField, linkFields in self._normalize_include(include).items():
+                self.prefetch(entities, linkField, fields=linkFields)
+            return result
 
-        for e in self._entity_types:
-            if entityType in [e['type'], e['name'], e['type_plural'], e['name_plural']]:
-                thisEntityType = e['type']
-                if not e['fields']:
-                    e['fields'] = self.get_entity_field_list(thisEntityType)
-                thisEntityFields = e['fields']
+        thisEntityType, thisEntityFields = self._resolve_entity_type(entityType)
 
-        if key:
-            if isinstance(key, int):
-                filters['id'] = key
-            elif isinstance(key, basestring):
-                foundPrimaryKey = False
-                for fieldName in primaryTextKeys:
-                    if fieldName in thisEntityFields:
-                        filters[fieldName] = key
-                        foundPrimaryKey = True
-                        break
-                if not foundPrimaryKey:
-                    raise ShotgunWrapperError("Entity type '%s' does not have one of the defined primary keys(%s)." % (entityType, ", ".join(primaryTextKeys)))
+        projection = None
+        if isinstance(fields, dict):
+            fields, projection = compile_projection(self, thisEntityType, fields)
 
-        for arg in kwargs:
-            filters[arg] = self.get_entity_description(kwargs[arg])
+        filters = self._build_filters(entityType, thisEntityFields, key, kwargs)
 
         entities_from_cache = []
         if 'id' in filters and len(filters) == 1:  # only fetch from cache if no other filters were specified
@@ -340,11 +815,18 @@ class Shotgun(object):
 
                 if op == 'in':
                     missing_value_from_cache = []
+                    ttl = self.get_cache_ttl(thisEntityType)
                     for val in value:
                         if val in self._entities[thisEntityType]:
                             entity = self._entities[thisEntityType][val]
 
-                            if fields and not(set(fields) <= set(entity.fields())):
+                            if ttl is not None and entity._cached_at < time.time() - ttl:
+                                # expired: it will be added again after the new query
+                                self.unregister_entity(entity)
+                                missing_value_from_cache.append(val)
+
+                            # the linked entities fields (ie entity.Shot.code) are not stored in the entity
+                            elif fields and not(set(f for f in fields if '.' not in f) <= set(entity.fields())):
                                     # remove entity from cache
                                     # it will be added again after the new query
                                     self.unregister_entity(entity)
@@ -365,90 +847,278 @@ class Shotgun(object):
                     filters['id'] = (op, missing_value_from_cache)
 
         if optional_filters:
-            for fname, fval in optional_filters.iteritems():
+            for fname, fval in optional_filters.items():
                 filters[fname] = self.get_entity_description(fval)
 
         if not fields:
-            fields = self.get_entity_field_list(thisEntityType)
+            fields = self.get_default_field_list(thisEntityType)
+            if not self._is_internal_fetch():
+                self._default_projection.record_query(thisEntityType)
 
         if exclude_fields:
             for f in exclude_fields:
                 if f in fields:
                     fields.remove(f)
 
-        for search in self._entity_searches:
-            if search['find_one'] == find_one \
-              and search['entity_type'] == thisEntityType \
-              and search['filters'] == filters \
-              and search['order'] == order \
-              and set(fields).issubset(set(search['fields'])):
-                return search['result']
-
-        sgOrder = []
-        if order:
+        queryKey = make_query_key(thisEntityType, filters, order, find_one)
+        found, cachedResult = self._query_cache.get(queryKey, fields,
+                                                    ttl=self.get_cache_ttl(thisEntityType))
+        if found:
+            return cachedResult
 
-            i=0
-            orderLen = len(order)
-            while True:
-                try:
-                    direction = order[i]
-                    field = order[i+1]
-                except IndexError:
-                    raise RuntimeError('Order error: %s' % str(order))
-                else:
-                    sgOrder.append({'field_name': field, 'direction': direction})
-                    i+=2
-                    if i >= orderLen:
-                        break
+        sgOrder = self._build_sg_order(order)
+        sgFilters = self._build_sg_filters(filters)
 
-        sgFilters = []
-        for f in filters:
+        # concurrent identical queries wait for this one and share its result
+        return self._single_flight.do(('find_entity', queryKey, frozenset(fields)),
+                                      self._fetch_entities, queryKey, thisEntityType, filters,
+                                      sgFilters, fields, order, sgOrder, find_one, workers,
+                                      entities_from_cache, projection)
 
-            filterValue = filters[f]
-            if isinstance(filterValue, tuple):
-                op = filterValue[0]
-                value = self.get_entity_description(filterValue[1])
+    def _fetch_entities(self, queryKey, thisEntityType, filters, sgFilters, fields, order, sgOrder,
+                        find_one, workers, entities_from_cache, projection):
+        ''' Run a find_entity query on the server, and cache its result '''
 
-                if op not in baseOperator:
-                    _op = op
-                    op = operatorMap.get(_op, None)
+        result = None
 
-                    if not op:
-                        raise ValueError('Unknown operator: %s' % _op)
+        # profiled as a find_entity query, not as a sg_find one
+        with self._internal_fetch():
+            if find_one:
+                sg_result = self.sg_find_one(thisEntityType, sgFilters, fields, sgOrder)
+                sg_results = [sg_result] if sg_result else []
             else:
-                op = 'is'
-                value = filterValue
-
-            sgFilters.append([f, op, value])
+                sg_results = self.sg_find(thisEntityType, sgFilters, fields, sgOrder, workers=workers)
 
-        result = None
+        if self._profiler and not self._is_internal_fetch():
+            self._profiler.record_query(thisEntityType, fields, len(sg_results))
 
         if find_one:
-            sg_result = self.sg_find_one(thisEntityType, sgFilters, fields, sgOrder)
-
-            if sg_result:
-                result = Entity(self, thisEntityType, sg_result)
+            if sg_results:
+                result = self._make_entity(thisEntityType, sg_results[0], projection)
         else:
-            sg_results = self.sg_find(thisEntityType, sgFilters, fields, sgOrder)
-
             result = []
             for sg_result in sg_results:
-                result.append(Entity(self, thisEntityType, sg_result))
+                result.append(self._make_entity(thisEntityType, sg_result, projection))
 
             result.extend(entities_from_cache)
+            self._group_siblings(result)
 
-        thisSearch = {}
-        thisSearch['find_one'] = find_one
-        thisSearch['entity_type'] = thisEntityType
-        thisSearch['filters'] = filters
-        #thisSearch['sgOrder'] = sgOrder
-        thisSearch['order'] = order
-        thisSearch['fields'] = fields
-        thisSearch['result'] = result
-        self._entity_searches.append(thisSearch)
+        if find_one:
+            resultIds = [result._entity_id] if result else []
+        else:
+            resultIds = [e._entity_id for e in result]
+
+        filterFields = list(filters)
+        if order:
+            filterFields.extend(order[1::2])
+
+        self._query_cache.put(queryKey, fields, result, ids=resultIds, filterFields=filterFields)
 
         return result
 
+    def _make_entity(self, entityType, sgResult, projection=None, register=True):
+        ''' Build an Entity from a find result
+
+        :param projection: links tree of the nested projection the result was fetched with, if any
+        :type projection: dict
+        '''
+        if projection:
+            rebuild_links(self, sgResult, projection)
+        if self._write_buffer is not None:
+            pending = self._pending_fields(entityType, sgResult['id'])
+            if pending:
+                sgResult.update(pending)
+        return Entity(self, entityType, sgResult, register=register)
+
+    def iter_entities(self, entityType, key=None, fields=None, order=None, exclude_fields=None,
+                      page_size=streamPageSize, use_cache=False, workers=1, include=None, **kwargs):
+        ''' Stream the entities matching a query, page by page
+
+        Takes the same key and filters as find_entity, but instead of building the whole
+        result list, fetches page_size entities at a time and yields them, so only one page
+        is held in memory.
+
+            >>> for version in sg.iter_entities('Version', project=p, fields=['code']):
+            ...     print version.code
+
+        :param page_size: number of entities fetched per request
+        :type page_size: int
+        :param use_cache: register the streamed entities in the entity cache.
+                          The result is never stored in the find_entity results cache
+        :type use_cache: bool
+        :param workers: number of pages fetched concurrently, each on its own connection of the pool
+        :type workers: int
+        :param include: link fields resolved page by page (cf find_entity)
+        :type include: list or dict
+
+        :return: iterator over the matching entities
+        :rtype: iterator of :class:`~sg_wrapper.Entity`
+
+        .. note:: As the pages are fetched while iterating, an entity created or deleted
+                  meanwhile may shift the pages. Order on a stable field (the default order is by id)
+        '''
+
+        thisEntityType, thisEntityFields = self._resolve_entity_type(entityType)
+
+        projection = None
+        if isinstance(fields, dict):
+            fields, projection = compile_projection(self, thisEntityType, fields)
+
+        filters = self._build_filters(entityType, thisEntityFields, key, kwargs)
+
+        if not fields:
+            fields = self.get_default_field_list(thisEntityType)
+            if not self._is_internal_fetch():
+                self._default_projection.record_query(thisEntityType)
+
+        if exclude_fields:
+            fields = [f for f in fields if f not in exclude_fields]
+
+        sgOrder = self._build_sg_order(order)
+        sgFilters = self._build_sg_filters(filters)
+
+        pages = self._iter_pages(thisEntityType, sgFilters, fields, sgOrder, page_size, workers)
+        return self._iter_page_entities(thisEntityType, pages, use_cache, include, projection)
+
+    def _iter_pages(self, entityType, sgFilters, fields, sgOrder, pageSize, workers):
+        ''' Yield the rows of a query, page by page '''
+        if workers > 1:
+            self._ensure_session()
+            for sgResults in iter_pages_parallel(
+                    lambda connection, page: connection.find(entityType, sgFilters, fields=fields, order=sgOrder,
+                                                             limit=pageSize, page=page),
+                    pageSize, workers, self._connection_pool):
+                if self._profiler and not self._is_internal_fetch():
+                    self._profiler.record_query(entityType, fields, len(sgResults))
+                yield sgResults
+            return
+
+        page = 1
+        while True:
+            # profiled as a page of iter_entities, not as a sg_find query
+            with self._internal_fetch():
+                sgResults = self.sg_find(entityType, sgFilters, fields, sgOrder, limit=pageSize, page=page)
+            if self._profiler and not self._is_internal_fetch():
+                self._profiler.record_query(entityType, fields, len(sgResults))
+            yield sgResults
+
+            if len(sgResults) < pageSize:
+                break
+            page += 1
+
+    def _iter_page_entities(self, entityType, pages, register, include, projection):
+        # entities are built by this thread only, so the caches are never updated concurrently
+        includeFields = self._normalize_include(include)
+        for sgResults in pages:
+            entities = [self._make_entity(entityType, sgResult, projection, register=register)
+                        for sgResult in sgResults]
+            self._group_siblings(entities)
+
+            for linkField, linkFields in includeFields.items():
+                self.prefetch(entities, linkField, fields=linkFields)
+
+            for entity in entities:
+                yield entity
+
+    def _normalize_include(self, include):
+        ''' Return a find_entity include argument as a dict: link field -> linked entity fields '''
+        if not include:
+            return {}
+        if isinstance(include, basestring):
+            return {include: None}
+        if isinstance(include, dict):
+            return include
+        return dict.fromkeys(include)
+
+    def prefetch(self, entities, fieldName, fields=None, chunkSize=prefetchChunkSize):
+        ''' Resolve a link field of many entities at once
+
+        Collects the links of the field not resolved yet across all the entities, then fetches
+        the linked entities with one 'in' query per linked entity type (per chunk of chunkSize ids)
+        instead of one query per entity.
+
+            >>> versions = sg.Versions(project=p)
+            >>> sg.prefetch(versions, 'entity', fields=['code'])
+            >>> [v.entity.code for v in versions]  # no more request
+
+        :param entities: entities whose links are resolved
+        :type entities: list of :class:`~sg_wrapper.Entity`
+        :param fieldName: link field (entity or multi_entity) to resolve
+        :type fieldName: str
+        :param fields: fields to fetch on the linked entities (optional, default to all)
+        :type fields: list
+        :param chunkSize: maximum number of ids per request
+        :type chunkSize: int
+
+        :return: the linked entities found
+        :rtype: list of :class:`~sg_wrapper.Entity`
+
+        .. note:: The entities which did not fetch the field are skipped
+        '''
+
+        # linked entity type -> linked entity id -> links pointing to it
+        toFetch = {}
+        for entity in entities:
+            value = entity._fields.get(fieldName)
+            links = value if isinstance(value, list) else [value]
+            for link in links:
+                if isinstance(link, dict) and 'id' in link and 'type' in link and 'entity' not in link:
+                    toFetch.setdefault(link['type'], {}).setdefault(link['id'], []).append(link)
+
+        linkedEntities = []
+        for linkType, linksById in toFetch.items():
+            ids = list(linksById.keys())
+            for i in range(0, len(ids), chunkSize):
+                chunk = ids[i:i + chunkSize]
+                with self._internal_fetch():
+                    found = self.find_entity(linkType, id=('in', chunk), fields=fields, find_one=False)
+                foundById = dict((e.entity_id(), e) for e in found)
+                linkedEntities.extend(found)
+
+                for linkId in chunk:
+                    for link in linksById[linkId]:
+                        link['entity'] = foundById.get(linkId)
+
+        return linkedEntities
+
+    def _group_siblings(self, entities):
+        ''' Mark entities as fetched by the same query, for the sibling fetch '''
+        if not self._sibling_fetch or len(entities) < 2:
+            return
+
+        # weak references, so the entities of a result are freed with it
+        siblings = weakref.WeakValueDictionary((e._entity_id, e) for e in entities)
+        for entity in entities:
+            entity._siblings = siblings
+
+    def _fetch_sibling_field(self, entity, fieldName, chunkSize=prefetchChunkSize):
+        ''' Fetch a missing field for every entity of the query an entity was fetched by
+
+        The values are merged in the entities which do not already have the field.
+
+        :return: False if the entity has no siblings or the field is not in the schema
+        :rtype: bool
+        '''
+        siblings = entity._siblings
+        if siblings is None or fieldName not in self.get_entity_fields(entity._entity_type):
+            return False
+
+        missing = [e for e in siblings.values() if fieldName not in e._fields]
+
+        fetched = {}
+        ids = [e._entity_id for e in missing]
+        with self._internal_fetch():
+            for i in range(0, len(ids), chunkSize):
+                for row in self.sg_find(entity._entity_type, [['id', 'in', ids[i:i + chunkSize]]], [fieldName]):
+                    fetched[row['id']] = row
+
+        for e in missing:
+            row = fetched.get(e._entity_id)
+            if row is not None and fieldName in row and fieldName not in e._fields:
+                e._fields[fieldName] = row[fieldName]
+
+        return True
+
     def sg_find_one(self, entityType, filters, fields=None, order=None,
                     filter_operator=None, retired_only=False,
                     include_archived_projects=True,
@@ -490,14 +1160,25 @@ class Shotgun(object):
         :returns: Dictionary representing a single matching entity with the requested fields,
             and the defaults ``"id"`` and ``"type"`` which are always included.
         :rtype: dict
+
+        .. note:: Concurrent identical calls wait for the first one and get a copy of its result
         '''
-        return self._sg.find_one(entityType, filters, fields=fields, order=order,
-                                 filter_operator=filter_operator, retired_only=retired_only,
-                                 include_archived_projects=include_archived_projects)
+        self._ensure_session()
+
+        key = ('sg_find_one', entityType, canonical_key(filters), canonical_key(fields),
+               canonical_key(order), filter_operator, retired_only, include_archived_projects)
+        result = self._single_flight.do(key, self._sg.find_one, entityType, filters, fields=fields, order=order,
+                                        filter_operator=filter_operator, retired_only=retired_only,
+                                        include_archived_projects=include_archived_projects,
+                                        copyResult=copy.deepcopy)
+
+        if self._profiler and not self._is_internal_fetch():
+            self._profiler.record_query(entityType, fields, 1 if result else 0)
+        return result
 
     def sg_find(self, entityType, filters, fields=None, order=None,
                 filter_operator=None, limit=0, retired_only=False, page=0,
-                include_archived_projects=True, additional_filter_presets=None):
+                include_archived_projects=True, additional_filter_presets=None, workers=1):
         '''Find entities matching the given filters.
 
             >>> # Find Character Assets in Sequence 100_FOO
@@ -573,14 +1254,34 @@ class Shotgun(object):
 
             For details on supported presets and the format of this parameter see
             :ref:`additional_filter_presets`
+        :param int workers: Optional number of pages fetched concurrently when all the entities
+            are requested (``limit`` is ``0``). Each worker uses its own connection, so the
+            concurrency is bounded by the connection pool size. Defaults to ``1``.
         :returns: list of dictionaries representing each entity with the requested fields, and the
             defaults ``"id"`` and ``"type"`` which are always included.
         :rtype: list
         '''
-        return self._sg.find(entityType, filters, fields=fields, order=order,
-                             filter_operator=filter_operator, limit=limit,
-                             retired_only=retired_only, page=page,
-                             include_archived_projects=include_archived_projects)
+        self._ensure_session()
+
+        if workers > 1 and not limit:
+            def fetchPage(connection, page):
+                return connection.find(entityType, filters, fields=fields, order=order,
+                                       filter_operator=filter_operator, limit=streamPageSize,
+                                       retired_only=retired_only, page=page,
+                                       include_archived_projects=include_archived_projects)
+
+            results = []
+            for rows in iter_pages_parallel(fetchPage, streamPageSize, workers, self._connection_pool):
+                results.extend(rows)
+        else:
+            results = self._sg.find(entityType, filters, fields=fields, order=order,
+                                    filter_operator=filter_operator, limit=limit,
+                                    retired_only=retired_only, page=page,
+                                    include_archived_projects=include_archived_projects)
+
+        if self._profiler and not self._is_internal_fetch():
+            self._profiler.record_query(entityType, fields, len(results))
+        return results
 
     def update(self, entity, updateFields):
         ''' Update entity fields
@@ -599,6 +1300,28 @@ class Shotgun(object):
                   in the entity yet to be commited
         '''
 
+        self._ensure_session()
+
+        if self._write_buffer is not None:
+            if type(updateFields) is dict:
+                data = dict(updateFields)
+            elif type(updateFields) is list:
+                data = dict((f, entity._fields[f] if f in entity._fields else entity.field(f))
+                            for f in updateFields)
+            else:
+                raise ValueError('Field type not supported: %s' % type(updateFields))
+
+            # the queued fields stay modified until a flush sends them, so the updates a flush
+            # fails to send are still listed by modified_fields and sent again by commit_all
+            for fieldName in data:
+                if fieldName not in entity._fields_changed:
+                    entity._fields_changed[fieldName] = entity._fields.get(fieldName)
+
+            # apply the values now, so the entity reads them until the buffer is flushed
+            entity._fields.update(data)
+            self._write_buffer.add(entity, data)
+            return entity
+
         if type(updateFields) is dict:
             entityFields = self.get_entity_fields(entity.entity_type())
             updateData = self._translate_data(entityFields, updateFields)
@@ -636,6 +1359,9 @@ class Shotgun(object):
         .. note:: If no script name is provided, it is guessed by analysing the stack trace (cf get_calling_script)
 
         .. note:: Use the returned script name in any case instead of the provided one: the shotgun's search is case insensitive while the auth is not
+
+        .. note:: With an auth cache, a script resolved by any process of the host in the cache
+                  ttl costs no request
         '''
 
         if not scriptName:
@@ -643,6 +1369,30 @@ class Shotgun(object):
             if not scriptName:
                 return (None, None)
 
+        authCache = self._auth_cache
+        if authCache is None:
+            return self._resolve_auth_info(scriptName)
+
+        server = self._schema_server()
+        cached = authCache.get(server, scriptName)
+        if cached:
+            return cached
+
+        # resolve under the lock, so concurrent processes do not create the same ApiUser
+        with authCache.lock():
+            cached = authCache.get(server, scriptName)
+            if cached:
+                return cached
+
+            name, key = self._resolve_auth_info(scriptName)
+            if name is not None and key is not None:
+                authCache.put(server, scriptName, name, key)
+
+        return (name, key)
+
+    def _resolve_auth_info(self, scriptName):
+        ''' Find, revive or create the ApiUser of a script, and return its name and api key '''
+
         scriptEntity = self.sg_find_one('ApiUser', [['firstname', 'is', scriptName]], ['firstname', 'sg_public_password'])  # also retrieve firstname because the search is case insensitive but the auth is not
 
         # if no api was found, search it in the retired api. If it is still not found, generate a key in shotgun
@@ -674,12 +1424,12 @@ class Shotgun(object):
                 except:
                     scriptEntity = self.create('ApiUser', firstname=scriptName, lastname='1.0',
                                                description='autogenerated key', permission_rule_set=adminPermission)
-                    scriptEntity.reload()
+                    scriptEntity.reload(mode='all')
                     self._sg.update('ApiUser', scriptEntity['id'],
                                     {'sg_public_password': scriptEntity['salted_password']})
                 # TODO handle Fault exception
 
-                scriptEntity.reload()  # needed to retrieve the api key
+                scriptEntity.reload(mode='all')  # needed to retrieve the api key
 
         scriptName = scriptEntity['firstname']  # retrieve the script name because the 'is' query is case insensitive, but the auth is not
         apiKey = scriptEntity['sg_public_password']
@@ -714,8 +1464,9 @@ class Shotgun(object):
         name, key = self.get_new_shotgun_auth_info(scriptName)
 
         if name is not None and key is not None:
-            self._sg.config.script_name = name
-            self._sg.config.api_key = key
+            for connection in self._connection_pool.connections():
+                connection.config.script_name = name
+                connection.config.api_key = key
             if printInfo:
                 print("Shotgun's script API name is now: %s" % name)
             return True
@@ -733,29 +1484,194 @@ class Shotgun(object):
             :rtype: None
         '''
         # update tank handle to bind this shotgun scriptname, apikey & user uuid
+        self._ensure_session()
         tk.shotgun.config.script_name = self._sg.config.script_name
         tk.shotgun.config.api_key = self._sg.config.api_key
         tk.shotgun.set_session_uuid(self._sg.config.session_uuid)
 
     def register_entity(self, entity):
-        if entity._entity_type not in self._entities:
-            self._entities[entity._entity_type] = {}
+        with self._cache_lock:
+            if entity._entity_type not in self._entities:
+                self._entities[entity._entity_type] = {}
 
-        if entity._entity_id not in self._entities[entity._entity_type]:
-            self._entities[entity._entity_type][entity._entity_id] = entity
+            if entity._entity_id not in self._entities[entity._entity_type]:
+                entity._cached_at = time.time()
+                self._entities[entity._entity_type][entity._entity_id] = entity
 
     def unregister_entity(self, entity):
 
-        if entity._entity_type in self._entities:
-            if entity._entity_id in self._entities[entity._entity_type]:
-                del(self._entities[entity._entity_type][entity._entity_id])
+        with self._cache_lock:
+            if entity._entity_type in self._entities:
+                if entity._entity_id in self._entities[entity._entity_type]:
+                    del(self._entities[entity._entity_type][entity._entity_id])
 
     def clear_cache(self):
-        self._entities = {}
-        self._entity_searches = []
+        with self._cache_lock:
+            self._entities = {}
+        self._query_cache.clear()
+
+    def set_cache_ttl(self, ttl, entityType=None):
+        ''' Set the number of seconds cached entities and find_entity results are valid
+
+        :param ttl: number of seconds, None if they never expire
+        :type ttl: int
+        :param entityType: entity type the ttl applies to (ie Cut or CustomEntity23), None for the default ttl
+        :type entityType: str
+
+        .. note:: In lazy mode, the ttl of an entity type set before the schema is read applies once it is read
+        '''
+        if entityType is None:
+            self._cache_ttl[None] = ttl
+        elif self._entity_type_registry is None:
+            # resolved once the schema is read (cf _ensure_schema)
+            self._pending_cache_ttl[entityType] = ttl
+        else:
+            self._cache_ttl[self.get_real_type(entityType, defaults_to_paramater=True)] = ttl
+
+    def get_cache_ttl(self, entityType):
+        ''' Return the number of seconds cached entities of a type are valid, None if they never expire '''
+        return self._cache_ttl.get(entityType, self._cache_ttl.get(None))
+
+    def invalidate_from_events(self, events):
+        ''' Evict the cached entities and find_entity results altered by Shotgun events
+
+        :param events: EventLogEntry records, with at least their event_type, entity,
+                       attribute_name and meta fields
+        :type events: list of dict or :class:`~sg_wrapper.Entity`
+
+        :return: number of evicted entities and find_entity results
+        :rtype: dict
+
+        .. note:: Only the results depending on the changed entity and attribute are evicted,
+                  except for creations, retirements and revivals which evict every result
+                  of the entity type.
+
+        .. note:: Entities with uncommitted changes are kept in cache
+        '''
+
+        evicted = {'entities': 0, 'queries': 0}
+
+        for event in events:
+            if isinstance(event, Entity):
+                event = event._fields
+
+            entity = event.get('entity') or {}
+            meta = event.get('meta') or {}
+            entityType = entity.get('type') or meta.get('entity_type')
+            entityId = entity.get('id') or meta.get('entity_id')
+
+            entityType = self.get_real_type(entityType) if entityType else None
+            if not entityType:
+                continue
+
+            action = (event.get('event_type') or '').rsplit('_', 1)[-1]
+
+            cachedEntity = self._entities.get(entityType, {}).get(entityId)
+            if cachedEntity is not None and not cachedEntity.modified_fields():
+                self.unregister_entity(cachedEntity)
+                evicted['entities'] += 1
+
+            if action == 'Change' and entityId:
+                evicted['queries'] += self._query_cache.invalidate(entityType, entityId,
+                                                                   event.get('attribute_name'))
+            else:
+                evicted['queries'] += self._query_cache.invalidate(entityType)
+
+        return evicted
+
+    def tail_events(self, checkpointPath=None, callbacks=None, **kwargs):
+        ''' Return an EventLogTailer following the events of the server and keeping the cache
+        of this handle fresh (cf sg_wrapper_events.EventLogTailer)
+
+            >>> tailer = sg.tail_events('/var/lib/myDaemon/events.json', callbacks=[sync])
+            >>> tailer.run()
+
+        :param checkpointPath: JSON file storing the position of the tailer
+        :type checkpointPath: str
+        :param callbacks: callables called with every batch of events
+        :type callbacks: list
+        :param kwargs: other arguments of EventLogTailer (startId, batchSize, minInterval...)
+
+        :rtype: :class:`~sg_wrapper_events.EventLogTailer`
+        '''
+        tailer = EventLogTailer(self, checkpointPath=checkpointPath, **kwargs)
+        for callback in callbacks or []:
+            tailer.add_callback(callback)
+        return tailer
+
+    def retry_stats(self):
+        ''' Return the statistics of the retry policy (cf sg_wrapper_retry.RetryPolicy.stats), or
+        None if the requests are not retried
+
+        :rtype: dict
+        '''
+        if not self._retry_args:
+            return None
+        return self._retry_args[-1].stats()
+
+    def connection_pool_stats(self):
+        ''' Return the metrics of the connection pool (cf sg_wrapper_pool.ConnectionPool.stats)
+
+        :return: size, checkouts, wait times and utilization of the pool
+        :rtype: dict
+        '''
+        return self._connection_pool.stats()
+
+    def single_flight_stats(self):
+        ''' Return the number of find_entity and sg_find_one requests saved by waiting for an
+        identical concurrent request, and the number of requests in flight
+
+        :rtype: dict
+        '''
+        return self._single_flight.stats()
+
+    def enable_profiling(self, enabled=True, linkThreshold=10):
+        ''' Record how the queried entities are used, per call site (cf sg_wrapper_profile.AccessProfiler)
+
+        Only the entities built while profiling are tracked. Profiling slows every query and
+        field read down, do not leave it enabled in production.
+
+            >>> sg.enable_profiling()
+            >>> run_the_tool()
+            >>> print sg.profile_report()
+            /path/tool.py:12 (main): 1 queries on Version fetched 160 fields but read 4; 2300 follow-up link queries on 'entity'
+
+        :param enabled: start (and reset) or stop profiling
+        :type enabled: bool
+        :param linkThreshold: number of follow-up link queries from which a link field is
+                              recommended for prefetching
+        :type linkThreshold: int
+        '''
+        self._profiler = AccessProfiler(linkThreshold) if enabled else None
+
+    def profile_report(self, text=True):
+        ''' Return the access profile recorded since enable_profiling
+
+        :param text: return a text report, or the list of records of AccessProfiler.report
+        :type text: bool
+
+        :rtype: str or list
+        '''
+        if self._profiler is None:
+            return '' if text else []
+        if text:
+            return self._profiler.format_report()
+        return self._profiler.report()
+
+    def query_cache_stats(self):
+        ''' Return the counters of the find_entity results cache
+
+        :return: size, maxSize, hits, misses and evictions of the cache
+        :rtype: dict
+        '''
+        return self._query_cache.stats()
 
     def __getattr__(self, attrName):
 
+        # private attributes are never entity types (ie attributes missing after unpickle)
+        if attrName.startswith('_'):
+            raise AttributeError('Could not get attribute %s' % attrName)
+
         def find_entity_wrapper(*args, **kwargs):
             return self.find_entity(attrName, find_one = True, *args, **kwargs)
 
@@ -770,25 +1686,243 @@ class Shotgun(object):
         # pickle fix (protocol 2)
         raise AttributeError('Could not get attribute %s' % attrName)
 
-    def commit_all(self):
-        for entityType in self._entities:
-            for entityId in self._entities[entityType]:
-                for entity in self._entities[entityType][entityId]:
-                    if entity.modified_fields():
-                        entity.commit()
+    def commit_all(self, batchSize=commitBatchSize):
+        ''' Commit the modified fields of every cached entity, with batched update requests
+
+        The updates are sent batchSize at a time in a single batch call. As a batch is run in
+        one transaction, the entities of a failing batch are then committed one by one, so
+        only the failing entities are left modified.
+
+        The updates queued by the write-behind buffer are flushed first: the ones it fails to
+        send are returned, and stay queued.
+
+        If the server can not be reached, the remaining updates are not sent and returned as
+        failures with the connection error.
+
+        :param batchSize: number of updates per batch call
+        :type batchSize: int
+
+        :return: the entities which could not be committed, as (entity, exception) tuples
+        :rtype: list
+        '''
+
+        # the updates it fails to send stay queued, they are not sent again below
+        failures = self.flush()
+
+        with self._cache_lock:
+            dirtyEntities = [entity
+                             for entities in self._entities.values()
+                             for entity in entities.values()
+                             if entity._fields_changed]
+
+        updates = []
+        for entity in dirtyEntities:
+            queued = self._pending_fields(entity._entity_type, entity._entity_id) or {}
+            data = dict((f, entity._fields[f]) for f in entity._fields_changed if f not in queued)
+            if data:
+                updates.append((entity, data))
+        return failures + self._batch_updates(updates, batchSize, clearChanges=True)
+
+    def _batch_updates(self, updates, batchSize, clearChanges=False):
+        ''' Send entity updates with batch calls of batchSize requests
+
+        As a batch is run in one transaction, the updates of a batch rejected by the server
+        (Fault) are then sent one by one, so only the rejected updates are lost. Any other
+        error (connection, circuit open...) stops the sending: the updates not sent yet are
+        returned as failures with that error.
+
+        :param updates: (entity, data) of every update
+        :type updates: list
+        :param clearChanges: clear the sent fields from the modified fields of the updated entities
+        :type clearChanges: bool
+
+        :return: the updates which failed, as (entity, exception) tuples
+        :rtype: list
+        '''
+
+        if not updates:
+            return []
+
+        self._ensure_session()
+
+        failures = []
+        for i in range(0, len(updates), batchSize):
+            chunk = updates[i:i + batchSize]
+
+            sgRequests = []
+            for entity, data in chunk:
+                entityFields = self.get_entity_fields(entity._entity_type)
+                sgRequests.append({'request_type': 'update',
+                                   'entity_type': entity._entity_type,
+                                   'entity_id': entity._entity_id,
+                                   'data': self._translate_data(entityFields, data)})
+
+            try:
+                sgResults = self._sg.batch(sgRequests)
+            except self._fault_type:
+                # rolled back: find the rejected updates below
+                pass
+            except Exception as e:
+                failures.extend((entity, e) for entity, data in updates[i:])
+                return failures
+            else:
+                for (entity, data), sgResult in zip(chunk, sgResults):
+                    self._apply_update(entity, data, sgResult, clearChanges)
+                continue
+
+            for j, ((entity, data), sgRequest) in enumerate(zip(chunk, sgRequests)):
+                try:
+                    sgResult = self._sg.update(sgRequest['entity_type'], sgRequest['entity_id'], sgRequest['data'])
+                except self._fault_type as e:
+                    failures.append((entity, e))
+                except Exception as e:
+                    failures.extend((entity, e) for entity, data in updates[i + j:])
+                    return failures
+                else:
+                    self._apply_update(entity, data, sgResult, clearChanges)
+
+        return failures
+
+    def _apply_update(self, entity, data, updatedData, clearChanges):
+        ''' Apply the result of an update request to an entity
+
+        :param data: values sent by the request
+        :type data: dict
+        :param clearChanges: clear the sent fields from the modified fields of the entity,
+                             except those modified again since the request was sent
+        :type clearChanges: bool
+        '''
+        if clearChanges:
+            for fieldName, value in data.items():
+                if fieldName in entity._fields_changed and entity._fields.get(fieldName) is value:
+                    del entity._fields_changed[fieldName]
+
+        pending = self._pending_fields(entity._entity_type, entity._entity_id)
+        # the values modified since the update was sent are kept
+        entity._fields.update((f, v) for f, v in updatedData.items() if f not in entity._fields_changed)
+        if pending:
+            # values queued since the update was sent, unless modified again
+            entity._fields.update((f, v) for f, v in pending.items() if f not in entity._fields_changed)
+
+    ##
+    # write-behind
+
+    def enable_write_behind(self, maxSize=100, interval=None, batchSize=commitBatchSize):
+        ''' Queue the updates (Shotgun.update, Entity.commit) instead of sending them at once
+
+        The updates of an entity are merged, the last value written to a field wins, and its
+        fields hold the queued values until they are sent. The queue is sent with batch calls
+        when it holds maxSize entities, interval seconds after the first queued update, on
+        flush, or when write-behind is disabled.
+
+        :param maxSize: number of queued entities triggering a flush, None for no limit
+        :type maxSize: int
+        :param interval: number of seconds after which queued updates are flushed (from a
+                         background thread), None to only flush on size or explicitly
+        :type interval: float
+        :param batchSize: number of updates per batch call
+        :type batchSize: int
+
+        .. note:: The updates a flush fails to send stay queued, and are sent again by the next
+                  flush. Those of a flush triggered by the size or the interval are stored in
+                  write_behind_failures meanwhile, and their fields are left modified
+                  (cf Entity.modified_fields, Entity.revert)
+        '''
+        self.disable_write_behind()
+        self._write_buffer = WriteBehindBuffer(lambda updates: self._batch_updates(updates, batchSize,
+                                                                                   clearChanges=True),
+                                               maxSize=maxSize, interval=interval)
+
+    def disable_write_behind(self):
+        ''' Flush the queued updates and send the next ones at once
+
+        The updates which could not be sent are no longer queued, their fields are left
+        modified (cf commit_all).
+
+        :return: the updates which could not be sent, by this flush or the previous ones
+                 triggered by the size or the interval, as (entity, exception) tuples
+        :rtype: list
+        '''
+        writeBuffer = self._write_buffer
+        if writeBuffer is None:
+            return []
+        self._write_buffer = None
+        return writeBuffer.flush() + writeBuffer.failures
+
+    def flush(self):
+        ''' Send the queued updates (cf enable_write_behind)
+
+        :return: the updates which could not be sent, as (entity, exception) tuples
+        :rtype: list
+        '''
+        if self._write_buffer is None:
+            return []
+        return self._write_buffer.flush()
+
+    @contextmanager
+    def write_behind(self, maxSize=100, interval=None, batchSize=commitBatchSize):
+        ''' Context manager queuing the updates, flushed when the context exits
+
+            >>> with sg.write_behind():
+            ...     for shot in shots:
+            ...         shot.sg_status_list = 'cmpt'
+            ...         shot.commit()
+
+        Takes the arguments of enable_write_behind. The failed updates raise a ShotgunWrapperError
+        when the context exits.
+        '''
+        previous = self._write_buffer
+        if previous is not None:
+            previous.flush()
+
+        self.enable_write_behind(maxSize=maxSize, interval=interval, batchSize=batchSize)
+        try:
+            yield self
+        finally:
+            writeBuffer = self._write_buffer
+            self._write_buffer = previous
+            failures = writeBuffer.flush() + writeBuffer.failures
+
+        if failures:
+            raise ShotgunWrapperError('%d update(s) failed, first error: %s' % (len(failures), failures[0][1]))
+
+    def write_behind_failures(self):
+        ''' Return the updates the flushes triggered by the size or the interval failed to send,
+            as (entity, exception) tuples
+        '''
+        if self._write_buffer is None:
+            return []
+        return list(self._write_buffer.failures)
+
+    def write_behind_stats(self):
+        ''' Return the number of queued entities, writes, flushes and failed updates of the write-behind buffer
+
+        :rtype: dict
+        '''
+        if self._write_buffer is None:
+            return {}
+        return self._write_buffer.stats()
+
+    def _pending_fields(self, entityType, entityId):
+        ''' Return the values queued for an entity by the write-behind buffer, or None '''
+        writeBuffer = self._write_buffer
+        if writeBuffer is None:
+            return None
+        return writeBuffer.pending(entityType, entityId)
 
     def create(self, entityType, **kwargs):
-        for e in self._entity_types:
-            if entityType in [e['type'], e['name'], e['type_plural'], e['name_plural']]:
-                thisEntityType = e['type']
-                if not e['fields']:
-                    e['fields'] = self.get_entity_field_list(thisEntityType)
-                break
+        e = self._entity_types.get(entityType)
+        if e:
+            thisEntityType = e['type']
+            if not e['fields']:
+                e['fields'] = self.get_entity_field_list(thisEntityType)
 
         entityFields = self.get_entity_fields(thisEntityType)
 
         data = self._translate_data(entityFields, kwargs)
 
+        self._ensure_session()
+
         sgResult = self._sg.create(thisEntityType, data, return_fields=kwargs.get('return_fields'))
 
         e = Entity(self, sgResult['type'], sgResult)
@@ -826,43 +1960,121 @@ class Shotgun(object):
 
         return translatedData
 
-    def batch(self, requests):
+    def batch(self, requests, chunkSize=batchChunkSize, maxBytes=None, workers=1):
         ''' Batch a list of Shotgun commands
 
+        The requests are sent in chunks of at most chunkSize requests and maxBytes bytes of
+        JSON, concurrently over several connections of the pool if workers > 1.
+
         :param requests: list of commands to execute
         :type requests: list
-        :return: list of results (Entity for create/update, bool for delete)
+        :param chunkSize: maximum number of requests per batch call, None for no limit
+        :type chunkSize: int
+        :param maxBytes: maximum size of the JSON encoded requests of a batch call, None for no limit
+        :type maxBytes: int
+        :param workers: number of batch calls sent concurrently
+        :type workers: int
+        :return: list of results (Entity for create/update, bool for delete), in the order of the requests.
+                 The cached entity of an update gets the updated values and is returned
         :rtype: list
+
+        :raises BatchError: if some chunks failed, holding the results of the successful ones
+
+        .. note:: Shotgun runs each batch call in its own transaction: when a chunk fails, the
+                  requests of the other chunks are still applied
         '''
 
         sgRequests = []
+        realTypes = {}
+        typeFields = {}
 
         for request in requests:
+            request = dict(request)
+
             # Make sure entity_type is a real SG type
-            for e in self._entity_types:
-                if request['entity_type'] in [e['type'], e['name'], e['type_plural'], e['name_plural']]:
-                    request['entity_type'] = e['type']
+            entityType = request['entity_type']
+            if entityType not in realTypes:
+                e = self._entity_types.get(entityType)
+                realTypes[entityType] = e['type'] if e else entityType
+            request['entity_type'] = realTypes[entityType]
 
             # Translate sg_wrapper.Entity to SG dict
             if 'data' in request:
-                entityFields = self.get_entity_fields(request['entity_type'])
-                request['data'] = self._translate_data(entityFields, request['data'])
+                entityType = request['entity_type']
+                if entityType not in typeFields:
+                    typeFields[entityType] = self.get_entity_fields(entityType)
+                request['data'] = self._translate_data(typeFields[entityType], request['data'])
 
             sgRequests.append(request)
 
-        sgResults = self._sg.batch(sgRequests)
+        chunks = self._chunk_requests(sgRequests, chunkSize, maxBytes)
+
+        self._ensure_session()
+
+        if workers > 1 and len(chunks) > 1:
+            outcomes = map_parallel(lambda connection, chunk: connection.batch(chunk),
+                                    chunks, workers, self._connection_pool)
+        else:
+            outcomes = []
+            for chunk in chunks:
+                try:
+                    outcomes.append((self._sg.batch(chunk), None))
+                except Exception as e:
+                    outcomes.append((None, e))
 
         results = []
-        for sgResult in sgResults:
-            if isinstance(sgResult, dict) and 'id' in sgResult and 'type' in sgResult:
-                e = Entity(self, sgResult['type'], sgResult)
-            else:
-                e = sgResult
-            results.append(e)
-            self.register_entity(e)
+        errors = []
+        for chunk, (sgResults, error) in zip(chunks, outcomes):
+            if error is not None:
+                errors.append((len(results), len(chunk), error))
+                results.extend([None] * len(chunk))
+                continue
+
+            for sgRequest, sgResult in zip(chunk, sgResults):
+                if isinstance(sgResult, dict) and 'id' in sgResult and 'type' in sgResult:
+                    e = None
+                    if sgRequest['request_type'] == 'update':
+                        with self._cache_lock:
+                            e = self._entities.get(sgResult['type'], {}).get(sgResult['id'])
+                    if e is not None:
+                        # the cached entity gets the updated values, like Shotgun.update
+                        self._apply_update(e, sgRequest.get('data', {}), sgResult, False)
+                    else:
+                        e = Entity(self, sgResult['type'], sgResult)
+                else:
+                    e = sgResult
+                results.append(e)
+
+        if errors:
+            if len(chunks) == 1:
+                raise errors[0][2]
+            raise BatchError(results, errors)
 
         return results
 
+    def _chunk_requests(self, sgRequests, chunkSize, maxBytes):
+        ''' Split batch requests in chunks of at most chunkSize requests and maxBytes bytes of JSON '''
+        if not sgRequests:
+            return []
+
+        chunks = [[]]
+        chunkBytes = 0
+
+        for request in sgRequests:
+            requestBytes = len(json.dumps(request, default=str)) + 1 if maxBytes else 0
+
+            chunk = chunks[-1]
+            if chunk and ((chunkSize and len(chunk) >= chunkSize)
+                          or (maxBytes and chunkBytes + requestBytes > maxBytes)):
+                chunk = []
+                chunks.append(chunk)
+                chunkBytes = 0
+
+            chunk.append(request)
+            chunkBytes += requestBytes
+
+        return chunks
+
     ##
     # pickle support
 
@@ -906,12 +2118,12 @@ class Shotgun(object):
         # register sub entities (ie tasks for Asset or sg_sequence for Shot...)
         # so after pickle we can access myShot.sg_sequence.code
 
-        for entityType, entitiesDict in _entities.iteritems():
+        for entityType, entitiesDict in _entities.items():
 
             # fix publish file pickle
             _entitiesDict = entitiesDict.copy()
 
-            for entityId, entity in _entitiesDict.iteritems():
+            for entityId, entity in _entitiesDict.items():
 
                 for field in entity.fields():
 
@@ -948,23 +2160,65 @@ class Shotgun(object):
         if '_sg' in odict:
             del odict['_sg']
 
+        # locks and connections can not be pickled
+        del odict['_init_lock']
+        del odict['_cache_lock']
+        odict.pop('_connection_pool', None)
+        odict.pop('_retry_args', None)
+        odict.pop('_connection_factory', None)
+        odict.pop('_internal_fetches', None)
+        # queued updates are not pickled, flush them first
+        odict['_write_buffer'] = None
+
         return odict
 
     def __setstate__(self, adict):
 
+        # handles pickled before the entity types were read lazily
+        entityTypes = adict.pop('_entity_types', None)
+        if entityTypes is not None and '_entity_type_registry' not in adict:
+            registry = EntityTypeRegistry()
+            for e in entityTypes:
+                registry.register(e['type'], e['name'], e['type_plural'], e['name_plural'])
+            adict['_entity_type_registry'] = registry
+
+        # handles pickled before the find_entity results were cached in a QueryCache
+        adict.pop('_entity_searches', None)
+        adict.setdefault('_query_cache', QueryCache())
+
+        adict.setdefault('_schema_cache', None)
+        adict.setdefault('_auth_cache', None)
+        adict.setdefault('_cache_ttl', {})
+        adict.setdefault('_default_projection', DefaultProjection())
+        adict.setdefault('_profiler', None)
+        adict.setdefault('_sibling_fetch', False)
+        adict.setdefault('_write_buffer', None)
+        adict.setdefault('_session_ready', True)
+        adict.setdefault('_session_initializing', False)
+        adict.setdefault('_connection_factory', None)
+        adict.setdefault('_fault_type', shotgun_api3.Fault)
+        adict.setdefault('_pending_cache_ttl', {})
+
         self.__dict__.update(adict)
+        self._init_lock = threading.RLock()
+        self._cache_lock = threading.RLock()
+        self._internal_fetches = threading.local()
 
 
 class Entity(object):
-    def __init__(self, shotgun, entity_type, fields):
+    def __init__(self, shotgun, entity_type, fields, register=True):
         self._entity_type = entity_type
         self._shotgun = shotgun
         self._fields = fields
         self._fields_changed = {}
         self._sg_filters = []
+        self._cached_at = time.time()
+        self._profile_site = get_call_site() if shotgun._profiler else None
+        self._siblings = None
 
         self._entity_id = self._fields['id']
-        self._shotgun.register_entity(self)
+        if register:
+            self._shotgun.register_entity(self)
 
     def reload(self, mode='all', fields=None):
 
@@ -972,6 +2226,7 @@ class Entity(object):
 
         :param mode:
             * all: query all entity fields (default)
+            * default: query the default fields of the entity type, or all if it has none
             * basic: query entity with existing fields
             * replace: query entity with fields provided as argument
             * append: query entity with existing fields + fields provided as argument
@@ -982,20 +2237,29 @@ class Entity(object):
 
         fieldsToQuery = []
 
-        if mode == 'all':
+        if mode == 'default':
+            fieldsToQuery = self._shotgun.get_default_field_list(self._entity_type)
+        elif mode == 'all':
 
             self._field_names = self._shotgun.get_entity_field_list(self._entity_type)
             fieldsToQuery = self._field_names
         elif mode == 'basic':
-            fieldsToQuery = self._fields.keys()
+            fieldsToQuery = list(self._fields.keys())
         elif mode == 'replace':
             fieldsToQuery = fields
         elif mode == 'append':
-            fieldsToQuery = self._fields.keys() + fields
+            fieldsToQuery = list(self._fields.keys()) + fields
         else:
             raise ValueError('Unknown mode: %s' % (mode))
 
-        self._fields = self._shotgun.sg_find_one(self._entity_type, [["id", "is", self._entity_id]], fields = fieldsToQuery) or {}
+        with self._shotgun._internal_fetch():
+            self._fields = self._shotgun.sg_find_one(self._entity_type, [["id", "is", self._entity_id]],
+                                                     fields=fieldsToQuery) or {}
+        self._cached_at = time.time()
+
+        pending = self._shotgun._pending_fields(self._entity_type, self._entity_id)
+        if pending and self._fields:
+            self._fields.update(pending)
 
     def fields(self):
         # Workaround to fix the attachment access to path fields problem.
@@ -1003,12 +2267,12 @@ class Entity(object):
         # are dynamic and not described in the schema making sg_wrapper
         # go wrong.
         if self._entity_type == 'Attachment':
-            attrNames = self._fields.keys()
+            attrNames = list(self._fields.keys())
             attrNames.extend(self._fields['this_file'].keys())
             attrNames.remove('this_file')
             return attrNames
 
-        return self._fields.keys()
+        return list(self._fields.keys())
 
     def entity_type(self):
         return self._entity_type
@@ -1043,16 +2307,31 @@ class Entity(object):
         if self._entity_type == 'Attachment':
             toVisit.append(self._fields['this_file'])
 
+        defaultProjection = self._shotgun._default_projection
+        if defaultProjection.learn:
+            defaultProjection.record_read(self._entity_type, fieldName)
+
+        profiler = self._shotgun._profiler
+        if profiler and self._profile_site:
+            profiler.record_read(self, fieldName)
+
         for currentFields in toVisit:
             if currentFields and fieldName in currentFields:
                 attribute = currentFields[fieldName]
                 if type(attribute) == dict and 'id' in attribute and 'type' in attribute:
                     if 'entity' not in attribute:
-                        attribute['entity'] = self._shotgun.find_entity(attribute['type'],
-                                                                        id=attribute['id'],
-                                                                        fields=fields)
+                        if profiler and self._profile_site:
+                            profiler.record_link_queries(self, fieldName)
+                        with self._shotgun._internal_fetch():
+                            attribute['entity'] = self._shotgun.find_entity(attribute['type'],
+                                                                            id=attribute['id'],
+                                                                            fields=fields)
                     return attribute['entity']
                 elif type(attribute) == list:
+                    if profiler and self._profile_site:
+                        unresolved = [e for e in attribute if isinstance(e, dict) and 'entity' not in e]
+                        if unresolved:
+                            profiler.record_link_queries(self, fieldName, len(set(e['type'] for e in unresolved)))
                     iterator = self.list_iterator(currentFields[fieldName], fields)
                     attrResult = []
                     for item in iterator:
@@ -1063,9 +2342,9 @@ class Entity(object):
 
         # TO REMOVE when using shotgun-7.4+
         if fieldName in ['tags', 'tag_list'] and fieldName not in self._fields:
-            return getattr(self._shotgun.find_entity(self._entity_type,
-                                                     id=self._entity_id,
-                                                     fields=[fieldName]), fieldName)
+            with self._shotgun._internal_fetch():
+                entity = self._shotgun.find_entity(self._entity_type, id=self._entity_id, fields=[fieldName])
+            return getattr(entity, fieldName)
 
         raise AttributeError("Entity '%s' has no field '%s'" % (self._entity_type, fieldName))
 
@@ -1087,6 +2366,16 @@ class Entity(object):
             return self._field(fieldName, fields=fields)
 
         except AttributeError:
+            self._shotgun._default_projection.record_miss(self._entity_type, fieldName)
+            if self._shotgun._profiler and self._profile_site:
+                self._shotgun._profiler.record_reload(self, fieldName)
+
+            if self._siblings is not None and self._shotgun._fetch_sibling_field(self, fieldName):
+                try:
+                    return self._field(fieldName, fields=fields)
+                except AttributeError:
+                    pass
+
             self.reload(mode='append', fields=[fieldName])
             return self._field(fieldName, fields=fields)
 
@@ -1104,9 +2393,10 @@ class Entity(object):
                         to_fetch[e['type']] = []
                     to_fetch[e['type']].append(e)
 
-            for tf_type, tf_entities in to_fetch.iteritems():
+            for tf_type, tf_entities in to_fetch.items():
                 entity_ids = [e['id'] for e in tf_entities]
-                entities = self._shotgun.find_entity(tf_type, id=('in', entity_ids), fields=fields, find_one=False)
+                with self._shotgun._internal_fetch():
+                    entities = self._shotgun.find_entity(tf_type, id=('in', entity_ids), fields=fields, find_one=False)
                 res_by_id = {e['id']: e for e in entities}
                 for e in tf_entities:
                     e['entity'] = res_by_id.get(e['id'])
@@ -1120,19 +2410,23 @@ class Entity(object):
                 continue
 
             if 'entity' not in entity:
-                entity['entity'] = self._shotgun.find_entity(entity['type'], id = entity['id'], fields=fields)
+                with self._shotgun._internal_fetch():
+                    entity['entity'] = self._shotgun.find_entity(entity['type'], id = entity['id'], fields=fields)
 
             yield entity['entity']
 
     def modified_fields(self):
-        return self._fields_changed.keys()
+        return list(self._fields_changed.keys())
 
     def commit(self):
         if not self.modified_fields():
             return False
 
-        self._shotgun.update(self, self._fields_changed.keys())
-        self._fields_changed = {}
+        # queued updates leave the fields modified until they are sent (cf Shotgun.enable_write_behind)
+        queued = self._shotgun._write_buffer is not None
+        self._shotgun.update(self, list(self._fields_changed.keys()))
+        if not queued:
+            self._fields_changed = {}
         return True
 
     def revert(self, revert_fields = None):
@@ -1141,10 +2435,17 @@ class Entity(object):
         elif type(revert_fields) == "str":
             revert_fields = [revert_fields]
 
+        reverted = []
         for field in self.modified_fields():
             if field in revert_fields:
                 self._fields[field] = self._fields_changed[field]
                 del self._fields_changed[field]
+                reverted.append(field)
+
+        # reverted fields queued by the write-behind buffer are not sent
+        writeBuffer = self._shotgun._write_buffer
+        if writeBuffer is not None and reverted:
+            writeBuffer.discard(self._entity_type, self._entity_id, reverted)
 
     def _set_field(self, fieldName, value):
 
@@ -1172,6 +2473,9 @@ class Entity(object):
             self._set_field(fieldName, value)
 
     def __getattr__(self, attrName):
+        # special names (ie __deepcopy__, __length_hint__) are never fields
+        if attrName.startswith('__') and attrName.endswith('__'):
+            raise AttributeError(attrName)
         return self.field(attrName)
 
     def __setattr__(self, attrName, value):
@@ -1199,6 +2503,7 @@ class Entity(object):
         :param tagList: optional tags (comma separated str of tags)
         :type tagList: str
         '''
+        self._shotgun._ensure_session()
         self._shotgun._sg.upload(self.entity_type(), self.entity_id(), path, field, displayName, tagList)
 
     # 'partial' pickle support
@@ -1262,6 +2567,9 @@ class Entity(object):
             # with entity (in order to keep cached entries)
             #del odict['_shotgun'] # remove shotgun entry
 
+        # weak references can not be pickled
+        odict.pop('_siblings', None)
+
         return odict
 
     def __setstate__(self, adict):
@@ -1283,4 +2591,8 @@ class Entity(object):
         # do not remove shotgun config - so re pickle will work
         #del adict['_pickle_shotgun_convert_datetimes_to_utc']
 
+        adict.setdefault('_cached_at', time.time())
+        adict.setdefault('_profile_site', None)
+        adict.setdefault('_siblings', None)
+
         self.__dict__.update(adict)
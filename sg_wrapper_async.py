@@ -0,0 +1,209 @@
+''' asyncio front-end for sg_wrapper (python 3 only)
+
+    >>> asg = sg_wrapper_async.AsyncShotgun(sg_wrapper.Shotgun(sgServer, sgScriptName, sgScriptKey))
+    >>> shot = await asg.Shot('sh010')
+    >>> shots = await asg.Shots(project=p, sg_status_list='ip')
+    >>> shot.sg_status_list = 'cmpt'
+    >>> await asg.commit(shot)
+    >>> async for version in asg.iter_entities('Version', project=p):
+    ...     print(version.code)
+'''
+
+import asyncio
+import collections
+import functools
+import itertools
+
+from concurrent.futures import ThreadPoolExecutor
+
+from sg_wrapper_cache import canonical_key
+
+# number of entities of a streamed query pulled per executor call by AsyncEntityIterator
+iterChunkSize = 100
+
+
+class AsyncEntityIterator(object):
+    ''' Asynchronous iterator over the entities of a streamed query (cf AsyncShotgun.iter_entities)
+
+        The synchronous iterator of the query is built and advanced by the executor, chunkSize
+        entities at a time, so its page requests never block the event loop.
+
+        :param asyncShotgun: front-end whose executor runs the query
+        :type asyncShotgun: :class:`AsyncShotgun`
+        :param func: callable returning the synchronous iterator (ie Shotgun.iter_entities)
+        :type func: callable
+        :param chunkSize: number of entities pulled per executor call
+        :type chunkSize: int
+    '''
+
+    def __init__(self, asyncShotgun, func, args, kwargs, chunkSize=iterChunkSize):
+        self._async_shotgun = asyncShotgun
+        self._func = func
+        self._args = args
+        self._kwargs = kwargs
+        self._iterator = None
+        self._chunk_size = chunkSize
+        self._buffer = collections.deque()
+        self._done = False
+
+    def __aiter__(self):
+        return self
+
+    def __anext__(self):
+        future = asyncio.get_running_loop().create_future()
+        if self._buffer:
+            future.set_result(self._buffer.popleft())
+        elif self._done:
+            future.set_exception(StopAsyncIteration())
+        else:
+            chunk = self._async_shotgun._run(self._next_chunk)
+            chunk.add_done_callback(functools.partial(self._resolve, future))
+        return future
+
+    def _next_chunk(self):
+        if self._iterator is None:
+            self._iterator = iter(self._func(*self._args, **self._kwargs))
+        return list(itertools.islice(self._iterator, self._chunk_size))
+
+    def _resolve(self, future, chunk):
+        if chunk.cancelled() or chunk.exception() is not None:
+            self._done = True
+            if not future.done():
+                if chunk.cancelled():
+                    future.cancel()
+                else:
+                    future.set_exception(chunk.exception())
+            return
+
+        entities = chunk.result()
+        self._buffer.extend(entities)
+        if not entities:
+            self._done = True
+
+        if future.done():
+            return
+        if self._buffer:
+            future.set_result(self._buffer.popleft())
+        else:
+            future.set_exception(StopAsyncIteration())
+
+
+class AsyncShotgun(object):
+    ''' Awaitable facade of a sg_wrapper.Shotgun handle
+
+        The requests are run by a bounded thread pool executor, each one checking out a
+        connection of the handle's connection pool, and share the handle's caches.
+        Identical find_entity calls issued while one is in flight are coalesced: they await
+        the same request instead of issuing a new one.
+
+        Every method returns an awaitable future, except the streamed queries (iter_entities,
+        find_entity with stream=True) returning an asynchronous iterator.
+
+        :param shotgun: handle the requests are sent through
+        :type shotgun: :class:`~sg_wrapper.Shotgun`
+        :param maxWorkers: maximum number of concurrent requests, defaults to the connection pool size
+        :type maxWorkers: int
+        :param loop: event loop the futures are bound to, defaults to the running event loop
+        :type loop: asyncio.AbstractEventLoop
+
+        .. note:: Accessing an entity type (ie asg.Shots) of a lazy handle reads the schema
+                  in the calling thread
+    '''
+
+    def __init__(self, shotgun, maxWorkers=None, loop=None):
+        self._shotgun = shotgun
+        self._loop = loop
+        self._executor = ThreadPoolExecutor(maxWorkers or shotgun._connection_pool.maxSize or 4)
+        self._in_flight = {}
+        self.coalesced = 0
+
+    @property
+    def shotgun(self):
+        ''' The wrapped sg_wrapper.Shotgun handle '''
+        return self._shotgun
+
+    def _run(self, func, *args, **kwargs):
+        loop = self._loop or asyncio.get_running_loop()
+        return loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    def find_entity(self, entityType, *args, **kwargs):
+        ''' Awaitable sg_wrapper.Shotgun.find_entity, coalescing identical concurrent calls
+
+        .. note:: With stream=True (and find_one=False) returns an asynchronous iterator
+                  (cf iter_entities), the streamed queries are not coalesced
+        '''
+        findOne = args[1] if len(args) > 1 else kwargs.get('find_one', True)
+        if kwargs.get('stream') and not findOne:
+            return AsyncEntityIterator(self, self._shotgun.find_entity, (entityType,) + args, kwargs)
+
+        key = canonical_key((entityType, args, kwargs))
+
+        future = self._in_flight.get(key)
+        if future is not None:
+            self.coalesced += 1
+        else:
+            future = self._run(self._shotgun.find_entity, entityType, *args, **kwargs)
+            self._in_flight[key] = future
+            future.add_done_callback(lambda f: self._in_flight.pop(key, None))
+
+        # cancelling one of the callers must not cancel the shared request
+        return asyncio.shield(future)
+
+    def iter_entities(self, entityType, *args, **kwargs):
+        ''' Asynchronous iterator over the entities of sg_wrapper.Shotgun.iter_entities
+
+            >>> async for version in asg.iter_entities('Version', project=p, fields=['code']):
+            ...     print(version.code)
+
+        :rtype: :class:`AsyncEntityIterator`
+        '''
+        return AsyncEntityIterator(self, self._shotgun.iter_entities, (entityType,) + args, kwargs)
+
+    def create(self, entityType, **kwargs):
+        ''' Awaitable sg_wrapper.Shotgun.create '''
+        return self._run(self._shotgun.create, entityType, **kwargs)
+
+    def update(self, entity, updateFields):
+        ''' Awaitable sg_wrapper.Shotgun.update '''
+        return self._run(self._shotgun.update, entity, updateFields)
+
+    def batch(self, requests, **kwargs):
+        ''' Awaitable sg_wrapper.Shotgun.batch '''
+        return self._run(self._shotgun.batch, requests, **kwargs)
+
+    def commit(self, entity):
+        ''' Awaitable sg_wrapper.Entity.commit '''
+        return self._run(entity.commit)
+
+    def commit_all(self, **kwargs):
+        ''' Awaitable sg_wrapper.Shotgun.commit_all '''
+        return self._run(self._shotgun.commit_all, **kwargs)
+
+    def stats(self):
+        ''' Return the number of find_entity calls coalesced and currently in flight
+
+        :rtype: dict
+        '''
+        return {'coalesced': self.coalesced, 'inFlight': len(self._in_flight)}
+
+    def close(self, wait=True):
+        ''' Shut the executor down, the wrapped handle is left open '''
+        self._executor.shutdown(wait=wait)
+
+    def __getattr__(self, attrName):
+
+        if attrName.startswith('_'):
+            raise AttributeError('Could not get attribute %s' % attrName)
+
+        def find_entity_wrapper(*args, **kwargs):
+            return self.find_entity(attrName, find_one = True, *args, **kwargs)
+
+        def find_multi_entity_wrapper(*args, **kwargs):
+            return self.find_entity(attrName, find_one = False, *args, **kwargs)
+
+        if self._shotgun.is_entity(attrName):
+            return find_entity_wrapper
+        elif self._shotgun.is_entity_plural(attrName):
+            return find_multi_entity_wrapper
+
+        raise AttributeError('Could not get attribute %s' % attrName)
@@ -0,0 +1,124 @@
+import json
+import os
+import tempfile
+import time
+
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # no file locking (ie windows): concurrent processes may resolve the same script at once
+    fcntl = None
+
+
+class AuthCache(object):
+    ''' On-disk cache of the script names and api keys resolved by sg_wrapper.Shotgun.get_new_shotgun_auth_info
+
+        The credentials are stored in a single JSON file, only readable by its owner, keyed by
+        server url and lowercased script name (the ApiUser search is case insensitive). The
+        resolution of a missing entry is done under an exclusive lock of the file, so
+        concurrent processes do not race to create the same ApiUser::
+
+            >>> with authCache.lock():
+            ...     if authCache.get(server, scriptName) is None:
+            ...         authCache.put(server, scriptName, *resolve(scriptName))
+
+        :param path: path of the cache file
+        :type path: str
+        :param ttl: number of seconds an entry is valid, None to never expire
+        :type ttl: int
+    '''
+
+    def __init__(self, path, ttl=86400):
+        self.path = path
+        self.ttl = ttl
+
+    @staticmethod
+    def _key(server, scriptName):
+        return '%s %s' % (server, scriptName.lower())
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                entries = json.load(f)
+        except (IOError, OSError, ValueError):
+            return {}
+        return entries if isinstance(entries, dict) else {}
+
+    def _folder(self):
+        folder = os.path.dirname(os.path.abspath(self.path))
+        if not os.path.isdir(folder):
+            try:
+                os.makedirs(folder, 0o700)
+            except OSError:
+                if not os.path.isdir(folder):
+                    raise
+        return folder
+
+    def _dump(self, entries):
+        try:
+            folder = self._folder()
+            # mkstemp creates the file readable by its owner only
+            fd, tmpPath = tempfile.mkstemp(dir=folder, prefix='.tmp')
+        except (IOError, OSError):
+            return
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(entries, f)
+            os.chmod(tmpPath, 0o600)
+            os.rename(tmpPath, self.path)
+        except (IOError, OSError):
+            if os.path.exists(tmpPath):
+                os.remove(tmpPath)
+
+    def get(self, server, scriptName):
+        ''' Return the cached (script name, api key) of a script, or None '''
+        entry = self._load().get(self._key(server, scriptName))
+        if not entry:
+            return None
+        if self.ttl is not None and time.time() - entry.get('time', 0) > self.ttl:
+            return None
+        return (entry['script_name'], entry['api_key'])
+
+    def put(self, server, scriptName, resolvedName, apiKey):
+        ''' Cache the resolved script name and api key of a script '''
+        entries = self._load()
+        entries[self._key(server, scriptName)] = {'script_name': resolvedName,
+                                                  'api_key': apiKey,
+                                                  'time': time.time()}
+        self._dump(entries)
+
+    def invalidate(self, server, scriptName=None):
+        ''' Remove the entry of a script, or every entry of a server '''
+        entries = self._load()
+        if scriptName is not None:
+            keys = [self._key(server, scriptName)]
+        else:
+            keys = [k for k in entries if k.startswith('%s ' % server)]
+        if any(k in entries for k in keys):
+            for k in keys:
+                entries.pop(k, None)
+            self._dump(entries)
+
+    @contextmanager
+    def lock(self):
+        ''' Context manager holding an exclusive lock of the cache, shared by every process of the host '''
+        if fcntl is None:
+            yield
+            return
+
+        try:
+            self._folder()
+            fd = os.open(self.path + '.lock', os.O_RDWR | os.O_CREAT, 0o600)
+        except OSError:
+            # the lock file can not be created: resolve without locking
+            yield
+            return
+
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
@@ -0,0 +1,151 @@
+import threading
+
+from collections import OrderedDict
+
+
+class WriteBehindBuffer(object):
+    ''' Queue of entity updates, merged per entity and sent in batches
+
+        Updates of the same entity are merged, the last value written to a field wins. The
+        queue is flushed when it holds maxSize entities, interval seconds after the first
+        update queued since the last flush, or on an explicit flush.
+
+        A flush sends a snapshot of the queue: an update stays queued until it is sent, and the
+        updates which fail stay queued to be sent again by the next flush. The values written
+        while a flush is sending stay queued too.
+
+        Flushes triggered by the size or by the timer (which runs in a background thread) do
+        not return the updates they fail to send: they are stored in failures, until they are
+        sent again.
+
+        :param flushFunc: callable sending a list of (entity, data) updates, returning the
+                          failed ones as (entity, exception) tuples
+        :type flushFunc: callable
+        :param maxSize: number of queued entities triggering a flush, None for no limit
+        :type maxSize: int
+        :param interval: number of seconds after which queued updates are flushed, None to only
+                         flush on size or explicitly
+        :type interval: float
+    '''
+
+    def __init__(self, flushFunc, maxSize=100, interval=None):
+        self.maxSize = maxSize
+        self.interval = interval
+        self.failures = []
+        self.flushes = 0
+        self.writes = 0
+        self._flushFunc = flushFunc
+        self._pending = OrderedDict()
+        self._timer = None
+        self._lock = threading.Lock()
+        # flushes are serialized, so the updates of an entity are sent in order
+        self._flushLock = threading.Lock()
+
+    def add(self, entity, data):
+        ''' Queue an update of an entity
+
+        :param entity: entity to update
+        :type entity: :class:`~sg_wrapper.Entity`
+        :param data: values of the updated fields
+        :type data: dict
+        '''
+        key = (entity._entity_type, entity._entity_id)
+        with self._lock:
+            pending = self._pending.get(key)
+            if pending is None:
+                pending = self._pending[key] = {'entity': entity, 'data': {}}
+            pending['data'].update(data)
+            self.writes += 1
+
+            full = self.maxSize is not None and len(self._pending) >= self.maxSize
+            if not full and self.interval is not None and self._timer is None:
+                self._timer = threading.Timer(self.interval, self._flush_and_record)
+                self._timer.daemon = True
+                self._timer.start()
+
+        if full:
+            self._flush_and_record()
+
+    def pending(self, entityType, entityId):
+        ''' Return the queued values of an entity, or None '''
+        with self._lock:
+            pending = self._pending.get((entityType, entityId))
+            return dict(pending['data']) if pending else None
+
+    def discard(self, entityType, entityId, fieldNames):
+        ''' Remove fields from the queued update of an entity, ie reverted before being sent '''
+        key = (entityType, entityId)
+        with self._lock:
+            pending = self._pending.get(key)
+            if pending is None:
+                return
+            for fieldName in fieldNames:
+                pending['data'].pop(fieldName, None)
+            if not pending['data']:
+                del self._pending[key]
+
+    def flush(self):
+        ''' Send the queued updates
+
+        The updates which could not be sent stay queued.
+
+        :return: the updates which could not be sent, as (entity, exception) tuples
+        :rtype: list
+        '''
+        with self._flushLock:
+            with self._lock:
+                updates = [(p['entity'], dict(p['data'])) for p in self._pending.values()]
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+
+            if not updates:
+                return []
+
+            self.flushes += 1
+            failures = self._flushFunc(updates)
+
+            failed = set(id(entity) for entity, error in failures)
+            sent = set()
+            with self._lock:
+                for entity, data in updates:
+                    key = (entity._entity_type, entity._entity_id)
+                    sent.add(key)
+                    pending = self._pending.get(key)
+                    if id(entity) in failed or pending is None:
+                        continue
+                    # the values written since the snapshot are sent by the next flush
+                    for fieldName, value in data.items():
+                        if fieldName in pending['data'] and pending['data'][fieldName] is value:
+                            del pending['data'][fieldName]
+                    if not pending['data']:
+                        del self._pending[key]
+
+                # the failures of the previous flushes are replaced by the outcome of this one
+                self.failures = [(entity, error) for entity, error in self.failures
+                                 if entity is None or (entity._entity_type, entity._entity_id) not in sent]
+
+            return failures
+
+    def _flush_and_record(self):
+        ''' Flush, storing the updates which could not be sent in failures '''
+        try:
+            failures = self.flush()
+        except Exception as e:
+            failures = [(None, e)]
+        with self._lock:
+            self.failures.extend(failures)
+
+    def stats(self):
+        ''' Return the number of queued entities, writes, flushes and failed updates
+
+        :rtype: dict
+        '''
+        with self._lock:
+            return {'pending': len(self._pending),
+                    'writes': self.writes,
+                    'flushes': self.flushes,
+                    'failures': len(self.failures)}
+
+    def __len__(self):
+        return len(self._pending)
@@ -0,0 +1,298 @@
+import threading
+import time
+
+from collections import OrderedDict
+
+
+def canonical_key(value):
+    ''' Return a hashable canonical form of a query element (filters, order...)
+
+    Dictionaries are sorted by key, lists and tuples are kept distinct, so two values
+    have the same canonical form iff they are equal.
+
+    >>> canonical_key({'id': ('in', [1, 2]), 'project': {'type': 'Project', 'id': 1}}) == \\
+    ...     canonical_key({'project': {'id': 1, 'type': 'Project'}, 'id': ('in', [1, 2])})
+    True
+    '''
+
+    if isinstance(value, dict):
+        return (dict, tuple(sorted((k, canonical_key(v)) for k, v in value.items())))
+    elif isinstance(value, list):
+        return (list, tuple(canonical_key(v) for v in value))
+    elif isinstance(value, tuple):
+        return (tuple, tuple(canonical_key(v) for v in value))
+    elif isinstance(value, (set, frozenset)):
+        return (frozenset, frozenset(canonical_key(v) for v in value))
+
+    try:
+        hash(value)
+    except TypeError:
+        return (repr, repr(value))
+    return value
+
+
+def make_query_key(entityType, filters, order, findOne):
+    ''' Return the key of a sg_wrapper.Shotgun.find_entity query in a QueryCache '''
+    return (entityType, canonical_key(filters), canonical_key(order), bool(findOne))
+
+
+class QueryCache(object):
+    ''' Cache of sg_wrapper.Shotgun.find_entity results
+
+        Results are stored in buckets, keyed by the canonical form of the query
+        (see make_query_key). A bucket holds one entry per set of fetched fields: a
+        lookup returns the first entry of its bucket fetched with at least the requested fields.
+
+        When more than maxSize entries are stored, the least recently used buckets are evicted.
+        Entries can also expire (see the ttl argument of get) or be invalidated when the
+        entities they depend on change (see invalidate).
+
+        :param maxSize: maximum number of cached results, None for no limit
+        :type maxSize: int
+    '''
+
+    def __init__(self, maxSize=1000):
+        self.maxSize = maxSize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._buckets = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, fields, ttl=None):
+        ''' Retrieve a cached result
+
+        :param key: query key, from make_query_key
+        :type key: tuple
+        :param fields: requested fields
+        :type fields: list
+        :param ttl: number of seconds a result is valid, None if it never expires
+        :type ttl: int
+
+        :return: (True, result) if a result fetched with every requested field is cached, (False, None) otherwise
+        :rtype: (bool, object)
+        '''
+        with self._lock:
+            bucket = self._buckets.get(key)
+
+            if bucket and ttl is not None:
+                expiry = time.time() - ttl
+                valid = [entry for entry in bucket if entry['time'] >= expiry]
+                self._size -= len(bucket) - len(valid)
+                self.evictions += len(bucket) - len(valid)
+                bucket[:] = valid
+                if not valid:
+                    del self._buckets[key]
+
+            if bucket:
+                fields = set(fields)
+                for entry in bucket:
+                    if fields <= entry['fields']:
+                        # move the bucket to the most recently used end
+                        del self._buckets[key]
+                        self._buckets[key] = bucket
+                        self.hits += 1
+                        return (True, entry['result'])
+
+            self.misses += 1
+            return (False, None)
+
+    def put(self, key, fields, result, ids=(), filterFields=()):
+        ''' Cache a result
+
+        :param key: query key, from make_query_key
+        :type key: tuple
+        :param fields: fields fetched by the query
+        :type fields: list
+        :param result: query result
+        :type result: object
+        :param ids: ids of the entities in the result
+        :type ids: list
+        :param filterFields: fields the query filters or orders on
+        :type filterFields: list
+        '''
+        fields = frozenset(fields)
+        with self._lock:
+            bucket = self._buckets.pop(key, [])
+
+            # drop the entries fetched with less fields, this one supersedes them
+            kept = [entry for entry in bucket if not entry['fields'] <= fields]
+            self._size -= len(bucket) - len(kept)
+
+            kept.append({'fields': fields,
+                         'result': result,
+                         'time': time.time(),
+                         'ids': frozenset(ids),
+                         'filter_fields': frozenset(filterFields)})
+            self._size += 1
+            self._buckets[key] = kept
+
+            if self.maxSize is not None:
+                while self._size > self.maxSize and self._buckets:
+                    _, evicted = self._buckets.popitem(last=False)
+                    self._size -= len(evicted)
+                    self.evictions += len(evicted)
+
+    def invalidate(self, entityType, entityId=None, fieldName=None):
+        ''' Evict the results a change of an entity may have altered
+
+        :param entityType: type of the changed entity
+        :type entityType: str
+        :param entityId: id of the changed entity, None to evict every result of the type
+        :type entityId: int
+        :param fieldName: changed field, None if unknown
+        :type fieldName: str
+
+        :return: number of evicted results
+        :rtype: int
+
+        .. note:: A result is evicted if it contains the entity, or if the change may add the
+                  entity to it or reorder it: its query filters or orders on the changed
+                  field, or on any field other than the id if the field is unknown
+        '''
+
+        evictedCount = 0
+        with self._lock:
+            for key in list(self._buckets):
+                if key[0] != entityType:
+                    continue
+
+                bucket = self._buckets[key]
+                kept = []
+                for entry in bucket:
+                    if entityId is None or entityId in entry['ids']:
+                        continue
+                    if fieldName is None:
+                        if entry['filter_fields'] - frozenset(['id']):
+                            continue
+                    elif fieldName in entry['filter_fields']:
+                        continue
+                    kept.append(entry)
+
+                evictedCount += len(bucket) - len(kept)
+                if kept:
+                    self._buckets[key] = kept
+                else:
+                    del self._buckets[key]
+
+            self._size -= evictedCount
+            self.evictions += evictedCount
+
+        return evictedCount
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+            self._size = 0
+
+    def stats(self):
+        ''' Return the cache counters
+
+        :return: size, maxSize, hits, misses and evictions of the cache
+        :rtype: dict
+        '''
+        return {'size': self._size,
+                'maxSize': self.maxSize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions}
+
+    def __len__(self):
+        return self._size
+
+    # pickle support: locks can not be pickled
+
+    def __getstate__(self):
+        odict = self.__dict__.copy()
+        del odict['_lock']
+        return odict
+
+    def __setstate__(self, adict):
+        self.__dict__.update(adict)
+        self._lock = threading.Lock()
+
+
+class SingleFlight(object):
+    ''' Coalesce identical concurrent calls
+
+        The first thread calling do with a key runs the function, the threads calling it with
+        the same key meanwhile wait for it and get its result (or its exception, including
+        KeyboardInterrupt and SystemExit) instead of running the function again.
+    '''
+
+    def __init__(self):
+        self.saved = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func, *args, **kwargs):
+        ''' Run func(*args, **kwargs), or wait for the result of the call in flight with the same key
+
+        :param key: hashable key of the call
+        :type key: object
+        :param copyResult: optional keyword argument, callable applied to the result returned to
+                           the waiting threads, so they do not share it with the running one
+        :type copyResult: callable
+
+        :return: the function result
+        :rtype: object
+        '''
+        copyResult = kwargs.pop('copyResult', None)
+
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = {'event': threading.Event(),
+                        'thread': threading.current_thread(),
+                        'result': None,
+                        'error': None}
+                self._calls[key] = call
+                leader = True
+            elif call['thread'] is threading.current_thread():
+                # reentrant call: waiting for itself would dead lock
+                call = None
+                leader = False
+            else:
+                self.saved += 1
+                leader = False
+
+        if call is None:
+            return func(*args, **kwargs)
+
+        if not leader:
+            call['event'].wait()
+            if call['error'] is not None:
+                raise call['error']
+            if copyResult:
+                return copyResult(call['result'])
+            return call['result']
+
+        try:
+            call['result'] = func(*args, **kwargs)
+        except BaseException as e:
+            # the waiting threads raise it too, even if it is not an Exception (ie KeyboardInterrupt)
+            call['error'] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call['event'].set()
+
+        return call['result']
+
+    def stats(self):
+        ''' Return the number of calls saved by waiting for an identical call, and the number of calls in flight
+
+        :rtype: dict
+        '''
+        return {'saved': self.saved, 'inFlight': len(self._calls)}
+
+    # pickle support: locks can not be pickled
+
+    def __getstate__(self):
+        return {'saved': self.saved}
+
+    def __setstate__(self, adict):
+        self.__init__()
+        self.saved = adict['saved']
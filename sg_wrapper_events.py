@@ -0,0 +1,282 @@
+import json
+import os
+import tempfile
+import threading
+import time
+
+
+class EventLogTailer(object):
+    ''' Follow the EventLogEntry table of a Shotgun server
+
+        Every poll fetches the events newer than the last one seen (id > last id, by pages of
+        pageSize events), invalidates the caches of the handle they alter, and dispatches
+        them to the callbacks, batchSize events at a time and in id order.
+
+            >>> tailer = EventLogTailer(sg, checkpointPath='/var/lib/myDaemon/events.json')
+            >>> tailer.add_callback(lambda events: sync(events))
+            >>> tailer.run()
+
+        The poll interval adapts to the activity: it is reset to minInterval when events are
+        found, and doubled up to maxInterval otherwise.
+
+        Event ids are allocated when a transaction starts, so a long transaction may commit
+        its events after newer ones were read. The ids skipped by a poll are kept as gaps,
+        fetched again on the next polls, and given up after gapTimeout seconds (the
+        transaction was rolled back).
+
+        The last id and the gaps are saved in the checkpoint file after every dispatched
+        batch, so a restarted tailer resumes where it stopped. An event is dispatched at
+        least once: a crash in a callback replays its batch on restart.
+
+        :param shotgun: handle the events are read with, and whose caches are invalidated
+        :type shotgun: :class:`~sg_wrapper.Shotgun`
+        :param checkpointPath: JSON file storing the last id and the gaps, None to not persist them
+        :type checkpointPath: str
+        :param startId: id of the last event already processed, used when there is no checkpoint.
+                        Defaults to the newest event of the server
+        :type startId: int
+        :param batchSize: maximum number of events per callback call
+        :type batchSize: int
+        :param pageSize: number of events fetched per request
+        :type pageSize: int
+        :param minInterval: number of seconds between polls while events are found
+        :type minInterval: float
+        :param maxInterval: maximum number of seconds between polls
+        :type maxInterval: float
+        :param gapTimeout: number of seconds after which a missing id is given up, None to disable the gap detection
+        :type gapTimeout: float
+        :param invalidateCache: evict the cached entities and queries altered by the events (cf Shotgun.invalidate_from_events)
+        :type invalidateCache: bool
+    '''
+
+    fields = ['id', 'event_type', 'entity', 'attribute_name', 'meta', 'created_at',
+              'user', 'project', 'session_uuid', 'description']
+
+    def __init__(self, shotgun, checkpointPath=None, startId=None, batchSize=100, pageSize=500,
+                 minInterval=1.0, maxInterval=30.0, gapTimeout=60.0, invalidateCache=True):
+        self.shotgun = shotgun
+        self.checkpointPath = checkpointPath
+        self.batchSize = batchSize
+        self.pageSize = pageSize
+        self.minInterval = minInterval
+        self.maxInterval = maxInterval
+        self.gapTimeout = gapTimeout
+        self.invalidateCache = invalidateCache
+
+        self.interval = minInterval
+        self._callbacks = []
+        self._stop = threading.Event()
+        self._stats = {'polls': 0, 'requests': 0, 'events': 0, 'batches': 0,
+                       'gapsDetected': 0, 'gapsFilled': 0, 'gapsExpired': 0}
+
+        # missing id -> time it was detected
+        self._gaps = {}
+        self._lastId = None
+
+        checkpoint = self._load_checkpoint()
+        if checkpoint is not None:
+            self._lastId = checkpoint['last_id']
+            self._gaps = dict((int(i), t) for i, t in checkpoint.get('gaps', {}).items())
+        elif startId is not None:
+            self._lastId = startId
+
+    @property
+    def last_id(self):
+        ''' Id of the last event read, None until the first poll if the tailer starts from the newest event '''
+        return self._lastId
+
+    def add_callback(self, callback):
+        ''' Add a callable called with every batch of events (list of dict, in id order) '''
+        self._callbacks.append(callback)
+
+    def remove_callback(self, callback):
+        self._callbacks.remove(callback)
+
+    ##
+    # checkpoint
+
+    def _load_checkpoint(self):
+        if not self.checkpointPath:
+            return None
+        try:
+            with open(self.checkpointPath) as f:
+                checkpoint = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+        if not isinstance(checkpoint, dict) or not isinstance(checkpoint.get('last_id'), int):
+            return None
+        return checkpoint
+
+    def save_checkpoint(self):
+        ''' Atomically write the last id and the gaps to the checkpoint file '''
+        if not self.checkpointPath or self._lastId is None:
+            return
+
+        folder = os.path.dirname(os.path.abspath(self.checkpointPath))
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+
+        fd, tmpPath = tempfile.mkstemp(dir=folder, prefix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'last_id': self._lastId,
+                           'gaps': dict((str(i), t) for i, t in self._gaps.items())}, f)
+            os.chmod(tmpPath, 0o644)
+            os.rename(tmpPath, self.checkpointPath)
+        except:
+            if os.path.exists(tmpPath):
+                os.remove(tmpPath)
+            raise
+
+    ##
+    # polling
+
+    def _find(self, filters, limit=0):
+        self._stats['requests'] += 1
+        return self.shotgun.sg_find('EventLogEntry', filters, self.fields,
+                                    order=[{'field_name': 'id', 'direction': 'asc'}], limit=limit)
+
+    def _newest_id(self):
+        self._stats['requests'] += 1
+        event = self.shotgun.sg_find_one('EventLogEntry', [], ['id'],
+                                         order=[{'field_name': 'id', 'direction': 'desc'}])
+        return event['id'] if event else 0
+
+    def _fetch_gaps(self):
+        ''' Return the events committed since their id was skipped, and give up the expired gaps.
+            The gaps of the returned events are only filled once they are dispatched.
+        '''
+        if not self._gaps:
+            return []
+
+        events = []
+        gapIds = sorted(self._gaps)
+        for i in range(0, len(gapIds), self.pageSize):
+            events.extend(self._find([['id', 'in', gapIds[i:i + self.pageSize]]]))
+
+        found = set(event['id'] for event in events)
+        now = time.time()
+        expired = [gapId for gapId, detected in self._gaps.items()
+                   if gapId not in found and now - detected > self.gapTimeout]
+        for gapId in expired:
+            del self._gaps[gapId]
+        self._stats['gapsExpired'] += len(expired)
+
+        if expired and not events:
+            self.save_checkpoint()
+
+        return events
+
+    def _record_gaps(self, events):
+        ''' Record the ids skipped between the last id and the new events '''
+        if self.gapTimeout is None:
+            return
+
+        now = time.time()
+        expected = self._lastId + 1
+        for event in events:
+            # a jump larger than a page is not a transaction in flight (ie ids burnt by a restore)
+            if event['id'] - expected > self.pageSize:
+                expected = event['id']
+            for missingId in range(expected, event['id']):
+                self._gaps[missingId] = now
+                self._stats['gapsDetected'] += 1
+            expected = max(expected, event['id'] + 1)
+
+    def poll(self):
+        ''' Fetch the new events and the late events of the gaps, and dispatch them
+
+        :return: the dispatched events
+        :rtype: list of dict
+        '''
+        self._stats['polls'] += 1
+
+        if self._lastId is None:
+            self._lastId = self._newest_id()
+            self.save_checkpoint()
+            return []
+
+        dispatched = []
+
+        lateEvents = self._fetch_gaps()
+        if lateEvents:
+            self._dispatch(lateEvents, late=True)
+            dispatched.extend(lateEvents)
+
+        while True:
+            events = self._find([['id', 'greater_than', self._lastId]], limit=self.pageSize)
+            if not events:
+                break
+
+            self._dispatch(events)
+            dispatched.extend(events)
+
+            if len(events) < self.pageSize or self._stop.is_set():
+                break
+
+        if dispatched:
+            self.interval = self.minInterval
+        else:
+            self.interval = min(self.maxInterval, self.interval * 2)
+
+        return dispatched
+
+    def _dispatch(self, events, late=False):
+        ''' Invalidate the caches altered by events and call the callbacks batch by batch.
+            The last id and the gaps only move once the callbacks of a batch succeeded,
+            and are checkpointed after every batch.
+        '''
+        for i in range(0, len(events), self.batchSize):
+            batch = events[i:i + self.batchSize]
+
+            if self.invalidateCache:
+                self.shotgun.invalidate_from_events(batch)
+
+            for callback in self._callbacks:
+                callback(batch)
+
+            self._stats['batches'] += 1
+            self._stats['events'] += len(batch)
+
+            # late events of the gaps are older than the last id
+            if late:
+                for event in batch:
+                    self._gaps.pop(event['id'], None)
+                self._stats['gapsFilled'] += len(batch)
+            else:
+                self._record_gaps(batch)
+                self._lastId = batch[-1]['id']
+            self.save_checkpoint()
+
+    def run(self, maxPolls=None):
+        ''' Poll until stop is called (or maxPolls polls were done), sleeping the adaptive interval between polls '''
+        self._stop.clear()
+        polls = 0
+        while not self._stop.is_set():
+            self.poll()
+            polls += 1
+            if maxPolls is not None and polls >= maxPolls:
+                break
+            self._stop.wait(self.interval)
+
+    def stop(self):
+        ''' Stop run, from a callback or another thread '''
+        self._stop.set()
+
+    def stats(self):
+        ''' Return the tailer counters
+
+        :return:
+            * polls / requests: number of polls and of requests sent
+            * events / batches: number of dispatched events and callback batches
+            * gapsDetected / gapsFilled / gapsExpired: number of skipped ids, of late events
+              found for them, and of skipped ids given up
+            * gaps: number of skipped ids still waited for
+            * lastId / interval: last id read and current poll interval
+        :rtype: dict
+        '''
+        stats = dict(self._stats)
+        stats['gaps'] = len(self._gaps)
+        stats['lastId'] = self._lastId
+        stats['interval'] = self.interval
+        return stats
@@ -0,0 +1,376 @@
+import threading
+import time
+
+from contextlib import contextmanager
+
+
+def clone_connection(sg):
+    ''' Open a new connection to the server of a shotgun_api3.Shotgun instance
+
+    The new connection is built with the same auth (script, user or session token), sudo
+    login, proxy, certificates and JSON decoding as the given one, then gets a copy of its
+    config (cf copy_connection_config). It connects to the server on its first request.
+
+    :param sg: connection to clone, not wrapped
+    :type sg: shotgun_api3.Shotgun
+
+    :return: the new connection
+    :rtype: shotgun_api3.Shotgun
+
+    .. note:: The connection is built by the class of sg: give the Shotgun handle a
+              connectionFactory if that class takes other constructor arguments
+    '''
+
+    config = sg.config
+    kwargs = {'convert_datetimes_to_utc': config.convert_datetimes_to_utc,
+              'connect': False,
+              # private in shotgun_api3: set by its constructor, ensure_ascii as an instance attribute
+              'ca_certs': getattr(sg, '_Shotgun__ca_certs', None),
+              'ensure_ascii': '_json_loads' in vars(sg)}
+
+    proxyServer = getattr(config, 'proxy_server', None)
+    if proxyServer:
+        proxy = proxyServer
+        if getattr(config, 'proxy_port', None):
+            proxy = '%s:%s' % (proxy, config.proxy_port)
+        if getattr(config, 'proxy_user', None):
+            proxy = '%s:%s@%s' % (config.proxy_user, config.proxy_pass, proxy)
+        kwargs['http_proxy'] = proxy
+
+    if getattr(config, 'session_token', None):
+        kwargs['session_token'] = config.session_token
+    elif config.script_name:
+        kwargs['script_name'] = config.script_name
+        kwargs['api_key'] = config.api_key
+    else:
+        kwargs['login'] = getattr(config, 'user_login', None)
+        kwargs['password'] = getattr(config, 'user_password', None)
+
+    if getattr(config, 'sudo_as_login', None):
+        kwargs['sudo_as_login'] = config.sudo_as_login
+
+    clone = type(sg)(sg.base_url, **kwargs)
+    copy_connection_config(sg, clone)
+    return clone
+
+
+def copy_connection_config(source, target):
+    ''' Copy the config of a shotgun_api3.Shotgun instance to another one: auth, session uuid,
+    timeout, number of attempts, proxy, ssl validation...
+
+    :param source: connection the config is read from, not wrapped
+    :type source: shotgun_api3.Shotgun
+    :param target: connection the config is written to, not wrapped
+    :type target: shotgun_api3.Shotgun
+    '''
+    for name, value in vars(source.config).items():
+        # the config of recent api versions refers to its connection
+        if value is not source:
+            setattr(target.config, name, value)
+
+
+class ConnectionPool(object):
+    ''' Pool of connections to a Shotgun server, as shotgun_api3.Shotgun instances are not thread safe
+
+        A connection is only used by one thread at a time: check it out, use it, then give it
+        back. New connections are opened by the factory when no connection is idle, up to maxSize
+        connections, after which callers wait for a connection to be released.
+
+        The most recently released connection is reused first, so a single threaded user only
+        ever uses the primary connection.
+
+        If the factory fails, no other connection is opened: the callers share the opened ones,
+        waiting for them to be released.
+
+        :param factory: callable returning a new connection
+        :type factory: callable
+        :param maxSize: maximum number of connections, None for no limit
+        :type maxSize: int
+        :param primary: already opened connection, used first
+        :type primary: shotgun_api3.Shotgun
+    '''
+
+    def __init__(self, factory, maxSize=None, primary=None):
+        self.maxSize = maxSize
+        self.primary = primary
+        self._factory = factory
+        self._connections = []
+        self._idle = []
+        self._checkoutTimes = {}
+        # attributes set on every connection, opened or to be opened (cf set_attribute)
+        self._attributes = {}
+        self._condition = threading.Condition(threading.Lock())
+
+        self._created = time.time()
+        self._checkouts = 0
+        self._waits = 0
+        self._waitTime = 0.0
+        self._waitTimeMax = 0.0
+        self._busyTime = 0.0
+        self._inUse = 0
+        self._inUseMax = 0
+
+        if primary is not None:
+            self._connections.append(primary)
+            self._idle.append(primary)
+
+    def acquire(self):
+        ''' Check out a connection, waiting for one to be released if the pool is full
+
+        :return: the connection, to give back with release
+        :rtype: shotgun_api3.Shotgun
+        '''
+        start = time.time()
+
+        with self._condition:
+            if not self._idle and self._full():
+                self._waits += 1
+                while not self._idle and self._full():
+                    self._condition.wait()
+
+            now = time.time()
+            if self._idle:
+                connection = self._idle.pop()
+                self._checkoutTimes[id(connection)] = now
+            else:
+                # reserve the slot, the connection is opened outside of the lock
+                connection = None
+                self._connections.append(None)
+
+            waitTime = now - start
+            self._waitTime += waitTime
+            if waitTime > self._waitTimeMax:
+                self._waitTimeMax = waitTime
+            self._checkouts += 1
+            self._inUse += 1
+            if self._inUse > self._inUseMax:
+                self._inUseMax = self._inUse
+
+        if connection is not None:
+            return connection
+
+        try:
+            connection = self._factory()
+        except Exception:
+            with self._condition:
+                self._connections.remove(None)
+                self._inUse -= 1
+                self._checkouts -= 1
+                self._condition.notify()
+                if not self._connections:
+                    raise
+                # the connections cannot be cloned (ie a connection class taking other arguments):
+                # share the opened ones from now on
+                self.maxSize = len(self._connections)
+            return self.acquire()
+        except:
+            with self._condition:
+                self._connections.remove(None)
+                self._inUse -= 1
+                self._condition.notify()
+            raise
+
+        with self._condition:
+            for name, value in self._attributes.items():
+                setattr(connection, name, value)
+            self._connections[self._connections.index(None)] = connection
+            self._checkoutTimes[id(connection)] = time.time()
+        return connection
+
+    def _full(self):
+        return self.maxSize is not None and len(self._connections) >= self.maxSize
+
+    def release(self, connection):
+        ''' Give back a connection checked out with acquire '''
+        with self._condition:
+            self._busyTime += time.time() - self._checkoutTimes.pop(id(connection))
+            self._inUse -= 1
+            self._idle.append(connection)
+            self._condition.notify()
+
+    @contextmanager
+    def checkout(self):
+        ''' Context manager checking out a connection
+
+            >>> with pool.checkout() as connection:
+            ...     connection.find_one('Shot', [])
+        '''
+        connection = self.acquire()
+        try:
+            yield connection
+        finally:
+            self.release(connection)
+
+    def set_attribute(self, name, value):
+        ''' Set an attribute on every connection, including the ones opened later '''
+        with self._condition:
+            self._attributes[name] = value
+            for connection in self._connections:
+                if connection is not None:
+                    setattr(connection, name, value)
+
+    def connections(self):
+        ''' Return every opened connection, idle or checked out '''
+        with self._condition:
+            return [c for c in self._connections if c is not None]
+
+    def stats(self):
+        ''' Return the pool metrics
+
+        :return:
+            * size: number of opened connections
+            * maxSize: maximum number of connections
+            * inUse / inUseMax: number of connections currently / at most checked out at the same time
+            * checkouts: number of checkouts
+            * waits: number of checkouts which waited for a connection to be released
+            * waitTime / waitTimeMax: total / maximum number of seconds spent waiting for a connection
+            * busyTime: total number of seconds connections were checked out
+            * utilization: ratio of the time connections were checked out since the pool creation
+        :rtype: dict
+        '''
+        with self._condition:
+            size = len(self._connections)
+            elapsed = time.time() - self._created
+            capacity = (self.maxSize or size or 1) * elapsed
+            return {'size': size,
+                    'maxSize': self.maxSize,
+                    'inUse': self._inUse,
+                    'inUseMax': self._inUseMax,
+                    'checkouts': self._checkouts,
+                    'waits': self._waits,
+                    'waitTime': self._waitTime,
+                    'waitTimeMax': self._waitTimeMax,
+                    'busyTime': self._busyTime,
+                    'utilization': self._busyTime / capacity if capacity else 0.0}
+
+
+def iter_pages_parallel(fetchPage, pageSize, workers, pool):
+    ''' Fetch the pages of a query concurrently, and yield them in order
+
+    Each worker thread fetches the next page not yet requested, on a connection checked out
+    from the pool for this page, until a page has less than pageSize results. At most
+    2 * workers pages are fetched ahead of the consumer, to keep memory bounded.
+
+    :param fetchPage: callable(connection, page) returning the rows of a page, starting at 1
+    :type fetchPage: callable
+    :param pageSize: number of rows per page
+    :type pageSize: int
+    :param workers: number of concurrent requests
+    :type workers: int
+    :param pool: pool the worker connections are checked out from
+    :type pool: :class:`ConnectionPool`
+
+    :return: iterator over the pages rows
+    :rtype: iterator of list
+    '''
+
+    condition = threading.Condition()
+    state = {'next': 1, 'last': None, 'consumed': 0, 'stop': False, 'error': None}
+    pages = {}
+
+    def work():
+        while True:
+            with condition:
+                while (not state['stop']
+                       and state['next'] - state['consumed'] > 2 * workers):
+                    condition.wait()
+
+                if state['stop'] or (state['last'] is not None and state['next'] > state['last']):
+                    return
+
+                page = state['next']
+                state['next'] += 1
+
+            try:
+                with pool.checkout() as connection:
+                    rows = fetchPage(connection, page)
+            except Exception as e:
+                with condition:
+                    state['error'] = state['error'] or e
+                    state['stop'] = True
+                    condition.notify_all()
+                return
+
+            with condition:
+                pages[page] = rows
+                if len(rows) < pageSize and (state['last'] is None or page < state['last']):
+                    state['last'] = page
+                condition.notify_all()
+
+    threads = [threading.Thread(target=work) for _ in range(workers)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    try:
+        page = 1
+        while True:
+            with condition:
+                while page not in pages and state['error'] is None:
+                    condition.wait()
+
+                if page not in pages:
+                    raise state['error']
+
+                rows = pages.pop(page)
+                state['consumed'] = page
+                condition.notify_all()
+
+            yield rows
+
+            if page == state['last']:
+                break
+            page += 1
+
+    finally:
+        with condition:
+            state['stop'] = True
+            condition.notify_all()
+        for thread in threads:
+            thread.join()
+
+
+def map_parallel(func, items, workers, pool):
+    ''' Call func(connection, item) for every item concurrently, each call on a connection
+    checked out from the pool
+
+    :param func: callable(connection, item)
+    :type func: callable
+    :param items: arguments of the calls
+    :type items: list
+    :param workers: number of concurrent calls
+    :type workers: int
+    :param pool: pool the connections are checked out from
+    :type pool: :class:`ConnectionPool`
+
+    :return: (result, exception) of every call, in the order of the items. A failing call
+             does not stop the others, its result is None
+    :rtype: list of tuple
+    '''
+
+    outcomes = [None] * len(items)
+    lock = threading.Lock()
+    state = {'next': 0}
+
+    def work():
+        while True:
+            with lock:
+                index = state['next']
+                if index >= len(items):
+                    return
+                state['next'] += 1
+
+            try:
+                with pool.checkout() as connection:
+                    outcomes[index] = (func(connection, items[index]), None)
+            except Exception as e:
+                outcomes[index] = (None, e)
+
+    threads = [threading.Thread(target=work) for _ in range(min(workers, len(items)))]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return outcomes
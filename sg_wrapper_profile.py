@@ -0,0 +1,148 @@
+import os
+import sys
+import threading
+
+
+def get_call_site(ignoredModules=('sg_wrapper', 'threading', 'concurrent')):
+    ''' Return the call site of the first frame of the stack outside of sg_wrapper
+
+    :param ignoredModules: prefixes of the module names whose frames are skipped
+    :type ignoredModules: tuple
+
+    :return: 'path/to/script.py:line (function)', or None if every frame is ignored
+    :rtype: str
+    '''
+    frame = sys._getframe(1)
+    while frame is not None:
+        if not frame.f_globals.get('__name__', '').startswith(ignoredModules):
+            code = frame.f_code
+            return '%s:%d (%s)' % (os.path.abspath(code.co_filename), frame.f_lineno, code.co_name)
+        frame = frame.f_back
+    return None
+
+
+class AccessProfiler(object):
+    ''' Record how the entities queried through a sg_wrapper.Shotgun handle are used
+
+        For every call site issuing a query and every queried entity type, the profiler counts:
+            * the queries and the rows they returned
+            * the fields fetched and the fields actually read on the resulting entities
+            * the reloads issued to fetch a field which was not fetched
+            * the link fields resolved one request at a time
+
+        Reads, reloads and link resolutions are attributed to the call site of the query which
+        built the entity, so the report tells which query to change.
+
+        :param linkThreshold: number of follow-up link queries from which a link field is
+                              recommended for prefetching
+        :type linkThreshold: int
+    '''
+
+    def __init__(self, linkThreshold=10):
+        self.linkThreshold = linkThreshold
+        self._sites = {}
+        self._lock = threading.Lock()
+
+    def _record(self, site, entityType):
+        key = (site, entityType)
+        record = self._sites.get(key)
+        if record is None:
+            record = {'queries': 0,
+                      'rows': 0,
+                      'fieldsFetched': set(),
+                      'fieldsRead': set(),
+                      'reloads': {},
+                      'linkQueries': {}}
+            self._sites[key] = record
+        return record
+
+    def record_query(self, entityType, fields, rowCount):
+        ''' Record a query issued from the current call site '''
+        with self._lock:
+            record = self._record(get_call_site(), entityType)
+            record['queries'] += 1
+            record['rows'] += rowCount
+            record['fieldsFetched'].update(fields or ['id'])
+
+    def record_read(self, entity, fieldName):
+        with self._lock:
+            self._record(entity._profile_site, entity._entity_type)['fieldsRead'].add(fieldName)
+
+    def record_reload(self, entity, fieldName):
+        with self._lock:
+            reloads = self._record(entity._profile_site, entity._entity_type)['reloads']
+            reloads[fieldName] = reloads.get(fieldName, 0) + 1
+
+    def record_link_queries(self, entity, fieldName, count=1):
+        with self._lock:
+            linkQueries = self._record(entity._profile_site, entity._entity_type)['linkQueries']
+            linkQueries[fieldName] = linkQueries.get(fieldName, 0) + count
+
+    def clear(self):
+        with self._lock:
+            self._sites.clear()
+
+    def report(self):
+        ''' Return the profile of every call site and entity type, the most wasteful first
+
+        :return: list of dict with the keys
+            * site / entityType: call site of the queries and queried entity type
+            * queries / rows: number of queries and of rows returned
+            * fieldsFetched / fieldsRead: sorted fields fetched and read
+            * reloads: number of reloads per missing field
+            * linkQueries: number of follow-up link queries per link field
+            * recommendedFields: fields to fetch instead (read, including the reloaded ones)
+            * recommendedIncludes: link fields to prefetch with the include argument of find_entity
+        :rtype: list
+        '''
+        with self._lock:
+            entries = []
+            for (site, entityType), record in self._sites.items():
+                fieldsRead = record['fieldsRead'] | set(record['reloads'])
+                entries.append({'site': site,
+                                'entityType': entityType,
+                                'queries': record['queries'],
+                                'rows': record['rows'],
+                                'fieldsFetched': sorted(record['fieldsFetched']),
+                                'fieldsRead': sorted(record['fieldsRead']),
+                                'reloads': dict(record['reloads']),
+                                'linkQueries': dict(record['linkQueries']),
+                                'recommendedFields': sorted(fieldsRead),
+                                'recommendedIncludes': sorted(f for f, n in record['linkQueries'].items()
+                                                              if n >= self.linkThreshold)})
+
+        def cost(entry):
+            return (sum(entry['reloads'].values()) + sum(entry['linkQueries'].values()),
+                    len(entry['fieldsFetched']) - len(entry['fieldsRead']))
+
+        entries.sort(key=cost, reverse=True)
+        return entries
+
+    def format_report(self):
+        ''' Return the report as text, one line per call site and entity type '''
+        lines = []
+        for entry in self.report():
+            line = '%s: %d queries on %s fetched %d fields but read %d' % (
+                entry['site'], entry['queries'], entry['entityType'],
+                len(entry['fieldsFetched']), len(entry['fieldsRead']))
+
+            reloads = sum(entry['reloads'].values())
+            if reloads:
+                line += '; %d reloads for missing fields (%s)' % (reloads, ', '.join(sorted(entry['reloads'])))
+
+            for fieldName, count in sorted(entry['linkQueries'].items()):
+                line += "; %d follow-up link queries on '%s'" % (count, fieldName)
+
+            lines.append(line)
+        return '\n'.join(lines)
+
+    # pickle support: locks can not be pickled
+
+    def __getstate__(self):
+        odict = self.__dict__.copy()
+        del odict['_lock']
+        return odict
+
+    def __setstate__(self, adict):
+        self.__dict__.update(adict)
+        self._lock = threading.Lock()
@@ -0,0 +1,241 @@
+import threading
+
+
+def compile_projection(shotgun, entityType, spec):
+    ''' Compile a nested field projection to Shotgun's dotted field names, for a single request
+
+    A projection maps field names to:
+        * None: the field is fetched
+        * a list of field names: fetched on the entities linked by the field
+        * a dict: nested projection on the entities linked by the field
+
+    As a link may point to several entity types, the fields of a linked entity are requested for
+    every valid type of the link having them. The dict form of a nested projection can instead
+    be keyed by the linked entity types, to give a projection per type.
+
+        >>> compile_projection(sg, 'Version', {'code': None, 'entity': {'Shot': {'code': None, 'sg_sequence': ['code']}}})[0]
+        ['code', 'entity', 'entity.Shot.code', 'entity.Shot.sg_sequence', 'entity.Shot.sg_sequence.Sequence.code']
+
+    :param shotgun: handle used to read the schema
+    :type shotgun: :class:`~sg_wrapper.Shotgun`
+    :param entityType: real type of the queried entities
+    :type entityType: str
+    :param spec: nested projection
+    :type spec: dict
+
+    :return: (fields, tree), the fields to request and the tree of links to rebuild with rebuild_links
+    :rtype: (list, dict)
+
+    :raise: ValueError if a nested projection is given for a field which is not a single entity link
+    '''
+
+    fields = []
+    tree = _compile(shotgun, entityType, spec, '', fields)
+    return (fields, tree)
+
+
+def _compile(shotgun, entityType, spec, prefix, fields):
+    ''' Append the dotted fields of a projection to fields and return its tree:
+        {'links': {field: {linked type: tree}}}
+    '''
+
+    if not isinstance(spec, dict):
+        spec = dict.fromkeys(spec)
+
+    entityFields = shotgun.get_entity_fields(entityType)
+    tree = {'links': {}}
+
+    for fieldName in sorted(spec):
+        subSpec = spec[fieldName]
+        fields.append(prefix + fieldName)
+
+        if subSpec is None:
+            continue
+
+        fieldSchema = entityFields.get(fieldName)
+        if not fieldSchema or fieldSchema['data_type']['value'] != 'entity':
+            raise ValueError("Field '%s' of '%s' is not a single entity link, its fields can not be projected"
+                             % (fieldName, entityType))
+
+        validTypes = fieldSchema.get('properties', {}).get('valid_types', {}).get('value') or []
+
+        if isinstance(subSpec, dict) and subSpec and all(k in validTypes for k in subSpec):
+            specByType = subSpec
+        else:
+            if not isinstance(subSpec, dict):
+                subSpec = dict.fromkeys(subSpec)
+
+            # only project on the linked types having at least one of the requested fields
+            specByType = {}
+            for linkedType in validTypes:
+                try:
+                    linkedFields = shotgun.get_entity_fields(linkedType)
+                except Exception:
+                    continue
+                typeSpec = dict((k, v) for k, v in subSpec.items() if k in linkedFields)
+                if typeSpec:
+                    specByType[linkedType] = typeSpec
+
+        links = {}
+        for linkedType in sorted(specByType):
+            links[linkedType] = _compile(shotgun, linkedType, specByType[linkedType],
+                                         '%s%s.%s.' % (prefix, fieldName, linkedType), fields)
+        tree['links'][fieldName] = links
+
+    return tree
+
+
+def rebuild_links(shotgun, row, tree):
+    ''' Rebuild the linked entities of a row fetched with the fields of compile_projection
+
+    The dotted fields are removed from the row, and every link dict of the projection gets an
+    'entity' key holding the linked sg_wrapper.Entity, registered in the entity cache (or
+    updated with the fetched values if it was already cached).
+
+    :param shotgun: handle the linked entities are attached to
+    :type shotgun: :class:`~sg_wrapper.Shotgun`
+    :param row: result of a find request
+    :type row: dict
+    :param tree: links tree returned by compile_projection
+    :type tree: dict
+    '''
+
+    _rebuild(shotgun, row, row, tree, '')
+
+    for key in [k for k in row if '.' in k]:
+        del row[key]
+
+
+def _rebuild(shotgun, row, fields, tree, prefix):
+    from sg_wrapper import Entity
+
+    for fieldName, links in tree['links'].items():
+        link = fields.get(fieldName)
+        if not isinstance(link, dict) or link.get('type') not in links:
+            continue
+
+        linkedType = link['type']
+        linkedTree = links[linkedType]
+        linkedPrefix = '%s%s.%s.' % (prefix, fieldName, linkedType)
+
+        linkedFields = {'type': linkedType, 'id': link['id']}
+        for key in row:
+            if key.startswith(linkedPrefix) and '.' not in key[len(linkedPrefix):]:
+                linkedFields[key[len(linkedPrefix):]] = row[key]
+
+        _rebuild(shotgun, row, linkedFields, linkedTree, linkedPrefix)
+
+        entity = shotgun._entities.get(linkedType, {}).get(link['id'])
+        if entity is None:
+            entity = Entity(shotgun, linkedType, linkedFields)
+        else:
+            for key, value in linkedFields.items():
+                if key not in entity._fields_changed:
+                    entity._fields[key] = value
+
+        link['entity'] = entity
+
+
+class DefaultProjection(object):
+    ''' Fields fetched by default per entity type, when a query does not give its fields
+
+        The default fields of a type are either set explicitly, or learned from the fields
+        actually read on its entities. Reading a field which was not fetched is a miss: the
+        field is loaded on demand, and the miss is counted so the projection can be tuned.
+
+        The learned fields of a type are only used once they are stable: every field is
+        fetched until warmup queries of the type ran without a new field being read on its
+        entities, so the fields first read after a query are not loaded one request at a time.
+
+        :param defaults: default fields per real entity type
+        :type defaults: dict
+        :param learn: learn the default fields of the types without explicit ones
+        :type learn: bool
+        :param warmup: number of queries without a new field read before the learned fields are used
+        :type warmup: int
+    '''
+
+    def __init__(self, defaults=None, learn=False, warmup=3):
+        self.learn = learn
+        self.warmup = warmup
+        self._defaults = {}
+        self._read = {}
+        self._misses = {}
+        # entity type -> number of queries since a new field was read on its entities
+        self._stableQueries = {}
+        self._lock = threading.Lock()
+
+        for entityType, fields in (defaults or {}).items():
+            self.set(entityType, fields)
+
+    def set(self, entityType, fields):
+        ''' Set the default fields of an entity type, None to fetch every field '''
+        if fields is None:
+            self._defaults.pop(entityType, None)
+        else:
+            self._defaults[entityType] = list(fields)
+
+    def get(self, entityType):
+        ''' Return the default fields of an entity type, or None to fetch every field '''
+        fields = self._defaults.get(entityType)
+        if fields is None and self.learn:
+            with self._lock:
+                if self._read.get(entityType) and self._stableQueries.get(entityType, 0) >= self.warmup:
+                    fields = sorted(self._read[entityType])
+        return fields
+
+    def record_query(self, entityType):
+        ''' Count a query of an entity type fetching its default fields, towards the warmup
+
+        .. note:: Only the queries of the user count (ie find_entity), not the requests sent
+                  to load the fields missing on its results
+        '''
+        if not self.learn or entityType in self._defaults:
+            return
+        with self._lock:
+            stableQueries = self._stableQueries.get(entityType, 0)
+            if self._read.get(entityType) and stableQueries < self.warmup:
+                self._stableQueries[entityType] = stableQueries + 1
+
+    def record_read(self, entityType, fieldName):
+        # special names looked up on an entity (ie __len__) are not fields
+        if fieldName.startswith('__'):
+            return
+        with self._lock:
+            read = self._read.setdefault(entityType, set())
+            if fieldName not in read:
+                read.add(fieldName)
+                self._stableQueries[entityType] = 0
+
+    def record_miss(self, entityType, fieldName):
+        with self._lock:
+            misses = self._misses.setdefault(entityType, {})
+            misses[fieldName] = misses.get(fieldName, 0) + 1
+
+    def read_fields(self):
+        ''' Return the fields read per entity type (only recorded when learning)
+
+        :rtype: dict
+        '''
+        with self._lock:
+            return dict((t, sorted(fields)) for t, fields in self._read.items())
+
+    def misses(self):
+        ''' Return the number of reads of a field which was not fetched, per entity type and field
+
+        :rtype: dict
+        '''
+        with self._lock:
+            return dict((t, dict(misses)) for t, misses in self._misses.items())
+
+    # pickle support: locks can not be pickled
+
+    def __getstate__(self):
+        odict = self.__dict__.copy()
+        del odict['_lock']
+        return odict
+
+    def __setstate__(self, adict):
+        self.__dict__.update(adict)
+        self.__dict__.setdefault('_stableQueries', {})
+        self._lock = threading.Lock()
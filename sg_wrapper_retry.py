@@ -0,0 +1,285 @@
+import random
+import socket
+import threading
+import time
+
+try:
+    import httplib
+except ImportError:
+    # python 3
+    import http.client as httplib
+
+
+class CircuitOpenError(Exception):
+    ''' Raised instead of sending a request while the circuit breaker of its server is open '''
+    pass
+
+
+def is_transport_error(error):
+    ''' Return whether an error means the server could not be reached or did not answer:
+        connection refused or reset, timeout, SSL error, name resolution failure, truncated
+        HTTP response...
+    '''
+    if isinstance(error, httplib.HTTPException):
+        return True
+    # the httplib2 vendored by the shotgun api (ie ServerNotFoundError)
+    if any(cls.__name__ == 'HttpLib2Error' for cls in type(error).__mro__):
+        return True
+    # socket.error is OSError under python 3: the errors on local files are not transport errors
+    return isinstance(error, socket.error) and getattr(error, 'filename', None) is None
+
+
+class CircuitBreaker(object):
+    ''' Fail fast while a server is down
+
+        After failureThreshold consecutive failed requests the circuit opens: requests fail
+        at once with CircuitOpenError for resetTimeout seconds. Then a single trial request
+        is let through (half open): the circuit closes if it succeeds, and opens again if
+        it fails.
+
+        RetryPolicy counts as failed the requests the server did not answer: the retried
+        connection errors, and the transport errors (cf is_transport_error). A call raising
+        another error (ie a Fault answered by the server) neither closes nor opens the circuit.
+
+        Use for_server to share a breaker between every handle of a process talking to the
+        same server.
+
+        :param failureThreshold: number of consecutive failures opening the circuit
+        :type failureThreshold: int
+        :param resetTimeout: number of seconds the circuit stays open
+        :type resetTimeout: float
+    '''
+
+    closed = 'closed'
+    open = 'open'
+    halfOpen = 'half-open'
+
+    _byServer = {}
+    _byServerLock = threading.Lock()
+
+    def __init__(self, failureThreshold=5, resetTimeout=30):
+        self.failureThreshold = failureThreshold
+        self.resetTimeout = resetTimeout
+        self.opened = 0
+        self.rejected = 0
+        self._failures = 0
+        self._openedAt = None
+        self._trialInFlight = False
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_server(cls, server, failureThreshold=5, resetTimeout=30):
+        ''' Return the breaker shared by the process for a server, created with the given settings '''
+        with cls._byServerLock:
+            breaker = cls._byServer.get(server)
+            if breaker is None:
+                breaker = cls._byServer[server] = cls(failureThreshold, resetTimeout)
+            return breaker
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self._openedAt is None:
+            return self.closed
+        if time.time() - self._openedAt < self.resetTimeout:
+            return self.open
+        return self.halfOpen
+
+    def allow(self):
+        ''' Return whether a request may be sent, counting it as the trial request when half open '''
+        with self._lock:
+            state = self._state()
+            if state == self.closed:
+                return True
+            if state == self.halfOpen and not self._trialInFlight:
+                self._trialInFlight = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._openedAt = None
+            self._trialInFlight = False
+
+    def release(self):
+        ''' End a request which proved the server neither up nor down (ie it was rejected by
+            the server, or failed before being sent), freeing the trial request if it was it
+        '''
+        with self._lock:
+            self._trialInFlight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trialInFlight or self._failures >= self.failureThreshold:
+                if self._openedAt is None or self._trialInFlight:
+                    self.opened += 1
+                self._openedAt = time.time()
+                self._trialInFlight = False
+
+    def stats(self):
+        ''' Return the state of the breaker, and the number of times it opened and of rejected requests
+
+        :rtype: dict
+        '''
+        with self._lock:
+            return {'state': self._state(),
+                    'consecutiveFailures': self._failures,
+                    'opened': self.opened,
+                    'rejected': self.rejected}
+
+
+class RetryPolicy(object):
+    ''' When and how long to wait before retrying a failed request
+
+        The sleep before the n-th retry is drawn uniformly between 0 and
+        min(maxSleep, initialSleep * multiplier ** (n - 1)) (full jitter), so the clients
+        failing at the same moment do not all retry at the same moment. No retry is attempted
+        once maxAttempts requests failed, or when its sleep would end after budget seconds
+        spent on the call.
+
+        The methods which are not idempotent (create, batch, upload...) are only retried when
+        the server answered 503 (unavailable): any other error may happen after the request
+        was processed, and retrying it could apply it twice.
+
+        A policy can be shared between connections: its statistics are then aggregated.
+
+        :param maxAttempts: maximum number of requests per call
+        :type maxAttempts: int
+        :param initialSleep: maximum number of seconds before the first retry
+        :type initialSleep: float
+        :param multiplier: growth factor of the maximum sleep between retries
+        :type multiplier: float
+        :param maxSleep: cap of the sleep between retries, None for no cap
+        :type maxSleep: float
+        :param budget: maximum number of seconds spent on a call, retries included, None for no limit
+        :type budget: float
+        :param jitter: draw the sleeps at random (full jitter), or sleep the maximum
+        :type jitter: bool
+        :param nonIdempotentMethods: methods only retried on 503 errors
+        :type nonIdempotentMethods: iterable
+        :param circuitBreaker: breaker failing fast while the server is down (cf CircuitBreaker.for_server)
+        :type circuitBreaker: :class:`CircuitBreaker`
+    '''
+
+    defaultNonIdempotentMethods = frozenset(['create', 'batch', 'upload', 'upload_thumbnail',
+                                             'upload_filmstrip_thumbnail', 'share_thumbnail',
+                                             'follow', 'note_thread_read'])
+
+    def __init__(self, maxAttempts=8, initialSleep=2, multiplier=2, maxSleep=60, budget=None,
+                 jitter=True, nonIdempotentMethods=None, circuitBreaker=None):
+        self.maxAttempts = maxAttempts
+        self.initialSleep = initialSleep
+        self.multiplier = multiplier
+        self.maxSleep = maxSleep
+        self.budget = budget
+        self.jitter = jitter
+        if nonIdempotentMethods is None:
+            nonIdempotentMethods = self.defaultNonIdempotentMethods
+        self.nonIdempotentMethods = frozenset(nonIdempotentMethods)
+        self.circuitBreaker = circuitBreaker
+
+        self._stats = {'calls': 0, 'retries': 0, 'failures': 0, 'notRetried': 0,
+                       'budgetExhausted': 0, 'sleepTime': 0.0}
+        self._lock = threading.Lock()
+
+    def sleep_duration(self, retry):
+        ''' Return the number of seconds to sleep before a retry, starting at 1 '''
+        ceiling = self.initialSleep * self.multiplier ** (retry - 1)
+        if self.maxSleep is not None:
+            ceiling = min(ceiling, self.maxSleep)
+        if self.jitter:
+            return random.uniform(0, ceiling)
+        return ceiling
+
+    def is_retryable(self, method, error):
+        ''' Return whether a request of a method failing with an error can be sent again '''
+        if method in self.nonIdempotentMethods:
+            return getattr(error, 'errcode', None) == 503
+        return True
+
+    def _count(self, key, value=1):
+        with self._lock:
+            self._stats[key] += value
+
+    def call(self, method, func, args, kwargs, exceptionType, printInfo=False):
+        ''' Call func(*args, **kwargs), retrying it on exceptionType errors according to the policy
+
+        :param method: name of the called method, to know whether it is idempotent
+        :type method: str
+
+        :raises CircuitOpenError: if the circuit breaker is open
+        '''
+        self._count('calls')
+        breaker = self.circuitBreaker
+        start = time.time()
+        attempt = 0
+
+        while True:
+            if breaker is not None and not breaker.allow():
+                raise CircuitOpenError('Shotgun server unavailable, %s not sent (circuit open)' % method)
+
+            attempt += 1
+            try:
+                res = func(*args, **kwargs)
+            except exceptionType as err:
+                if breaker is not None:
+                    breaker.record_failure()
+
+                if attempt >= self.maxAttempts:
+                    self._count('failures')
+                    raise
+
+                if not self.is_retryable(method, err):
+                    self._count('notRetried')
+                    raise
+
+                sleepDuration = self.sleep_duration(attempt)
+                if self.budget is not None and time.time() - start + sleepDuration > self.budget:
+                    self._count('budgetExhausted')
+                    raise
+
+                if printInfo:
+                    print('[shotgun] Connection error [%d/%d] - will retry in %.1fs: %s'
+                          % (attempt, self.maxAttempts, sleepDuration, str(err)))
+
+                self._count('retries')
+                self._count('sleepTime', sleepDuration)
+                time.sleep(sleepDuration)
+                continue
+
+            except Exception as err:
+                if breaker is not None:
+                    if is_transport_error(err):
+                        breaker.record_failure()
+                    else:
+                        breaker.release()
+                raise
+
+            if breaker is not None:
+                breaker.record_success()
+            return res
+
+    def stats(self):
+        ''' Return the retry statistics
+
+        :return:
+            * calls: number of calls
+            * retries: number of requests sent again
+            * failures: number of calls failing after maxAttempts requests
+            * notRetried: number of failed calls of non idempotent methods not retried
+            * budgetExhausted: number of calls given up as their time budget was spent
+            * sleepTime: total number of seconds slept before retrying
+            * circuit: statistics of the circuit breaker, if any
+        :rtype: dict
+        '''
+        with self._lock:
+            stats = dict(self._stats)
+        if self.circuitBreaker is not None:
+            stats['circuit'] = self.circuitBreaker.stats()
+        return stats
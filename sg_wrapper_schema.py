@@ -0,0 +1,290 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+
+# number of seconds after which an unpublished generation is swept: younger ones may still be written
+_sweepDelay = 3600
+
+
+def _utf8(data):
+    ''' Return decoded JSON with its unicode strings encoded in utf-8, as shotgun_api3 returns
+        them under python 2
+    '''
+    if isinstance(data, dict):
+        return dict((_utf8(k), _utf8(v)) for k, v in data.items())
+    if isinstance(data, list):
+        return [_utf8(v) for v in data]
+    if str is bytes and isinstance(data, unicode):
+        return data.encode('utf-8')
+    return data
+
+
+class EntityTypeRegistry(object):
+    ''' Index of the Shotgun entity types known by a sg_wrapper.Shotgun instance.
+
+        Every entity type is described by a single record::
+
+            {'type': 'CustomEntity23',
+             'name': 'EditingCut',            # display name (first registered name)
+             'names': ['EditingCut', ...],    # display name and remapTables aliases
+             'type_plural': 'CustomEntity23s',
+             'name_plural': 'EditingCuts',
+             'names_plural': ['EditingCuts', ...],
+             'fields': []}                    # field names, lazily filled by sg_wrapper.Shotgun
+
+        The type, the names and their plural forms are hashed to this record so a lookup
+        costs the same whatever the number of entity types in the schema.
+
+        Iterating over the registry yields the records in registration order.
+    '''
+
+    def __init__(self):
+        self._records = []
+        self._byType = {}
+        self._singular = {}
+        self._plural = {}
+
+    def register(self, entityType, name, typePlural, namePlural):
+        ''' Register a name for an entity type
+
+        :param entityType: real Shotgun type (ie CustomEntity23)
+        :type entityType: str
+        :param name: display name or alias of the type (ie EditingCut)
+        :type name: str
+        :param typePlural: plural form of entityType
+        :type typePlural: str
+        :param namePlural: plural form of name
+        :type namePlural: str
+
+        :return: the record of the entity type
+        :rtype: dict
+
+        .. note:: registering several names for the same type extends the existing record.
+                  When a name is already used by another type, the first registered type wins.
+        '''
+
+        record = self._byType.get(entityType)
+        if record is None:
+            record = {'type': entityType,
+                      'name': name,
+                      'names': [],
+                      'type_plural': typePlural,
+                      'name_plural': namePlural,
+                      'names_plural': [],
+                      'fields': []}
+            self._byType[entityType] = record
+            self._records.append(record)
+            self._singular.setdefault(entityType, record)
+            self._plural.setdefault(typePlural, record)
+
+        if name not in record['names']:
+            record['names'].append(name)
+            record['names_plural'].append(namePlural)
+            self._singular.setdefault(name, record)
+            self._plural.setdefault(namePlural, record)
+
+        return record
+
+    def get(self, entityType):
+        ''' Return the record matching a type, a name or one of their plural forms, or None '''
+        record = self._singular.get(entityType)
+        if record is None:
+            record = self._plural.get(entityType)
+        return record
+
+    def get_singular(self, entityType):
+        ''' Return the record matching a type or a name, or None '''
+        return self._singular.get(entityType)
+
+    def get_plural(self, entityType):
+        ''' Return the record matching the plural form of a type or a name, or None '''
+        return self._plural.get(entityType)
+
+    def get_type(self, entityType):
+        ''' Return the record of a real Shotgun type (ie CustomEntity23), or None '''
+        return self._byType.get(entityType)
+
+    def __iter__(self):
+        return iter(self._records)
+
+    def __len__(self):
+        return len(self._records)
+
+    def __contains__(self, entityType):
+        return self.get(entityType) is not None
+
+
+class SchemaCache(object):
+    ''' On-disk cache of the Shotgun schema, shared by every process of the host.
+
+        The cache is keyed by the server url and an optional schema version. Each server
+        has its own folder, holding generations of the schema::
+
+            <cacheDir>/<sha1(server, version)>/current                  -> generation name & creation time
+            <cacheDir>/<sha1(server, version)>/<generation>/entities     -> schema_entity_read() result
+            <cacheDir>/<sha1(server, version)>/<generation>/fields/<Type> -> schema_field_read(Type) result
+
+        Every file is written in JSON in a temporary file then renamed, and a generation is only
+        published by renaming the 'current' file, so concurrent readers never see a partial
+        write. Field schemas are loaded lazily, one entity type at a time.
+
+        Publishing a generation removes the previous one, and the generations no longer
+        published for an hour (ie left by a crashed process).
+
+        :param cacheDir: folder where the cache is stored
+        :type cacheDir: str
+        :param ttl: number of seconds a generation is valid, None to never expire
+        :type ttl: int
+        :param version: schema version, bump it to invalidate every cached generation at once
+        :type version: str
+    '''
+
+    def __init__(self, cacheDir, ttl=86400, version=None):
+        self.cacheDir = cacheDir
+        self.ttl = ttl
+        self.version = version
+
+    def _server_dir(self, server):
+        key = '%s\0%s' % (server, self.version)
+        return os.path.join(self.cacheDir, hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+    def _published(self, serverDir):
+        ''' Return the name and creation time of the published generation of a server
+            folder, expired or not, or (None, None)
+        '''
+        try:
+            with open(os.path.join(serverDir, 'current')) as f:
+                generation, created = f.read().split()
+            return generation, float(created)
+        except (IOError, OSError, ValueError):
+            return None, None
+
+    def _current_generation(self, server):
+        ''' Return the folder of the valid generation of a server, or None '''
+        serverDir = self._server_dir(server)
+        generation, created = self._published(serverDir)
+        if generation is None:
+            return None
+
+        if self.ttl is not None and time.time() - created > self.ttl:
+            return None
+
+        return os.path.join(serverDir, generation)
+
+    def _load(self, path):
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+        return _utf8(data) if str is bytes else data
+
+    def _dump(self, path, data):
+        folder = os.path.dirname(path)
+        fd, tmpPath = tempfile.mkstemp(dir=folder, prefix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(data, f)
+            os.chmod(tmpPath, 0o644)
+            os.rename(tmpPath, path)
+        except:
+            if os.path.exists(tmpPath):
+                os.remove(tmpPath)
+            raise
+
+    def read_entities(self, server):
+        ''' Return the cached schema_entity_read() result of a server, or None '''
+        generation = self._current_generation(server)
+        if generation is None:
+            return None
+        return self._load(os.path.join(generation, 'entities'))
+
+    def write_entities(self, server, entitySchema):
+        ''' Publish a new generation of the schema of a server, starting with its entity schema '''
+        serverDir = self._server_dir(server)
+        try:
+            if not os.path.isdir(serverDir):
+                os.makedirs(serverDir)
+        except OSError:
+            if not os.path.isdir(serverDir):
+                return
+
+        # expired or not, the previous generation is replaced
+        previousGeneration, _ = self._published(serverDir)
+
+        try:
+            generation = tempfile.mkdtemp(dir=serverDir, prefix='gen')
+            os.chmod(generation, 0o755)
+            os.mkdir(os.path.join(generation, 'fields'))
+            self._dump(os.path.join(generation, 'entities'), entitySchema)
+            self._publish(serverDir, os.path.basename(generation))
+        except (IOError, OSError):
+            return
+
+        if previousGeneration and previousGeneration != os.path.basename(generation):
+            shutil.rmtree(os.path.join(serverDir, previousGeneration), ignore_errors=True)
+        self._sweep(serverDir)
+
+    def _sweep(self, serverDir):
+        ''' Remove the generations of a server folder not published, once they are old enough
+            to not be written by another process anymore
+        '''
+        published, _ = self._published(serverDir)
+        try:
+            names = os.listdir(serverDir)
+        except OSError:
+            return
+
+        now = time.time()
+        for name in names:
+            path = os.path.join(serverDir, name)
+            if not name.startswith('gen') or name == published:
+                continue
+            try:
+                if now - os.path.getmtime(path) < _sweepDelay:
+                    continue
+            except OSError:
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+
+    def _publish(self, serverDir, generation):
+        ''' Atomically make a generation the current one '''
+        fd, tmpPath = tempfile.mkstemp(dir=serverDir, prefix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            f.write('%s %f' % (generation, time.time()))
+        os.chmod(tmpPath, 0o644)
+        os.rename(tmpPath, os.path.join(serverDir, 'current'))
+
+    def read_fields(self, server, entityType):
+        ''' Return the cached schema_field_read(entityType) result of a server, or None '''
+        generation = self._current_generation(server)
+        if generation is None:
+            return None
+        return self._load(os.path.join(generation, 'fields', entityType))
+
+    def write_fields(self, server, entityType, fields):
+        ''' Store the field schema of an entity type in the current generation of a server
+
+        .. note:: nothing is stored if the server has no valid generation
+        '''
+        generation = self._current_generation(server)
+        if generation is None:
+            return
+        try:
+            self._dump(os.path.join(generation, 'fields', entityType), fields)
+        except (IOError, OSError):
+            pass
+
+    def invalidate(self, server):
+        ''' Atomically invalidate the cached schema of a server '''
+        serverDir = self._server_dir(server)
+        generation, _ = self._published(serverDir)
+        try:
+            os.remove(os.path.join(serverDir, 'current'))
+        except OSError:
+            pass
+        if generation:
+            shutil.rmtree(os.path.join(serverDir, generation), ignore_errors=True)
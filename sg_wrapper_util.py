@@ -1,6 +1,29 @@
+import binascii
 import os
+import sys
 import warnings
 
+# folder -> folder containing package.py in it or its parents (or None), cf _find_package_folder
+_packageFolders = {}
+
+# absolute file path -> (filename, packageName), cf get_script_name_from_frame
+_scriptNames = {}
+
+# sg_wrapper handle built from the project's tank config, cf get_default_handle
+_defaultHandle = None
+
+
+def _iter_stack_frames():
+    ''' Yield the frames of the stack, from the caller to the oldest one, as lightweight
+        (None, filename, lineno, function) tuples matching the layout of inspect.stack records,
+        without reading any source line
+    '''
+    frame = sys._getframe(1)
+    while frame is not None:
+        code = frame.f_code
+        yield (None, code.co_filename, frame.f_lineno, code.co_name)
+        frame = frame.f_back
+
 def get_calling_script():
     ''' Retrieve the calling script name by exploring the stack.
         The following frames in the stack are ignored:
@@ -20,18 +43,15 @@ def get_calling_script():
         'pythonStandalone'
     '''
 
-    from inspect import stack
-    import sys
-
     try:
-        _stack = stack()
+        _stack = list(_iter_stack_frames())
     except:
         print("Warning: Can't extract stack")
         return None
 
     # find the last frame from a proper package
 
-    convertedStack = map(lambda frame: get_script_name_from_frame(frame), _stack)
+    convertedStack = [get_script_name_from_frame(frame) for frame in _stack]
 
     # cut everything after the first 'recurs_ignore' encountered - cf get_script_name_from_frame
     cut = len(convertedStack)
@@ -102,22 +122,56 @@ def get_script_name_from_frame(frame):
             or '<stdin>' == path):
         return (None, None)
 
+    # relative paths depend on the current directory, only absolute ones are memoized
+    isAbsolute = os.path.isabs(path)
+    if isAbsolute and path in _scriptNames:
+        return _scriptNames[path]
+
     filename = os.path.abspath(path)
 
     name = os.path.basename(filename)
     nameWithoutExtension = os.path.splitext(name)[0]
 
     # search for package.py in parent folders
-    lastFolder = filename
-    folder = os.path.dirname(filename)
-    while folder != lastFolder:
+    packageFolder = _find_package_folder(os.path.dirname(filename))
+    if packageFolder:
+        # folder contains package.py: it's the version folder
+        result = (nameWithoutExtension, os.path.basename(os.path.dirname(packageFolder)))
+    else:
+        result = (nameWithoutExtension, None)
+
+    if isAbsolute:
+        _scriptNames[path] = result
+    return result
+
+def _find_package_folder(folder):
+    ''' Return the first folder containing a package.py file among folder and its parents, or None
+
+    The result of every visited folder is memoized, so a folder is only checked once per process.
+    '''
+
+    visited = []
+    packageFolder = None
+
+    while True:
+        if folder in _packageFolders:
+            packageFolder = _packageFolders[folder]
+            break
+
+        visited.append(folder)
         if os.path.exists(os.path.join(folder, 'package.py')):
-            # folder contains package.py: it's the version folder
-            return (nameWithoutExtension, os.path.basename(os.path.dirname(folder)))
-        lastFolder = folder
-        folder = os.path.dirname(folder)
+            packageFolder = folder
+            break
 
-    return (nameWithoutExtension, None)
+        parent = os.path.dirname(folder)
+        if parent == folder:
+            break
+        folder = parent
+
+    for folder in visited:
+        _packageFolders[folder] = packageFolder
+
+    return packageFolder
 
 def get_user_from_event(eventId, sgw=None, onlyUsername=True):
     ''' Get the user that called the script causing an event
@@ -143,29 +197,7 @@ def get_user_from_event(eventId, sgw=None, onlyUsername=True):
     '''
 
     if not sgw:
-        import re
-        import sg_wrapper
-        import tank
-
-        if 'PROD' not in os.environ:
-            raise RuntimeError(("Impossible to initialize an sg_wrapper's shotgun handle"
-                                "without the PROD environment variable set"))
-
-        project = re.sub('\s+', '', os.environ['PROD']).upper()
-        projectEnv = 'PC_%s' % project
-
-        if projectEnv not in os.environ:
-            raise RuntimeError(("Impossible to initialize an sg_wrapper's shotgun handle"
-                                "without the %s environment variable set") % projectEnv)
-
-        try:
-            tk = tank.tank_from_path(os.environ[projectEnv])
-        except tank.TankError as e:
-            raise RuntimeError(("Impossible to initialize an sg_wrapper's shotgun handle"
-                                "as the tank handle could not be initiliazed: %s") % e.strerro)
-
-        sgw = sg_wrapper.Shotgun(sg=tk.shotgun)
-
+        sgw = get_default_handle()
 
     ev = sgw.sg_find_one('EventLogEntry', [['id', 'is', eventId]], ['session_uuid'])
 
@@ -194,6 +226,115 @@ def get_user_from_event(eventId, sgw=None, onlyUsername=True):
 
     return user
 
+def get_users_from_events(eventIds, sgw=None, onlyUsername=True, chunkSize=500):
+    ''' Get the users that called the scripts causing many events (cf get_user_from_event)
+
+    The events are fetched with one 'in' query per chunkSize ids, each distinct session uuid
+    is decoded once, and if onlyUsername is false, the distinct users are fetched with one
+    'in' query per chunkSize logins.
+
+    :param eventIds: ids of the events the users must be retrieved from
+    :type eventIds: iterable of int
+    :param sgw:
+        sg_wrapper handle.
+        If none is provided, the handle of get_default_handle is used.
+    :type sgw: sg_wrapper.Shotgun
+    :param onlyUsername: Only retrieves the usernames. If false, returns the users' sg_wrapper.Entity
+    :type onlyUsername: bool
+    :param chunkSize: maximum number of ids or logins per query
+    :type chunkSize: int
+
+    :return:
+        event id -> username (or sg_wrapper.Entity of the user if onlyUsername is false),
+        None if the user could not be retrieved. The events which do not exist are not in the dict.
+    :rtype: dict
+
+    :raise:
+        RuntimeError: if a sg_wrapper handle is not provided and its instantiation failed
+    '''
+
+    if not sgw:
+        sgw = get_default_handle()
+
+    eventIds = sorted(set(eventIds))
+
+    uuidByEvent = {}
+    for i in range(0, len(eventIds), chunkSize):
+        chunk = eventIds[i:i + chunkSize]
+        for ev in sgw.sg_find('EventLogEntry', [['id', 'in', chunk]], ['session_uuid']):
+            uuidByEvent[ev['id']] = ev['session_uuid']
+
+    # decode every distinct uuid once
+    usernameByUuid = {}
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        for _uuid in set(uuidByEvent.values()):
+            try:
+                usernameByUuid[_uuid] = uuid_to_string(_uuid) if _uuid else None
+            except ValueError:
+                usernameByUuid[_uuid] = None
+
+    users = dict((eventId, usernameByUuid[_uuid]) for eventId, _uuid in uuidByEvent.items())
+
+    undecoded = len([u for u in users.values() if u is None])
+    if undecoded:
+        warnings.warn('Unable to retrieve the user from %d EventLogEntry' % undecoded)
+
+    if onlyUsername:
+        return users
+
+    logins = sorted(set(u for u in users.values() if u))
+    userByLogin = {}
+    for i in range(0, len(logins), chunkSize):
+        for user in sgw.find_entity('HumanUser', login=('in', logins[i:i + chunkSize]), find_one=False):
+            # the login search is case insensitive
+            userByLogin[user.field('login').lower()] = user
+
+    missing = [login for login in logins if login.lower() not in userByLogin]
+    if missing:
+        warnings.warn('Could not find HumanUser with login in %s' % ', '.join(missing))
+
+    return dict((eventId, userByLogin.get(username.lower()) if username else None)
+                for eventId, username in users.items())
+
+def get_default_handle():
+    ''' Return a sg_wrapper handle built from the tank config of the current project
+        (PROD and PC_<PROD> environment variables). It is built once, then reused.
+
+    :rtype: sg_wrapper.Shotgun
+
+    :raise:
+        RuntimeError: if the handle instantiation failed
+    '''
+
+    global _defaultHandle
+    if _defaultHandle is not None:
+        return _defaultHandle
+
+    import re
+    import sg_wrapper
+    import tank
+
+    if 'PROD' not in os.environ:
+        raise RuntimeError(("Impossible to initialize an sg_wrapper's shotgun handle"
+                            "without the PROD environment variable set"))
+
+    project = re.sub(r'\s+', '', os.environ['PROD']).upper()
+    projectEnv = 'PC_%s' % project
+
+    if projectEnv not in os.environ:
+        raise RuntimeError(("Impossible to initialize an sg_wrapper's shotgun handle"
+                            "without the %s environment variable set") % projectEnv)
+
+    try:
+        tk = tank.tank_from_path(os.environ[projectEnv])
+    except tank.TankError as e:
+        raise RuntimeError(("Impossible to initialize an sg_wrapper's shotgun handle"
+                            "as the tank handle could not be initiliazed: %s") % e.strerro)
+
+    _defaultHandle = sg_wrapper.Shotgun(sg=tk.shotgun)
+    return _defaultHandle
+
 def string_to_uuid(_string):
     ''' Return an UUID string based on the input. Opposite of uuid_to_string.
 
@@ -217,7 +358,8 @@ def string_to_uuid(_string):
     # converted as hexadecimal, with trailing zeros
     # if the string is too long, we truncate it and set y='b', otherwise y='a'
 
-    _hex = _string.encode('hex')
+    data = _string if isinstance(_string, bytes) else _string.encode('utf-8')
+    _hex = binascii.hexlify(data).decode('ascii')
 
     isTruncated = len(_hex) > 30
     if isTruncated:
@@ -274,4 +416,8 @@ def uuid_to_string(_uuid):
     if _uuid[19] == 'b':
         warnings.warn('Warning: %s only encoded part of a string' % _uuid)
 
-    return _hex.decode('hex').rstrip('\x00')
+    _string = binascii.unhexlify(_hex).rstrip(b'\x00')
+    if not isinstance(_string, str):
+        # python 3
+        _string = _string.decode('utf-8', 'replace')
+    return _string
@@ -0,0 +1,23 @@
+''' Shared setup of the tests, run against the in-memory shotgun_api3 of this folder '''
+
+import shotgun_api3
+
+import sg_wrapper
+
+server = 'https://tests.shotgunstudio.com'
+
+
+def make_shotgun(records=None, **kwargs):
+    ''' Reset the in-memory server with records (entity type -> list of records),
+        and return a handle to it, without auth override
+    '''
+    shotgun_api3.reset(records)
+    kwargs.setdefault('disableApiAuthOverride', True)
+    kwargs.setdefault('printInfo', False)
+    sg = sg_wrapper.Shotgun(server, 'tests', 'key', **kwargs)
+    del shotgun_api3.CALLS[:]
+    return sg
+
+
+def link(entityType, entityId):
+    return {'type': entityType, 'id': entityId}
@@ -0,0 +1,313 @@
+''' In-memory stand-in for shotgun_api3, used by the tests
+
+    The records live in DB (entity type -> id -> record), shared by every Shotgun instance
+    so the connections cloned by the pool see the same data. Every request is appended to
+    CALLS as a (method, entity type) tuple, so tests can count the requests they cause.
+
+    Call reset() at the start of each test. The benchmarks set LATENCY to simulate the
+    round-trip of a real server.
+'''
+
+import copy
+import threading
+import time
+
+
+class ProtocolError(Exception):
+    def __init__(self, msg='Service Unavailable', errcode=503):
+        Exception.__init__(self, msg)
+        self.errcode = errcode
+
+
+class Fault(Exception):
+    pass
+
+
+class sg_timezone(object):
+    utc = None
+    local = None
+
+
+# entity type -> id -> record
+DB = {}
+
+# entity type -> id -> retired record
+RETIRED = {}
+
+# (method, entity type) of every request
+CALLS = []
+
+# number of seconds every request waits before being answered
+LATENCY = 0.0
+
+_lock = threading.Lock()
+
+ENTITY_TYPES = ['Shot', 'Asset', 'Sequence', 'Project', 'Version', 'Task', 'HumanUser', 'ApiUser',
+                'PermissionRuleSet', 'EventLogEntry', 'CustomEntity23', 'Cut']
+
+DISPLAY_NAMES = {'CustomEntity23': 'Editing Cut'}
+
+
+def _field(dataType, editable=True, validTypes=None):
+    properties = {}
+    if validTypes:
+        properties['valid_types'] = {'value': validTypes}
+    return {'data_type': {'value': dataType}, 'editable': {'value': editable}, 'properties': properties}
+
+
+COMMON_FIELDS = {
+    'id': _field('number', editable=False),
+    'code': _field('text'),
+    'description': _field('text'),
+    'sg_status_list': _field('status_list'),
+    'project': _field('entity', validTypes=['Project']),
+}
+
+EXTRA_FIELDS = {
+    'Shot': {'sg_sequence': _field('entity', validTypes=['Sequence']),
+             'assets': _field('multi_entity', validTypes=['Asset'])},
+    'Version': {'entity': _field('entity', validTypes=['Shot', 'Asset']),
+                'sg_task': _field('entity', validTypes=['Task']),
+                'user': _field('entity', validTypes=['HumanUser'])},
+    'Task': {'entity': _field('entity', validTypes=['Shot', 'Asset']),
+             'content': _field('text')},
+    'HumanUser': {'login': _field('text'),
+                  'firstname': _field('text'),
+                  'lastname': _field('text'),
+                  'email': _field('text')},
+    'ApiUser': {'firstname': _field('text'),
+                'lastname': _field('text'),
+                'salted_password': _field('text'),
+                'sg_public_password': _field('text'),
+                'permission_rule_set': _field('entity', validTypes=['PermissionRuleSet'])},
+    'EventLogEntry': dict((name, _field('text', editable=False))
+                          for name in ('event_type', 'attribute_name', 'meta', 'created_at',
+                                       'session_uuid', 'entity', 'user')),
+}
+
+
+def reset(db=None):
+    ''' Replace the records, and forget the retired records and the requests '''
+    DB.clear()
+    RETIRED.clear()
+    for entityType, records in (db or {}).items():
+        DB[entityType] = dict((r['id'], dict(r)) for r in records)
+    del CALLS[:]
+    Shotgun.failures = []
+
+
+def calls(method=None):
+    ''' Return the requests made since the last reset, only those of a method if given '''
+    return [c for c in CALLS if method is None or c[0] == method]
+
+
+def schema_fields(entityType):
+    fields = dict(COMMON_FIELDS)
+    fields.update(EXTRA_FIELDS.get(entityType, {}))
+    return copy.deepcopy(fields)
+
+
+def _value(record, fieldName):
+    value = record.get(fieldName)
+    if isinstance(value, dict) and 'id' in value:
+        return value['id']
+    return value
+
+
+def _ids(values):
+    return [v['id'] if isinstance(v, dict) else v for v in values]
+
+
+def _match(record, filters):
+    for fieldName, op, value in filters:
+        if op in ('type_is', 'type_is_not'):
+            linkType = (record.get(fieldName) or {}).get('type')
+            if (linkType == value) != (op == 'type_is'):
+                return False
+            continue
+
+        current = _value(record, fieldName)
+        if isinstance(value, dict) and 'id' in value:
+            value = value['id']
+
+        if op == 'is' and current != value:
+            return False
+        if op == 'is_not' and current == value:
+            return False
+        if op == 'in' and current not in _ids(value):
+            return False
+        if op == 'not_in' and current in _ids(value):
+            return False
+        if op == 'greater_than' and not (current is not None and current > value):
+            return False
+        if op == 'less_than' and not (current is not None and current < value):
+            return False
+    return True
+
+
+def _project(entityType, record, fields):
+    result = {'type': entityType, 'id': record['id']}
+    known = EXTRA_FIELDS.get(entityType, {})
+    for fieldName in fields or []:
+        if '.' in fieldName:
+            # deep link: link.Type.field
+            parts = fieldName.split('.')
+            current = record
+            while current is not None and len(parts) >= 3:
+                link = current.get(parts[0])
+                if not link or link['type'] != parts[1]:
+                    current = None
+                    break
+                current = DB.get(parts[1], {}).get(link['id'])
+                parts = parts[2:]
+            result[fieldName] = current.get(parts[0]) if current is not None else None
+        elif fieldName in record:
+            result[fieldName] = copy.deepcopy(record[fieldName])
+        elif fieldName in COMMON_FIELDS or fieldName in known:
+            result[fieldName] = None
+    return result
+
+
+class _Config(object):
+    def __init__(self, script_name, api_key, convert_datetimes_to_utc):
+        self.script_name = script_name
+        self.api_key = api_key
+        self.session_uuid = None
+        self.session_token = None
+        self.convert_datetimes_to_utc = convert_datetimes_to_utc
+        self.records_per_page = 500
+        self.proxy_server = None
+        self.timeout_secs = None
+
+
+class Shotgun(object):
+    ''' Connection to the in-memory server
+
+        :ivar failures: exceptions raised by the next requests, in order (shared by the clones
+                        of a connection through the class attribute, unless set on an instance)
+    '''
+
+    failures = []
+
+    def __init__(self, base_url, script_name=None, api_key=None, convert_datetimes_to_utc=True,
+                 http_proxy=None, ensure_ascii=True, connect=True, ca_certs=None, login=None,
+                 password=None, sudo_as_login=None, session_token=None, auth_token=None):
+        self.base_url = base_url
+        self.config = _Config(script_name, api_key, convert_datetimes_to_utc)
+        self.config.session_token = session_token
+        self.connected = connect
+        self.__ca_certs = ca_certs
+        if ensure_ascii:
+            self._json_loads = None
+
+    def _request(self, method, entityType=None):
+        with _lock:
+            CALLS.append((method, entityType))
+            failure = self.failures.pop(0) if self.failures else None
+        if LATENCY:
+            time.sleep(LATENCY)
+        if failure is not None:
+            raise failure
+
+    def set_session_uuid(self, session_uuid):
+        self.config.session_uuid = session_uuid
+
+    def schema_entity_read(self):
+        self._request('schema_entity_read')
+        return dict((t, {'name': {'value': DISPLAY_NAMES.get(t, t)}}) for t in ENTITY_TYPES)
+
+    def schema_field_read(self, entity_type):
+        self._request('schema_field_read', entity_type)
+        return schema_fields(entity_type)
+
+    def _rows(self, entityType, filters, order=None, retired_only=False):
+        records = (RETIRED if retired_only else DB).get(entityType, {}).values()
+        rows = sorted(records, key=lambda r: r['id'])
+        for sortKey in reversed(order or []):
+            rows.sort(key=lambda r: _value(r, sortKey['field_name']),
+                      reverse=sortKey.get('direction') == 'desc')
+        return [r for r in rows if _match(r, filters)]
+
+    def find(self, entity_type, filters, fields=None, order=None, filter_operator=None, limit=0,
+             retired_only=False, page=0, include_archived_projects=True, additional_filter_presets=None):
+        self._request('find', entity_type)
+        rows = self._rows(entity_type, filters, order, retired_only)
+        if limit:
+            start = (max(page, 1) - 1) * limit
+            rows = rows[start:start + limit]
+        else:
+            # the api reads every page, one request each
+            for _ in range(1, (len(rows) - 1) // self.config.records_per_page + 1):
+                self._request('find', entity_type)
+        return [_project(entity_type, r, fields) for r in rows]
+
+    def find_one(self, entity_type, filters, fields=None, order=None, filter_operator=None,
+                 retired_only=False, include_archived_projects=True, additional_filter_presets=None):
+        self._request('find_one', entity_type)
+        rows = self._rows(entity_type, filters, order, retired_only)
+        return _project(entity_type, rows[0], fields) if rows else None
+
+    def create(self, entity_type, data, return_fields=None):
+        self._request('create', entity_type)
+        return self._create(entity_type, data)
+
+    def _create(self, entityType, data):
+        records = DB.setdefault(entityType, {})
+        record = dict(data)
+        record['id'] = max(list(records.keys()) or [0]) + 1
+        records[record['id']] = record
+        result = dict(record)
+        result['type'] = entityType
+        return result
+
+    def update(self, entity_type, entity_id, data):
+        self._request('update', entity_type)
+        return self._update(entity_type, entity_id, data)
+
+    def _update(self, entityType, entityId, data):
+        if entityId not in DB.get(entityType, {}):
+            raise Fault('%s %s does not exist' % (entityType, entityId))
+        DB[entityType][entityId].update(data)
+        result = dict(data)
+        result.update(type=entityType, id=entityId)
+        return result
+
+    def delete(self, entity_type, entity_id):
+        self._request('delete', entity_type)
+        record = DB.get(entity_type, {}).pop(entity_id, None)
+        if record is None:
+            return False
+        RETIRED.setdefault(entity_type, {})[entity_id] = record
+        return True
+
+    def revive(self, entity_type, entity_id):
+        self._request('revive', entity_type)
+        record = RETIRED.get(entity_type, {}).pop(entity_id, None)
+        if record is None:
+            return False
+        DB.setdefault(entity_type, {})[entity_id] = record
+        return True
+
+    def batch(self, requests):
+        ''' Apply the requests in one transaction: nothing is applied if one of them fails '''
+        self._request('batch')
+        with _lock:
+            saved = copy.deepcopy(DB)
+            try:
+                results = []
+                for request in requests:
+                    if request['request_type'] == 'create':
+                        results.append(self._create(request['entity_type'], request['data']))
+                    elif request['request_type'] == 'update':
+                        results.append(self._update(request['entity_type'], request['entity_id'], request['data']))
+                    else:
+                        record = DB.get(request['entity_type'], {}).pop(request['entity_id'], None)
+                        results.append(record is not None)
+                return results
+            except Exception:
+                DB.clear()
+                DB.update(saved)
+                raise
+
+    def upload(self, entity_type, entity_id, path, field_name=None, display_name=None, tag_list=None):
+        self._request('upload', entity_type)
@@ -0,0 +1,122 @@
+import unittest
+
+import shotgun_api3
+
+from helpers import make_shotgun
+
+try:
+    import asyncio
+
+    import sg_wrapper_async
+except ImportError:
+    # the asyncio front-end is python 3 only
+    asyncio = None
+
+
+def shots(count=5):
+    return {'Shot': [{'id': i, 'code': 'sh%03d' % i, 'sg_status_list': 'ip'} for i in range(1, count + 1)]}
+
+
+class Call(object):
+    ''' Awaitable calling func in the running event loop, then awaiting the awaitable it returns
+
+        Lets the tests run the front-end with asyncio.run without the async syntax, which
+        python 2 can not compile
+    '''
+
+    def __init__(self, func):
+        self.func = func
+
+    def __await__(self):
+        return asyncio.ensure_future(self.func()).__await__()
+
+
+def run(func, timeout=10):
+    return asyncio.run(asyncio.wait_for(Call(func), timeout))
+
+
+def collect(iterator):
+    ''' Future of the items of an asynchronous iterator, the equivalent of [i async for i in iterator] '''
+    result = asyncio.get_running_loop().create_future()
+    items = []
+
+    def step(future=None):
+        if future is not None:
+            try:
+                items.append(future.result())
+            except StopAsyncIteration:
+                result.set_result(items)
+                return
+            except Exception as e:
+                result.set_exception(e)
+                return
+        asyncio.ensure_future(iterator.__anext__()).add_done_callback(step)
+
+    step()
+    return result
+
+
+@unittest.skipIf(asyncio is None, 'the asyncio front-end is python 3 only')
+class AsyncShotgunTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sg = make_shotgun(shots())
+        self.asg = sg_wrapper_async.AsyncShotgun(self.sg)
+
+    def tearDown(self):
+        self.asg.close()
+        shotgun_api3.LATENCY = 0.0
+
+    def test_find(self):
+        shot, found = run(lambda: asyncio.gather(self.asg.Shot(2), self.asg.Shots(sg_status_list='ip')))
+
+        self.assertEqual(shot.code, 'sh002')
+        self.assertEqual([s.code for s in found], ['sh%03d' % i for i in range(1, 6)])
+
+    def test_identical_queries_are_coalesced(self):
+        results = run(lambda: asyncio.gather(*[self.asg.Shots(sg_status_list='ip') for i in range(3)]))
+
+        self.assertEqual(len(shotgun_api3.calls('find')), 1)
+        self.assertEqual(self.asg.stats(), {'coalesced': 2, 'inFlight': 0})
+        self.assertTrue(all(r == results[0] for r in results))
+
+    def test_batch(self):
+        requests = [{'request_type': 'create', 'entity_type': 'Shot', 'data': {'code': 'sh006'}},
+                    {'request_type': 'update', 'entity_type': 'Shot', 'entity_id': 1,
+                     'data': {'sg_status_list': 'cmpt'}}]
+        results = run(lambda: self.asg.batch(requests))
+
+        self.assertEqual([r['type'] for r in results], ['Shot', 'Shot'])
+        self.assertEqual(shotgun_api3.DB['Shot'][1]['sg_status_list'], 'cmpt')
+        self.assertEqual(shotgun_api3.DB['Shot'][6]['code'], 'sh006')
+
+    def test_stream_is_an_async_iterator(self):
+        shotgun_api3.LATENCY = 0.02
+        ticks = []
+
+        def tick():
+            ticks.append(None)
+            asyncio.get_running_loop().call_later(0.005, tick)
+
+        def stream():
+            tick()
+            return collect(self.asg.Shots(stream=True, page_size=2))
+
+        found = run(stream)
+
+        self.assertEqual([s.code for s in found], ['sh%03d' % i for i in range(1, 6)])
+        self.assertEqual(len(shotgun_api3.calls('find')), 3)
+        # the loop kept running while the pages were fetched
+        self.assertGreater(len(ticks), 3)
+
+    def test_stream_errors_are_raised(self):
+        shotgun_api3.Shotgun.failures = [shotgun_api3.Fault('rejected')]
+        with self.assertRaises(shotgun_api3.Fault):
+            run(lambda: collect(self.asg.iter_entities('Shot')))
+
+    def test_requests_need_a_running_loop(self):
+        self.assertRaises(RuntimeError, self.asg.create, 'Shot', code='sh006')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+import os
+import shutil
+import stat
+import tempfile
+import threading
+import time
+import unittest
+
+from contextlib import contextmanager
+
+import shotgun_api3
+
+import sg_wrapper
+import sg_wrapper_auth
+from sg_wrapper_auth import AuthCache
+
+from helpers import make_shotgun, server
+
+
+class AuthCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, 'auth', 'cache.json')
+        self.cache = AuthCache(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_round_trip(self):
+        self.assertIsNone(self.cache.get(server, 'myScript'))
+
+        self.cache.put(server, 'myScript', 'MyScript', 'secret')
+
+        # the ApiUser search is case insensitive
+        self.assertEqual(self.cache.get(server, 'MYSCRIPT'), ('MyScript', 'secret'))
+        self.assertIsNone(self.cache.get('https://other.shotgunstudio.com', 'myScript'))
+
+    def test_expired_entries_are_misses(self):
+        self.cache.put(server, 'myScript', 'MyScript', 'secret')
+
+        self.assertIsNone(AuthCache(self.path, ttl=-1).get(server, 'myScript'))
+        self.assertIsNotNone(AuthCache(self.path, ttl=None).get(server, 'myScript'))
+
+    def test_invalidate(self):
+        for name in ('first', 'second'):
+            self.cache.put(server, name, name, 'secret')
+        self.cache.put('https://other.shotgunstudio.com', 'first', 'first', 'secret')
+
+        self.cache.invalidate(server, 'first')
+        self.assertIsNone(self.cache.get(server, 'first'))
+        self.assertIsNotNone(self.cache.get(server, 'second'))
+
+        self.cache.invalidate(server)
+        self.assertIsNone(self.cache.get(server, 'second'))
+        self.assertIsNotNone(self.cache.get('https://other.shotgunstudio.com', 'first'))
+
+    @unittest.skipIf(os.name != 'posix', 'file modes are posix only')
+    def test_file_is_only_readable_by_its_owner(self):
+        self.cache.put(server, 'myScript', 'MyScript', 'secret')
+
+        self.assertEqual(stat.S_IMODE(os.stat(self.path).st_mode), 0o600)
+        self.assertEqual(os.listdir(os.path.dirname(self.path)), ['cache.json'])
+
+    def test_unreadable_file_is_empty(self):
+        os.makedirs(os.path.dirname(self.path))
+        with open(self.path, 'w') as f:
+            f.write('{not json')
+
+        self.assertIsNone(self.cache.get(server, 'myScript'))
+        self.cache.put(server, 'myScript', 'MyScript', 'secret')
+        self.assertEqual(self.cache.get(server, 'myScript'), ('MyScript', 'secret'))
+
+    @unittest.skipIf(sg_wrapper_auth.fcntl is None, 'no file locking')
+    def test_lock_is_exclusive(self):
+        events = []
+
+        def hold():
+            # flock locks conflict between open files, even in a single process
+            with AuthCache(self.path).lock():
+                events.append('second')
+
+        with self.cache.lock():
+            thread = threading.Thread(target=hold)
+            thread.start()
+            time.sleep(0.05)
+            events.append('first')
+        thread.join()
+
+        self.assertEqual(events, ['first', 'second'])
+
+
+class ResolvedAuthCache(AuthCache):
+    ''' AuthCache filled by another process while the lock is waited for '''
+
+    @contextmanager
+    def lock(self):
+        self.put(server, 'myScript', 'MyScript', 'fromOtherProcess')
+        yield
+
+
+class ShotgunAuthCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, 'cache.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def make_shotgun(self, cache=None):
+        records = {'ApiUser': [{'id': 1, 'firstname': 'MyScript', 'sg_public_password': 'secret'}]}
+        return make_shotgun(records, authCache=cache or AuthCache(self.path))
+
+    def test_resolved_script_costs_no_request(self):
+        self.assertEqual(self.make_shotgun().get_new_shotgun_auth_info('MyScript'), ('MyScript', 'secret'))
+        self.assertEqual(len(shotgun_api3.calls('find_one')), 1)
+
+        sg = self.make_shotgun()
+        self.assertEqual(sg.get_new_shotgun_auth_info('myscript'), ('MyScript', 'secret'))
+        self.assertEqual(shotgun_api3.calls('find_one'), [])
+
+    def test_cache_is_checked_again_under_the_lock(self):
+        sg = self.make_shotgun(ResolvedAuthCache(self.path))
+
+        self.assertEqual(sg.get_new_shotgun_auth_info('myScript'), ('MyScript', 'fromOtherProcess'))
+        self.assertEqual(shotgun_api3.calls('find_one'), [])
+
+    def test_environment_variable(self):
+        os.environ[sg_wrapper.authCacheEnv] = self.path
+        try:
+            sg = make_shotgun()
+        finally:
+            del os.environ[sg_wrapper.authCacheEnv]
+
+        self.assertEqual(sg._auth_cache.path, self.path)
+
+
+if __name__ == '__main__':
+    unittest.main()
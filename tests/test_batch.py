@@ -0,0 +1,94 @@
+import json
+import unittest
+
+import shotgun_api3
+
+from helpers import make_shotgun
+
+import sg_wrapper
+
+
+def shots(count=6):
+    return {'Shot': [{'id': i, 'code': 'sh%03d' % i, 'sg_status_list': 'ip'} for i in range(1, count + 1)]}
+
+
+def updates(count=6, status='cmpt'):
+    return [{'request_type': 'update', 'entity_type': 'Shot', 'entity_id': i, 'data': {'sg_status_list': status}}
+            for i in range(1, count + 1)]
+
+
+class BatchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sg = make_shotgun(shots(), connectionPoolSize=3)
+        # read before the failures are queued
+        self.sg.get_entity_fields('Shot')
+
+    def tearDown(self):
+        shotgun_api3.LATENCY = 0.0
+
+    def statuses(self):
+        return [shotgun_api3.DB['Shot'][i].get('sg_status_list') for i in sorted(shotgun_api3.DB['Shot'])]
+
+    def test_chunk_size(self):
+        results = self.sg.batch(updates(5), chunkSize=2)
+
+        self.assertEqual(len(shotgun_api3.calls('batch')), 3)
+        self.assertEqual([r.entity_id() for r in results], [1, 2, 3, 4, 5])
+        self.assertEqual(self.statuses(), ['cmpt'] * 5 + ['ip'])
+
+    def test_max_bytes(self):
+        requests = updates(5)
+        requestBytes = len(json.dumps(requests[0])) + 1
+
+        self.sg.batch(requests, chunkSize=None, maxBytes=2 * requestBytes)
+        self.assertEqual(len(shotgun_api3.calls('batch')), 3)
+
+        del shotgun_api3.CALLS[:]
+        self.sg.batch(updates(5, 'fin'), chunkSize=None, maxBytes=requestBytes - 1)
+        # a request larger than maxBytes is still sent, alone
+        self.assertEqual(len(shotgun_api3.calls('batch')), 5)
+
+    def test_workers(self):
+        requests = updates(6) + [{'request_type': 'create', 'entity_type': 'Shot', 'data': {'code': 'sh007'}}]
+        shotgun_api3.LATENCY = 0.02
+        results = self.sg.batch(requests, chunkSize=2, workers=3)
+
+        self.assertEqual(len(shotgun_api3.calls('batch')), 4)
+        self.assertEqual(self.sg.connection_pool_stats()['inUseMax'], 3)
+        self.assertEqual([r.entity_id() for r in results], [1, 2, 3, 4, 5, 6, 7])
+        self.assertEqual(self.statuses(), ['cmpt'] * 6 + [None])
+
+    def test_failing_chunk_keeps_the_other_results(self):
+        fault = shotgun_api3.Fault('rejected')
+        shotgun_api3.Shotgun.failures = [None, fault, None]
+
+        with self.assertRaises(sg_wrapper.BatchError) as context:
+            self.sg.batch(updates(6), chunkSize=2)
+
+        error = context.exception
+        self.assertEqual([r.entity_id() if r else None for r in error.results], [1, 2, None, None, 5, 6])
+        self.assertEqual(error.errors, [(2, 2, fault)])
+        # Shotgun rolled the failing chunk back
+        self.assertEqual(self.statuses(), ['cmpt', 'cmpt', 'ip', 'ip', 'cmpt', 'cmpt'])
+
+    def test_single_chunk_error_is_raised(self):
+        shotgun_api3.Shotgun.failures = [shotgun_api3.Fault('rejected')]
+        self.assertRaises(shotgun_api3.Fault, self.sg.batch, updates(2))
+
+    def test_update_results_are_applied_to_the_cached_entities(self):
+        shot = self.sg.Shot(1)
+        shot.code = 'renamed'
+
+        results = self.sg.batch(updates(2))
+
+        self.assertIs(results[0], shot)
+        self.assertEqual(shot.sg_status_list, 'cmpt')
+        # modified since: kept
+        self.assertEqual(shot.code, 'renamed')
+        self.assertEqual(shot.modified_fields(), ['code'])
+        self.assertIs(self.sg.Shot(2), results[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import sg_wrapper_util
+from sg_wrapper_util import get_script_name_from_frame
+
+
+def frame(path, function='main'):
+    return (None, path, 1, function)
+
+
+class ScriptNameFromFrameTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = os.path.realpath(tempfile.mkdtemp())
+        self.versionFolder = os.path.join(self.folder, 'myTool', '1.0')
+        os.makedirs(os.path.join(self.versionFolder, 'python'))
+        open(os.path.join(self.versionFolder, 'package.py'), 'w').close()
+        self.script = os.path.join(self.versionFolder, 'python', 'publish.py')
+
+        sg_wrapper_util._scriptNames.clear()
+        sg_wrapper_util._packageFolders.clear()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+        sg_wrapper_util._scriptNames.clear()
+        sg_wrapper_util._packageFolders.clear()
+
+    def test_package_name(self):
+        self.assertEqual(get_script_name_from_frame(frame(self.script)), ('publish', 'myTool'))
+        self.assertEqual(get_script_name_from_frame(frame(os.path.join(self.folder, 'tool.py'))),
+                         ('tool', None))
+
+    def test_ignored_frames(self):
+        self.assertEqual(get_script_name_from_frame(frame('<stdin>')), (None, None))
+        self.assertEqual(get_script_name_from_frame(frame('/usr/lib/IPython/core.py')), (None, None))
+        self.assertEqual(get_script_name_from_frame(frame(self.script, '__load_apps')), (None, 'recurs_ignore'))
+        self.assertEqual(get_script_name_from_frame((None, self.script)), (None, None))
+
+    def test_absolute_paths_are_memoized(self):
+        get_script_name_from_frame(frame(self.script))
+        os.remove(os.path.join(self.versionFolder, 'package.py'))
+
+        self.assertEqual(get_script_name_from_frame(frame(self.script)), ('publish', 'myTool'))
+        self.assertEqual(sg_wrapper_util._scriptNames, {self.script: ('publish', 'myTool')})
+
+    def test_visited_folders_are_memoized(self):
+        get_script_name_from_frame(frame(self.script))
+
+        packageFolders = sg_wrapper_util._packageFolders
+        self.assertEqual(packageFolders[os.path.dirname(self.script)], self.versionFolder)
+        self.assertEqual(packageFolders[self.versionFolder], self.versionFolder)
+        self.assertNotIn(self.folder, packageFolders)
+
+        # a script of the same folder reuses its memoized package folder
+        os.remove(os.path.join(self.versionFolder, 'package.py'))
+        other = os.path.join(self.versionFolder, 'python', 'other.py')
+        self.assertEqual(get_script_name_from_frame(frame(other)), ('other', 'myTool'))
+
+    def test_relative_paths_are_not_memoized(self):
+        cwd = os.getcwd()
+        try:
+            os.chdir(os.path.dirname(self.script))
+            self.assertEqual(get_script_name_from_frame(frame('publish.py')), ('publish', 'myTool'))
+            os.chdir(self.folder)
+            self.assertEqual(get_script_name_from_frame(frame('publish.py')), ('publish', None))
+        finally:
+            os.chdir(cwd)
+
+        self.assertNotIn('publish.py', sg_wrapper_util._scriptNames)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,143 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import shotgun_api3
+
+from sg_wrapper_events import EventLogTailer
+
+from helpers import link, make_shotgun
+
+
+def event(eventId, shotId=1):
+    return {'id': eventId, 'event_type': 'Shotgun_Shot_Change', 'entity': link('Shot', shotId),
+            'attribute_name': 'code',
+            'meta': {'type': 'attribute_change', 'entity_type': 'Shot', 'entity_id': shotId}}
+
+
+class Callback(object):
+    ''' Record the ids of the dispatched batches, failing the next calls if told so '''
+
+    def __init__(self):
+        self.batches = []
+        self.failures = 0
+
+    def __call__(self, events):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError('callback failed')
+        self.batches.append([e['id'] for e in events])
+
+    def ids(self):
+        return [i for batch in self.batches for i in batch]
+
+
+class EventLogTailerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sg = make_shotgun({'Shot': [{'id': 1, 'code': 'sh001'}],
+                                'EventLogEntry': [event(i) for i in range(1, 6)]})
+        self.folder = tempfile.mkdtemp()
+        self.checkpointPath = os.path.join(self.folder, 'events.json')
+        self.callback = Callback()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def tailer(self, **kwargs):
+        kwargs.setdefault('checkpointPath', self.checkpointPath)
+        tailer = EventLogTailer(self.sg, **kwargs)
+        tailer.add_callback(self.callback)
+        return tailer
+
+    def add_events(self, *eventIds):
+        for eventId in eventIds:
+            shotgun_api3.DB['EventLogEntry'][eventId] = event(eventId)
+
+    def test_starts_from_the_newest_event(self):
+        tailer = self.tailer()
+        self.assertEqual(tailer.poll(), [])
+        self.assertEqual(tailer.last_id, 5)
+
+        self.add_events(6, 7)
+        tailer.poll()
+        self.assertEqual(self.callback.ids(), [6, 7])
+
+    def test_pages_and_batches(self):
+        tailer = self.tailer(startId=0, pageSize=2, batchSize=1)
+        tailer.poll()
+
+        self.assertEqual(self.callback.batches, [[1], [2], [3], [4], [5]])
+        self.assertEqual(len(shotgun_api3.calls('find')), 3)
+        self.assertEqual(tailer.last_id, 5)
+
+    def test_resumes_from_the_checkpoint(self):
+        self.tailer(startId=2).poll()
+        self.assertEqual(self.callback.ids(), [3, 4, 5])
+
+        self.add_events(6)
+        self.tailer(startId=0).poll()
+        self.assertEqual(self.callback.ids(), [3, 4, 5, 6])
+
+    def test_failing_callback_replays_the_batch(self):
+        tailer = self.tailer(startId=3)
+        self.callback.failures = 1
+        self.assertRaises(RuntimeError, tailer.poll)
+        self.assertEqual(tailer.last_id, 3)
+
+        tailer.poll()
+        self.assertEqual(self.callback.ids(), [4, 5])
+
+    def test_late_event_of_a_gap(self):
+        del shotgun_api3.DB['EventLogEntry'][4]
+        tailer = self.tailer(startId=2)
+        tailer.poll()
+        self.assertEqual(self.callback.ids(), [3, 5])
+        self.assertEqual(tailer.stats()['gaps'], 1)
+
+        # the transaction of event 4 commits
+        self.add_events(4)
+        self.assertEqual([e['id'] for e in tailer.poll()], [4])
+        self.assertEqual(tailer.stats()['gaps'], 0)
+        self.assertEqual(tailer.stats()['gapsFilled'], 1)
+        self.assertEqual(tailer.last_id, 5)
+
+    def test_failing_callback_keeps_the_gap(self):
+        del shotgun_api3.DB['EventLogEntry'][4]
+        tailer = self.tailer(startId=2)
+        tailer.poll()
+        self.add_events(4)
+
+        self.callback.failures = 1
+        self.assertRaises(RuntimeError, tailer.poll)
+        self.assertEqual(tailer.stats()['gaps'], 1)
+
+        # the gap survives a restart too
+        tailer = self.tailer()
+        tailer.poll()
+        self.assertEqual(self.callback.ids(), [3, 5, 4])
+        self.assertEqual(tailer.stats()['gaps'], 0)
+
+    def test_expired_gaps_are_given_up(self):
+        del shotgun_api3.DB['EventLogEntry'][4]
+        tailer = self.tailer(startId=2, gapTimeout=0.01)
+        tailer.poll()
+        time.sleep(0.05)
+
+        tailer.poll()
+        self.assertEqual(tailer.stats()['gaps'], 0)
+        self.assertEqual(tailer.stats()['gapsExpired'], 1)
+
+    def test_events_invalidate_the_cache(self):
+        shot = self.sg.Shot(1)
+        self.assertIs(self.sg.Shot(1), shot)
+
+        self.add_events(6)
+        self.tailer(startId=5).poll()
+        self.assertIsNot(self.sg.Shot(1), shot)
+
+
+if __name__ == '__main__':
+    unittest.main()
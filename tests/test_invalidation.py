@@ -0,0 +1,174 @@
+import time
+import unittest
+
+import shotgun_api3
+
+from helpers import link, make_shotgun
+
+
+def shots(count=3):
+    return {'Sequence': [{'id': 1, 'code': 'sq1'}, {'id': 2, 'code': 'sq2'}],
+            'Shot': [{'id': i, 'code': 'sh%03d' % i, 'sg_status_list': 'ip', 'sg_sequence': link('Sequence', 1)}
+                     for i in range(1, count + 1)]}
+
+
+def change(entityType, entityId, fieldName):
+    return {'type': 'EventLogEntry', 'id': 1,
+            'event_type': 'Shotgun_%s_Change' % entityType,
+            'entity': link(entityType, entityId),
+            'attribute_name': fieldName,
+            'meta': {'type': 'attribute_change', 'entity_type': entityType, 'entity_id': entityId}}
+
+
+def event(entityType, entityId, action, withEntity=True):
+    return {'type': 'EventLogEntry', 'id': 1,
+            'event_type': 'Shotgun_%s_%s' % (entityType, action),
+            'entity': link(entityType, entityId) if withEntity else None,
+            'attribute_name': None,
+            'meta': {'entity_type': entityType, 'entity_id': entityId}}
+
+
+class InvalidateFromEventsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sg = make_shotgun(shots())
+
+    def find_count(self):
+        return len(shotgun_api3.calls('find')) + len(shotgun_api3.calls('find_one'))
+
+    def test_change_evicts_the_entity_and_the_results_containing_it(self):
+        shot = self.sg.Shot(1)
+        self.sg.Shots(sg_status_list='ip')
+        self.sg.Shot(2)
+
+        shotgun_api3.DB['Shot'][1]['code'] = 'renamed'
+        evicted = self.sg.invalidate_from_events([change('Shot', 1, 'code')])
+
+        self.assertEqual(evicted['entities'], 1)
+        self.assertEqual(evicted['queries'], 2)
+        self.assertNotIn(1, self.sg._entities['Shot'])
+
+        before = self.find_count()
+        self.assertEqual(self.sg.Shot(1).code, 'renamed')
+        self.assertIsNot(self.sg.Shot(1), shot)
+        self.sg.Shot(2)
+        self.assertEqual(self.find_count(), before + 1)
+
+    def test_change_of_a_filtered_field_evicts_the_results_not_containing_it(self):
+        self.sg.Shots(sg_status_list='cmpt')
+        self.sg.Shots(sg_sequence=link('Sequence', 1))
+
+        shotgun_api3.DB['Shot'][3]['sg_status_list'] = 'cmpt'
+        evicted = self.sg.invalidate_from_events([change('Shot', 3, 'sg_status_list')])
+
+        # the sequence query contains shot 3, the status query filters on the field
+        self.assertEqual(evicted['queries'], 2)
+        self.assertEqual([s.id for s in self.sg.Shots(sg_status_list='cmpt')], [3])
+
+    def test_change_of_another_field_keeps_the_results_not_containing_it(self):
+        self.sg.Shots(sg_status_list='ip', id=('in', [1, 2]))
+
+        evicted = self.sg.invalidate_from_events([change('Shot', 3, 'code')])
+
+        self.assertEqual(evicted['queries'], 0)
+        before = self.find_count()
+        self.sg.Shots(sg_status_list='ip', id=('in', [1, 2]))
+        self.assertEqual(self.find_count(), before)
+
+    def test_creation_evicts_every_result_of_the_type(self):
+        self.sg.Shots(sg_status_list='ip')
+        self.sg.Shots(sg_sequence=link('Sequence', 2))
+        self.sg.Sequences()
+
+        shotgun_api3.DB['Shot'][4] = {'id': 4, 'code': 'sh004', 'sg_status_list': 'ip',
+                                      'sg_sequence': link('Sequence', 2)}
+        evicted = self.sg.invalidate_from_events([event('Shot', 4, 'New')])
+
+        self.assertEqual(evicted['queries'], 2)
+        self.assertEqual([s.id for s in self.sg.Shots(sg_sequence=link('Sequence', 2))], [4])
+
+    def test_retirement_without_entity_uses_meta(self):
+        self.sg.Shot(2)
+        self.sg.Shots(sg_status_list='ip')
+
+        del shotgun_api3.DB['Shot'][2]
+        evicted = self.sg.invalidate_from_events([event('Shot', 2, 'Retirement', withEntity=False)])
+
+        self.assertEqual(evicted, {'entities': 1, 'queries': 2})
+        self.assertEqual([s.id for s in self.sg.Shots(sg_status_list='ip')], [1, 3])
+
+    def test_modified_entities_are_kept(self):
+        shot = self.sg.Shot(1)
+        shot.code = 'local'
+
+        evicted = self.sg.invalidate_from_events([change('Shot', 1, 'description')])
+
+        self.assertEqual(evicted['entities'], 0)
+        self.assertIs(self.sg.Shot(1), shot)
+        self.assertEqual(shot.code, 'local')
+
+    def test_events_of_unknown_types_are_ignored(self):
+        self.sg.Shot(1)
+        events = [event('Unknown', 1, 'Change'), {'event_type': 'Shotgun_User_Login', 'entity': None, 'meta': None}]
+        self.assertEqual(self.sg.invalidate_from_events(events), {'entities': 0, 'queries': 0})
+
+    def test_event_entities(self):
+        shotgun_api3.DB['EventLogEntry'] = {10: dict(change('Shot', 1, 'code'), id=10)}
+        self.sg.Shot(1)
+
+        events = self.sg.EventLogEntries(fields=['event_type', 'entity', 'attribute_name', 'meta'])
+        self.assertEqual(self.sg.invalidate_from_events(events)['entities'], 1)
+
+    def test_aliased_entity_types(self):
+        shotgun_api3.DB['CustomEntity23'] = {1: {'id': 1, 'code': 'cut'}}
+        self.sg.EditingCut(1)
+
+        evicted = self.sg.invalidate_from_events([change('CustomEntity23', 1, 'code')])
+        self.assertEqual(evicted, {'entities': 1, 'queries': 1})
+
+
+class CacheTtlTest(unittest.TestCase):
+
+    def test_expired_entities_and_results_are_fetched_again(self):
+        sg = make_shotgun(shots(), cacheTtl={'Shot': 0.05})
+        shot = sg.Shot(1)
+        sg.Shots(sg_status_list='ip')
+        sg.Sequence(1)
+
+        shotgun_api3.DB['Shot'][1]['code'] = 'renamed'
+        time.sleep(0.1)
+        del shotgun_api3.CALLS[:]
+
+        self.assertEqual(sg.Shot(1).code, 'renamed')
+        self.assertIsNot(sg.Shot(1), shot)
+        sg.Shots(sg_status_list='ip')
+        sg.Sequence(1)
+
+        # the Sequence type has no ttl
+        self.assertEqual([c[1] for c in shotgun_api3.CALLS], ['Shot', 'Shot'])
+
+    def test_default_ttl(self):
+        sg = make_shotgun(shots(), cacheTtl=60)
+        self.assertEqual(sg.get_cache_ttl('Shot'), 60)
+        sg.set_cache_ttl(None, 'Shot')
+        self.assertIsNone(sg.get_cache_ttl('Shot'))
+        self.assertEqual(sg.get_cache_ttl('Sequence'), 60)
+
+    def test_entity_type_names_are_resolved(self):
+        sg = make_shotgun(cacheTtl={'EditingCut': 30, 'Shots': 10})
+        self.assertEqual(sg.get_cache_ttl('CustomEntity23'), 30)
+        self.assertEqual(sg.get_cache_ttl('Shot'), 10)
+
+        sg.set_cache_ttl(20, 'EditingCuts')
+        self.assertEqual(sg.get_cache_ttl('CustomEntity23'), 20)
+
+    def test_entity_type_names_are_resolved_once_the_schema_is_read(self):
+        sg = make_shotgun(cacheTtl={'EditingCut': 30}, lazy=True)
+        self.assertEqual(shotgun_api3.calls(), [])
+
+        sg.Shot(1)
+        self.assertEqual(sg.get_cache_ttl('CustomEntity23'), 30)
+
+
+if __name__ == '__main__':
+    unittest.main()
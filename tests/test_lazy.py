@@ -0,0 +1,36 @@
+import unittest
+
+import shotgun_api3
+
+import sg_wrapper
+
+from helpers import make_shotgun, server
+
+
+def records():
+    return {'Shot': [{'id': 1, 'code': 'sh001'}],
+            'ApiUser': [{'id': 1, 'firstname': 'tests', 'sg_public_password': 'newKey'}]}
+
+
+class LazyTest(unittest.TestCase):
+
+    def test_construction_sends_no_request(self):
+        shotgun_api3.reset(records())
+        sg_wrapper.Shotgun(server, 'tests', 'key', lazy=True, printInfo=False)
+        self.assertEqual(shotgun_api3.calls(), [])
+
+    def test_failed_auth_update_is_tried_again(self):
+        sg = make_shotgun(records(), lazy=True, disableApiAuthOverride=False)
+        sg._ensure_schema()
+
+        shotgun_api3.Shotgun.failures = [shotgun_api3.Fault('auth lookup failed')]
+        self.assertRaises(shotgun_api3.Fault, sg.Shot, 1)
+        self.assertFalse(sg._session_ready)
+
+        self.assertEqual(sg.Shot(1).code, 'sh001')
+        self.assertTrue(sg._session_ready)
+        self.assertEqual(sg._sg.config.api_key, 'newKey')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+import threading
+import unittest
+
+import shotgun_api3
+
+from helpers import make_shotgun, server
+
+
+class ExtraConnectionTest(unittest.TestCase):
+
+    def extra_connection(self, sg):
+        pool = sg._connection_pool
+        primary = pool.acquire()
+        connection = pool.acquire()
+        pool.release(primary)
+        pool.release(connection)
+        self.assertIsNot(connection, primary)
+        return connection
+
+    def test_clone_keeps_the_config(self):
+        sg = make_shotgun(connectionPoolSize=2, ca_certs='/certs/ca.pem', ensure_ascii=False)
+        sg._sg.config.timeout_secs = 12
+        sg._sg.config.script_name = 'overridden'
+        sg._sg.set_session_uuid('uuid')
+
+        connection = self.extra_connection(sg)
+        self.assertEqual(connection.config.timeout_secs, 12)
+        self.assertEqual(connection.config.script_name, 'overridden')
+        self.assertEqual(connection.config.session_uuid, 'uuid')
+        self.assertEqual(connection._Shotgun__ca_certs, '/certs/ca.pem')
+        self.assertFalse(hasattr(connection, '_json_loads'))
+        self.assertFalse(connection.connected)
+
+    def test_connection_factory(self):
+        opened = []
+
+        def factory():
+            opened.append(shotgun_api3.Shotgun(server, 'factory', 'factoryKey'))
+            return opened[-1]
+
+        sg = make_shotgun(connectionPoolSize=2, connectionFactory=factory)
+        sg._sg.config.timeout_secs = 12
+
+        connection = self.extra_connection(sg)
+        self.assertEqual(len(opened), 1)
+        self.assertIs(object.__getattribute__(connection, '_sg'), opened[0])
+        self.assertEqual(opened[0].config.timeout_secs, 12)
+        self.assertEqual(opened[0].config.script_name, 'tests')
+
+    def test_pool_is_opt_in(self):
+        sg = make_shotgun()
+        self.assertEqual(sg.connection_pool_stats()['maxSize'], 1)
+
+    def test_connections_are_shared_when_the_factory_fails(self):
+        def factory():
+            raise TypeError('__init__() missing 1 required positional argument: user')
+
+        sg = make_shotgun({'Shot': [{'id': 1}]}, connectionPoolSize=4, connectionFactory=factory)
+        pool = sg._connection_pool
+        primary = pool.acquire()
+        results = []
+        thread = threading.Thread(target=lambda: results.append(sg._sg.find('Shot', [])))
+        thread.start()
+
+        # the request waits for the primary connection instead of failing
+        thread.join(0.2)
+        self.assertTrue(thread.is_alive())
+        pool.release(primary)
+        thread.join()
+
+        self.assertEqual(len(results[0]), 1)
+        self.assertEqual(pool.connections(), [primary])
+        self.assertEqual(pool.maxSize, 1)
+
+    def test_attributes_are_set_on_every_connection(self):
+        sg = make_shotgun(connectionPoolSize=2)
+        connection = self.extra_connection(sg)
+        sg._sg.tracing = True
+        for c in sg._connection_pool.connections():
+            self.assertTrue(object.__getattribute__(c, '_sg').tracing)
+
+        sg._sg.find = lambda *args, **kwargs: 'patched'
+        self.assertEqual(sg._sg.find('Shot', []), 'patched')
+        self.assertEqual(connection.find('Shot', []), 'patched')
+
+        pool = sg._connection_pool
+        connections = [pool.acquire() for i in range(2)]
+        for c in connections:
+            pool.release(c)
+        self.assertEqual(len(pool.connections()), 2)
+
+    def test_hooks_are_cached(self):
+        sg = make_shotgun({'Shot': [{'id': 1}]})
+        self.assertIs(sg._sg.find, sg._sg.find)
+        self.assertEqual(len(sg._sg.find('Shot', [])), 1)
+        self.assertEqual(sg._sg.config.script_name, 'tests')
+
+
+class ConcurrentRequestsTest(unittest.TestCase):
+
+    def tearDown(self):
+        shotgun_api3.LATENCY = 0.0
+
+    def test_entity_fields_are_read_once(self):
+        sg = make_shotgun(connectionPoolSize=10)
+        shotgun_api3.LATENCY = 0.05
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(sg.get_entity_fields('Shot')))
+                   for i in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(shotgun_api3.calls('schema_field_read')), 1)
+        self.assertEqual(len(results), 10)
+        self.assertTrue(all(r is results[0] for r in results))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import unittest
+
+import shotgun_api3
+
+from helpers import link, make_shotgun
+
+
+def versions_and_shots(count):
+    return {'Shot': [{'id': i, 'code': 'sh%03d' % i} for i in range(1, count + 1)],
+            'Asset': [{'id': 1, 'code': 'chair'}],
+            'Version': [{'id': i, 'code': 'v%03d' % i, 'entity': link('Shot', i)}
+                        for i in range(1, count + 1)]
+                       + [{'id': count + 1, 'code': 'chair_v001', 'entity': link('Asset', 1)}]}
+
+
+class PrefetchTest(unittest.TestCase):
+
+    def test_one_request_per_linked_type(self):
+        sg = make_shotgun(versions_and_shots(20))
+        versions = sg.Versions()
+        del shotgun_api3.CALLS[:]
+
+        linked = sg.prefetch(versions, 'entity', fields=['code'])
+
+        self.assertEqual(sorted(shotgun_api3.calls('find')), [('find', 'Asset'), ('find', 'Shot')])
+        self.assertEqual(len(linked), 21)
+
+        del shotgun_api3.CALLS[:]
+        codes = [v.entity.code for v in versions]
+        self.assertEqual(shotgun_api3.CALLS, [])
+        self.assertEqual(codes[0], 'sh001')
+        self.assertEqual(codes[-1], 'chair')
+
+    def test_chunks(self):
+        sg = make_shotgun(versions_and_shots(5))
+        versions = sg.Versions(entity=('type', 'Shot'))
+        del shotgun_api3.CALLS[:]
+
+        sg.prefetch(versions, 'entity', chunkSize=2)
+
+        self.assertEqual(shotgun_api3.calls('find'), [('find', 'Shot')] * 3)
+
+    def test_resolved_links_are_skipped(self):
+        sg = make_shotgun(versions_and_shots(3))
+        versions = sg.Versions()
+        sg.prefetch(versions, 'entity')
+        del shotgun_api3.CALLS[:]
+
+        self.assertEqual(sg.prefetch(versions, 'entity'), [])
+        self.assertEqual(shotgun_api3.CALLS, [])
+
+    def test_multi_entity_field(self):
+        records = {'Asset': [{'id': i, 'code': 'a%d' % i} for i in range(1, 4)],
+                   'Shot': [{'id': 1, 'code': 'sh001', 'assets': [link('Asset', 1), link('Asset', 2)]},
+                            {'id': 2, 'code': 'sh002', 'assets': [link('Asset', 2), link('Asset', 3)]}]}
+        sg = make_shotgun(records)
+        shots = sg.Shots()
+        del shotgun_api3.CALLS[:]
+
+        sg.prefetch(shots, 'assets', fields=['code'])
+        self.assertEqual(shotgun_api3.calls('find'), [('find', 'Asset')])
+
+        del shotgun_api3.CALLS[:]
+        self.assertEqual([[a.code for a in s.assets] for s in shots], [['a1', 'a2'], ['a2', 'a3']])
+        self.assertEqual(shotgun_api3.CALLS, [])
+
+    def test_find_entity_include(self):
+        sg = make_shotgun(versions_and_shots(10))
+
+        versions = sg.Versions(include={'entity': ['code']})
+        self.assertEqual(sorted(shotgun_api3.calls('find')),
+                         [('find', 'Asset'), ('find', 'Shot'), ('find', 'Version')])
+
+        del shotgun_api3.CALLS[:]
+        [v.entity.code for v in versions]
+        self.assertEqual(shotgun_api3.CALLS, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
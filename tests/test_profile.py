@@ -0,0 +1,73 @@
+import unittest
+
+from helpers import make_shotgun
+
+
+def records():
+    return {'Sequence': [{'id': 1, 'code': 'sq001'}],
+            'Shot': [{'id': i, 'code': 'sh%03d' % i, 'description': 'shot %d' % i,
+                      'sg_sequence': {'type': 'Sequence', 'id': 1}} for i in range(1, 5)]}
+
+
+class ProfilerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sg = make_shotgun(records())
+        self.sg.enable_profiling()
+
+    def report(self):
+        return dict((entry['entityType'], entry) for entry in self.sg.profile_report(text=False))
+
+    def test_find_entity_is_recorded_once(self):
+        shots = self.sg.Shots(fields=['code'])
+        self.sg.clear_cache()
+        shot = self.sg.Shot(1, fields=['code'])
+
+        entries = self.sg.profile_report(text=False)
+        self.assertEqual(len(entries), 2)
+        self.assertEqual([e['queries'] for e in entries], [1, 1])
+        self.assertEqual(sorted(e['rows'] for e in entries), [1, 4])
+        self.assertEqual(len(shots), 4)
+        self.assertEqual(shot.code, 'sh001')
+
+    def test_internal_fetches_are_not_recorded(self):
+        shots = self.sg.Shots(fields=['code', 'sg_sequence'])
+        # a reload for the missing field, then a link query
+        self.assertEqual(shots[0].description, 'shot 1')
+        self.assertEqual(shots[0].sg_sequence.code, 'sq001')
+        self.sg.prefetch(shots, 'sg_sequence')
+
+        report = self.report()
+        # the linked sequence read is recorded, not its query
+        self.assertEqual(report['Sequence']['queries'], 0)
+        self.assertEqual(report['Shot']['queries'], 1)
+        self.assertEqual(report['Shot']['reloads'], {'description': 1})
+        self.assertEqual(report['Shot']['linkQueries'], {'sg_sequence': 1})
+
+    def test_include_is_not_a_query(self):
+        self.sg.Shots(fields=['code'], include=['sg_sequence'])
+
+        report = self.report()
+        self.assertEqual(list(report), ['Shot'])
+        self.assertEqual(report['Shot']['queries'], 1)
+
+    def test_sg_find_is_recorded(self):
+        self.sg.sg_find('Shot', [], ['code'])
+        self.sg.sg_find_one('Sequence', [], ['code'])
+
+        report = self.report()
+        self.assertEqual(report['Shot']['queries'], 1)
+        self.assertEqual(report['Shot']['rows'], 4)
+        self.assertEqual(report['Sequence']['queries'], 1)
+
+    def test_streamed_pages_are_recorded(self):
+        self.assertEqual(len(list(self.sg.iter_entities('Shot', fields=['code'], page_size=2))), 4)
+
+        report = self.report()
+        # the last page is empty
+        self.assertEqual(report['Shot']['queries'], 3)
+        self.assertEqual(report['Shot']['rows'], 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
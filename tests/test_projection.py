@@ -0,0 +1,154 @@
+import unittest
+
+import shotgun_api3
+
+from helpers import make_shotgun, link
+
+from sg_wrapper_projection import compile_projection
+
+
+def shots(count=4):
+    return {'Shot': [{'id': i, 'code': 'sh%03d' % i, 'description': 'shot %d' % i, 'sg_status_list': 'ip'}
+                     for i in range(1, count + 1)]}
+
+
+class LearnDefaultFieldsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sg = make_shotgun(shots(), learnDefaultFields=True)
+
+    def query(self, shotId):
+        self.sg.clear_cache()
+        return self.sg.Shot(shotId)
+
+    def fetched(self, shot):
+        return sorted(f for f in shot._fields if f not in ('type', 'id'))
+
+    def warm_up(self):
+        self.query(1).code
+        for shotId in range(2, 5):
+            shot = self.query(shotId)
+            self.assertIn('description', shot._fields)
+            shot.code
+
+    def test_every_field_is_fetched_until_the_learned_fields_are_stable(self):
+        self.warm_up()
+        self.assertEqual(self.fetched(self.query(1)), ['code'])
+
+    def test_new_field_read_starts_the_warmup_again(self):
+        self.warm_up()
+
+        shot = self.query(1)
+        self.assertEqual(shot.description, 'shot 1')
+        self.assertIn('sg_status_list', self.query(2)._fields)
+
+        for shotId in range(3, 5):
+            self.query(shotId)
+        self.assertEqual(self.fetched(self.query(1)), ['code', 'description'])
+
+    def test_internal_fetches_are_not_queries(self):
+        shot = self.query(1)
+        shot.code
+        for i in range(3):
+            shot.reload(mode='default')
+        self.assertIn('description', self.query(2)._fields)
+
+    def test_link_resolution_is_not_a_query(self):
+        records = shots()
+        records['Sequence'] = [{'id': 1, 'code': 'sq001', 'description': 'sequence'}]
+        for record in records['Shot']:
+            record['sg_sequence'] = {'type': 'Sequence', 'id': 1}
+        self.sg = make_shotgun(records, learnDefaultFields=True)
+
+        self.sg.Sequence(1).code
+        for shotId in range(1, 5):
+            self.assertEqual(self.query(shotId).sg_sequence.code, 'sq001')
+
+        self.sg.clear_cache()
+        self.assertIn('description', self.sg.Sequence(1)._fields)
+
+    def test_special_names_are_not_fields(self):
+        shot = self.query(1)
+        del shotgun_api3.CALLS[:]
+
+        self.assertIsNone(getattr(shot, '__length_hint__', None))
+        self.assertEqual(shotgun_api3.calls(), [])
+        self.assertEqual(self.sg._default_projection.read_fields(), {})
+
+
+def versions():
+    return {'Sequence': [{'id': 1, 'code': 'sq001', 'description': 'sequence'}],
+            'Shot': [{'id': 1, 'code': 'sh001', 'sg_sequence': link('Sequence', 1)}],
+            'Asset': [{'id': 2, 'code': 'chair'}],
+            'Version': [{'id': 1, 'code': 'v001', 'entity': link('Shot', 1)},
+                        {'id': 2, 'code': 'v002', 'entity': link('Asset', 2)},
+                        {'id': 3, 'code': 'v003', 'entity': None}]}
+
+
+class NestedProjectionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sg = make_shotgun(versions())
+
+    def test_compile(self):
+        spec = {'code': None, 'entity': {'Shot': {'code': None, 'sg_sequence': ['code']}}}
+        self.assertEqual(compile_projection(self.sg, 'Version', spec)[0],
+                         ['code', 'entity', 'entity.Shot.code', 'entity.Shot.sg_sequence',
+                          'entity.Shot.sg_sequence.Sequence.code'])
+
+    def test_fields_are_requested_on_every_linked_type_having_them(self):
+        fields = compile_projection(self.sg, 'Version', {'entity': ['code', 'sg_sequence']})[0]
+        self.assertEqual(fields, ['entity', 'entity.Asset.code', 'entity.Shot.code', 'entity.Shot.sg_sequence'])
+
+    def test_only_single_entity_links_are_projected(self):
+        self.assertRaises(ValueError, compile_projection, self.sg, 'Version', {'code': ['code']})
+        self.assertRaises(ValueError, compile_projection, self.sg, 'Shot', {'assets': ['code']})
+
+    def test_linked_entities_are_fetched_in_the_same_request(self):
+        found = self.sg.Versions(fields={'code': None, 'entity': {'code': None, 'sg_sequence': ['code']}})
+        shot, asset = found[0].entity, found[1].entity
+
+        self.assertEqual((shot.code, shot.sg_sequence.code, asset.code), ('sh001', 'sq001', 'chair'))
+        self.assertIsNone(found[2].entity)
+        self.assertEqual(len(shotgun_api3.calls('find')), 1)
+        self.assertEqual(shotgun_api3.calls('find_one'), [])
+        self.assertEqual([f for f in found[0]._fields if '.' in f], [])
+
+        # the linked entities are cached
+        self.assertIs(self.sg.Shot(1), shot)
+        self.assertIs(self.sg.Sequence(1), shot.sg_sequence)
+
+    def test_cached_linked_entities_are_updated(self):
+        sequence = self.sg.Sequence(1, fields=['code', 'description'])
+        sequence.description = 'modified'
+        shotgun_api3.DB['Sequence'][1]['code'] = 'renamed'
+
+        shot = self.sg.Shot(1, fields={'sg_sequence': ['code', 'description']})
+
+        self.assertIs(shot.sg_sequence, sequence)
+        self.assertEqual(sequence.code, 'renamed')
+        self.assertEqual(sequence.description, 'modified')
+
+
+class ReloadTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sg = make_shotgun(shots(), defaultFields={'Shot': ['code']})
+
+    def test_reload_fetches_every_field(self):
+        shot = self.sg.Shot(1)
+        self.assertNotIn('description', shot._fields)
+
+        shot.reload()
+        self.assertEqual(shot._fields['description'], 'shot 1')
+
+    def test_reload_default_fields(self):
+        shot = self.sg.Shot(1)
+        shot.reload(mode='all')
+
+        shot.reload(mode='default')
+        self.assertEqual(sorted(shot._fields), ['code', 'id', 'type'])
+
+
+if __name__ == '__main__':
+    unittest.main()
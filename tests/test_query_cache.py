@@ -0,0 +1,122 @@
+import unittest
+
+import shotgun_api3
+
+from helpers import make_shotgun, link
+
+from sg_wrapper_cache import QueryCache, make_query_key
+
+
+def key(entityType='Shot', filters=None, order=None, findOne=False):
+    return make_query_key(entityType, filters or {}, order or [], findOne)
+
+
+class QueryCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = QueryCache(maxSize=3)
+
+    def test_keys_are_canonical(self):
+        first = key(filters={'project': {'type': 'Project', 'id': 1}, 'id': ('in', [1, 2])})
+        second = key(filters={'id': ('in', [1, 2]), 'project': {'id': 1, 'type': 'Project'}})
+
+        self.assertEqual(first, second)
+        self.assertNotEqual(key(filters={'id': ('in', [1, 2])}), key(filters={'id': ('in', [2, 1])}))
+        self.assertNotEqual(key(findOne=True), key())
+
+    def test_lookup_needs_every_requested_field(self):
+        self.cache.put(key(), ['code', 'description'], 'result')
+
+        self.assertEqual(self.cache.get(key(), ['code']), (True, 'result'))
+        self.assertEqual(self.cache.get(key(), ['code', 'sg_status_list']), (False, None))
+        self.assertEqual(self.cache.get(key('Asset'), ['code']), (False, None))
+        self.assertEqual(self.cache.stats()['hits'], 1)
+        self.assertEqual(self.cache.stats()['misses'], 2)
+
+    def test_larger_entry_supersedes_the_smaller_ones(self):
+        self.cache.put(key(), ['code'], 'small')
+        self.cache.put(key(), ['description'], 'other')
+        self.cache.put(key(), ['code', 'description'], 'large')
+
+        self.assertEqual(len(self.cache), 1)
+        self.assertEqual(self.cache.get(key(), ['code']), (True, 'large'))
+
+    def test_least_recently_used_buckets_are_evicted(self):
+        for entityType in ('Shot', 'Asset', 'Sequence'):
+            self.cache.put(key(entityType), ['code'], entityType)
+        self.cache.get(key('Shot'), ['code'])
+
+        self.cache.put(key('Version'), ['code'], 'Version')
+
+        self.assertEqual(len(self.cache), 3)
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+        self.assertFalse(self.cache.get(key('Asset'), ['code'])[0])
+        self.assertTrue(self.cache.get(key('Shot'), ['code'])[0])
+
+    def test_expired_entries_are_dropped(self):
+        self.cache.put(key(), ['code'], 'result')
+        self.cache._buckets[key()][0]['time'] -= 10
+
+        self.assertTrue(self.cache.get(key(), ['code'], ttl=60)[0])
+        self.assertFalse(self.cache.get(key(), ['code'], ttl=5)[0])
+        self.assertEqual(len(self.cache), 0)
+
+    def test_invalidation_by_filter_field(self):
+        statusKey = key(filters={'sg_status_list': 'ip'})
+        codeKey = key(order=['asc', 'code'])
+        idKey = key(filters={'id': ('in', [1, 2])})
+        self.cache.put(statusKey, ['code'], 'status', ids=[1], filterFields=['sg_status_list'])
+        self.cache.put(codeKey, ['code'], 'code', ids=[1, 2], filterFields=['code'])
+        self.cache.put(idKey, ['code'], 'id', ids=[1, 2], filterFields=['id'])
+
+        # entity 3 is in none of the results: only the query on the changed field is evicted
+        self.assertEqual(self.cache.invalidate('Shot', 3, 'sg_status_list'), 1)
+        self.assertFalse(self.cache.get(statusKey, ['code'])[0])
+        self.assertTrue(self.cache.get(codeKey, ['code'])[0])
+
+        # unknown field: every query on a field other than the id
+        self.assertEqual(self.cache.invalidate('Shot', 3), 1)
+        self.assertTrue(self.cache.get(idKey, ['code'])[0])
+
+        self.assertEqual(self.cache.invalidate('Asset', 1, 'code'), 0)
+        self.assertEqual(self.cache.invalidate('Shot', 1, 'description'), 1)
+        self.assertEqual(len(self.cache), 0)
+
+    def test_unlimited_size(self):
+        cache = QueryCache(maxSize=None)
+        for i in range(10):
+            cache.put(key(filters={'id': i}), ['code'], i)
+        self.assertEqual(len(cache), 10)
+
+
+class FindEntityCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        records = {'Shot': [{'id': i, 'code': 'sh%03d' % i, 'sg_status_list': 'ip',
+                             'sg_sequence': link('Sequence', 1)} for i in range(1, 4)]}
+        self.sg = make_shotgun(records, queryCacheSize=2)
+
+    def test_equal_queries_are_fetched_once(self):
+        first = self.sg.Shots(fields=['code', 'sg_status_list'], sg_status_list='ip',
+                              sg_sequence=link('Sequence', 1))
+        second = self.sg.Shots(fields=['code'], sg_sequence={'id': 1, 'type': 'Sequence'},
+                               sg_status_list='ip')
+
+        self.assertIs(first, second)
+        self.assertEqual(len(shotgun_api3.calls('find')), 1)
+        self.assertEqual(self.sg.query_cache_stats()['hits'], 1)
+
+    def test_size_is_bounded(self):
+        for status in ('ip', 'cmpt', 'fin'):
+            self.sg.Shots(fields=['code'], sg_status_list=status)
+
+        stats = self.sg.query_cache_stats()
+        self.assertEqual(stats['size'], 2)
+        self.assertEqual(stats['evictions'], 1)
+
+        self.sg.Shots(fields=['code'], sg_status_list='ip')
+        self.assertEqual(len(shotgun_api3.calls('find')), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
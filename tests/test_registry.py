@@ -0,0 +1,72 @@
+import unittest
+
+from helpers import make_shotgun
+
+from sg_wrapper_schema import EntityTypeRegistry
+
+
+class EntityTypeRegistryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = EntityTypeRegistry()
+        self.cut = self.registry.register('CustomEntity23', 'EditingCut', 'CustomEntity23s', 'EditingCuts')
+
+    def test_lookups(self):
+        for name in ('CustomEntity23', 'EditingCut', 'CustomEntity23s', 'EditingCuts'):
+            self.assertIs(self.registry.get(name), self.cut)
+
+        self.assertIs(self.registry.get_singular('EditingCut'), self.cut)
+        self.assertIsNone(self.registry.get_singular('EditingCuts'))
+        self.assertIs(self.registry.get_plural('EditingCuts'), self.cut)
+        self.assertIsNone(self.registry.get_plural('EditingCut'))
+        self.assertIs(self.registry.get_type('CustomEntity23'), self.cut)
+        self.assertIsNone(self.registry.get_type('EditingCut'))
+        self.assertIsNone(self.registry.get('Cut'))
+
+    def test_aliases_extend_the_record(self):
+        record = self.registry.register('CustomEntity23', 'Cut', 'CustomEntity23s', 'Cuts')
+
+        self.assertIs(record, self.cut)
+        self.assertEqual(record['name'], 'EditingCut')
+        self.assertEqual(record['names'], ['EditingCut', 'Cut'])
+        self.assertEqual(record['names_plural'], ['EditingCuts', 'Cuts'])
+        self.assertIs(self.registry.get('Cuts'), self.cut)
+        self.assertEqual(len(self.registry), 1)
+
+    def test_first_registered_type_wins(self):
+        other = self.registry.register('CustomEntity24', 'EditingCut', 'CustomEntity24s', 'EditingCuts')
+
+        self.assertIs(self.registry.get('EditingCut'), self.cut)
+        self.assertIs(self.registry.get('EditingCuts'), self.cut)
+        self.assertIs(self.registry.get('CustomEntity24'), other)
+
+    def test_singular_forms_are_looked_up_first(self):
+        person = self.registry.register('CustomEntity01', 'Person', 'CustomEntity01s', 'People')
+        people = self.registry.register('CustomEntity02', 'People', 'CustomEntity02s', 'Peoples')
+
+        self.assertIs(self.registry.get('People'), people)
+        self.assertIs(self.registry.get_plural('People'), person)
+
+    def test_registration_order(self):
+        self.registry.register('Shot', 'Shot', 'Shots', 'Shots')
+        self.registry.register('Asset', 'Asset', 'Assets', 'Assets')
+
+        self.assertEqual([r['type'] for r in self.registry], ['CustomEntity23', 'Shot', 'Asset'])
+        self.assertIn('Assets', self.registry)
+        self.assertNotIn('Sequence', self.registry)
+
+
+class ShotgunEntityTypesTest(unittest.TestCase):
+
+    def test_names_are_resolved(self):
+        sg = make_shotgun()
+
+        self.assertEqual(sg.get_real_type('EditingCut'), 'CustomEntity23')
+        self.assertEqual(sg.get_real_type('EditingCuts'), 'CustomEntity23')
+        self.assertEqual(sg.get_real_type('Shot'), 'Shot')
+        self.assertIsNone(sg.get_real_type('Cut'))
+        self.assertEqual(sg.get_real_type('Cut', defaults_to_paramater=True), 'Cut')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import socket
+import unittest
+
+import shotgun_api3
+
+from sg_wrapper_retry import CircuitBreaker, CircuitOpenError, RetryPolicy, is_transport_error
+
+from helpers import make_shotgun
+
+
+def shots():
+    return {'Shot': [{'id': 1, 'code': 'sh001'}]}
+
+
+class CircuitBreakerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.breaker = CircuitBreaker(failureThreshold=2, resetTimeout=60)
+        policy = RetryPolicy(maxAttempts=1, circuitBreaker=self.breaker)
+        self.sg = make_shotgun(shots(), retryPolicy=policy)
+
+    def fail_next(self, *errors):
+        shotgun_api3.Shotgun.failures = list(errors)
+
+    def half_open(self):
+        self.breaker._openedAt -= self.breaker.resetTimeout
+
+    def test_transport_errors_open_the_circuit(self):
+        self.fail_next(socket.timeout('timed out'), socket.error(104, 'Connection reset by peer'))
+        for _ in range(2):
+            self.assertRaises(socket.error, self.sg.sg_find, 'Shot', [], ['code'])
+
+        self.assertEqual(self.breaker.state, CircuitBreaker.open)
+        self.assertRaises(CircuitOpenError, self.sg.sg_find, 'Shot', [], ['code'])
+
+    def test_failed_trial_opens_the_circuit_again(self):
+        self.fail_next(socket.error(), socket.error(), socket.error())
+        for _ in range(2):
+            self.assertRaises(socket.error, self.sg.sg_find, 'Shot', [], ['code'])
+
+        self.half_open()
+        self.assertRaises(socket.error, self.sg.sg_find, 'Shot', [], ['code'])
+        self.assertEqual(self.breaker.state, CircuitBreaker.open)
+        self.assertEqual(self.breaker.stats()['opened'], 2)
+
+    def test_fault_neither_closes_nor_opens_the_circuit(self):
+        self.fail_next(socket.error(), shotgun_api3.Fault('invalid filter'), socket.error())
+        self.assertRaises(socket.error, self.sg.sg_find, 'Shot', [], ['code'])
+        self.assertRaises(shotgun_api3.Fault, self.sg.sg_find, 'Shot', [], ['code'])
+        self.assertEqual(self.breaker.stats()['consecutiveFailures'], 1)
+
+        self.assertRaises(socket.error, self.sg.sg_find, 'Shot', [], ['code'])
+        self.assertEqual(self.breaker.state, CircuitBreaker.open)
+
+    def test_fault_of_the_trial_lets_another_trial_through(self):
+        self.fail_next(socket.error(), socket.error(), shotgun_api3.Fault('invalid filter'))
+        for _ in range(2):
+            self.assertRaises(socket.error, self.sg.sg_find, 'Shot', [], ['code'])
+
+        self.half_open()
+        self.assertRaises(shotgun_api3.Fault, self.sg.sg_find, 'Shot', [], ['code'])
+        self.assertEqual(self.breaker.state, CircuitBreaker.halfOpen)
+
+        self.assertEqual(len(self.sg.sg_find('Shot', [], ['code'])), 1)
+        self.assertEqual(self.breaker.state, CircuitBreaker.closed)
+
+    def test_local_methods_do_not_reset_the_circuit(self):
+        self.fail_next(socket.error())
+        self.assertRaises(socket.error, self.sg.sg_find, 'Shot', [], ['code'])
+
+        self.sg._sg.set_session_uuid('uuid')
+        self.assertEqual(self.breaker.stats()['consecutiveFailures'], 1)
+        self.assertEqual(self.sg._sg.config.session_uuid, 'uuid')
+
+    def test_success_closes_the_circuit(self):
+        self.fail_next(socket.error())
+        self.assertRaises(socket.error, self.sg.sg_find, 'Shot', [], ['code'])
+        self.sg.sg_find('Shot', [], ['code'])
+        self.assertEqual(self.breaker.stats()['consecutiveFailures'], 0)
+
+
+class TransportErrorTest(unittest.TestCase):
+
+    def test_transport_errors(self):
+        self.assertTrue(is_transport_error(socket.timeout('timed out')))
+        self.assertTrue(is_transport_error(socket.error(111, 'Connection refused')))
+        self.assertFalse(is_transport_error(shotgun_api3.Fault('invalid filter')))
+        self.assertFalse(is_transport_error(ValueError()))
+
+    def test_local_file_errors_are_not_transport_errors(self):
+        try:
+            open('/nonexistent/movie.mov')
+        except IOError as e:
+            self.assertFalse(is_transport_error(e))
+        else:
+            self.fail('the file exists')
+
+
+if __name__ == '__main__':
+    unittest.main()
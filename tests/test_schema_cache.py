@@ -0,0 +1,80 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import shotgun_api3
+
+import sg_wrapper
+from sg_wrapper_schema import SchemaCache
+
+from helpers import make_shotgun, server
+
+
+class SchemaCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.cache = SchemaCache(self.folder)
+        self.serverDir = self.cache._server_dir(server)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def generations(self):
+        return sorted(name for name in os.listdir(self.serverDir) if name.startswith('gen'))
+
+    def test_round_trip(self):
+        entities = {'Shot': {'name': {'value': 'Shot'}}}
+        self.cache.write_entities(server, entities)
+        self.cache.write_fields(server, 'Shot', shotgun_api3.schema_fields('Shot'))
+
+        self.assertEqual(self.cache.read_entities(server), entities)
+        self.assertEqual(self.cache.read_fields(server, 'Shot'), shotgun_api3.schema_fields('Shot'))
+        self.assertIsNone(self.cache.read_fields(server, 'Asset'))
+
+    def test_expired_generation_is_replaced(self):
+        self.cache.ttl = 0
+        self.cache.write_entities(server, {'Shot': {}})
+        time.sleep(0.01)
+        self.assertIsNone(self.cache.read_entities(server))
+
+        self.cache.write_entities(server, {'Asset': {}})
+        self.assertEqual(len(self.generations()), 1)
+
+    def test_stale_generations_are_swept(self):
+        self.cache.write_entities(server, {'Shot': {}})
+        stale = os.path.join(self.serverDir, 'genstale')
+        writing = os.path.join(self.serverDir, 'genwriting')
+        os.mkdir(stale)
+        os.mkdir(writing)
+        old = time.time() - 2 * 86400
+        os.utime(stale, (old, old))
+
+        self.cache.write_entities(server, {'Asset': {}})
+        generations = self.generations()
+        self.assertEqual(len(generations), 2)
+        self.assertIn('genwriting', generations)
+        self.assertEqual(self.cache.read_entities(server), {'Asset': {}})
+
+    def test_unreadable_files_are_misses(self):
+        self.cache.write_entities(server, {'Shot': {}})
+        generation = self.cache._current_generation(server)
+        with open(os.path.join(generation, 'entities'), 'wb') as f:
+            f.write(b'\x80\x02}q\x00.')
+        self.assertIsNone(self.cache.read_entities(server))
+
+    def test_shotgun_reads_the_schema_once(self):
+        make_shotgun(schemaCache=self.cache).Shot(1)
+        del shotgun_api3.CALLS[:]
+
+        sg = sg_wrapper.Shotgun(server, 'tests', 'key', schemaCache=self.cache,
+                                disableApiAuthOverride=True, printInfo=False)
+        sg.Shot(1)
+        self.assertEqual(shotgun_api3.calls('schema_entity_read'), [])
+        self.assertEqual(shotgun_api3.calls('schema_field_read'), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
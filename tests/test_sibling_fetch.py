@@ -0,0 +1,78 @@
+import gc
+import pickle
+import unittest
+
+import shotgun_api3
+
+from helpers import make_shotgun
+
+
+def shots(count=5):
+    return {'Shot': [{'id': i, 'code': 'sh%03d' % i, 'description': 'shot %d' % i, 'sg_status_list': 'ip'}
+                     for i in range(1, count + 1)]}
+
+
+class SiblingFetchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sg = make_shotgun(shots(), siblingFetch=True)
+        self.shots = self.sg.Shots(fields=['code'])
+        del shotgun_api3.CALLS[:]
+
+    def test_missing_field_is_fetched_for_every_sibling(self):
+        self.assertEqual([s.description for s in self.shots], ['shot %d' % i for i in range(1, 6)])
+        self.assertEqual([s.sg_status_list for s in self.shots], ['ip'] * 5)
+
+        self.assertEqual(len(shotgun_api3.calls('find')), 2)
+        self.assertEqual(shotgun_api3.calls('find_one'), [])
+
+    def test_chunks(self):
+        self.assertTrue(self.sg._fetch_sibling_field(self.shots[0], 'description', chunkSize=2))
+
+        self.assertEqual(len(shotgun_api3.calls('find')), 3)
+        self.assertTrue(all('description' in s._fields for s in self.shots))
+
+    def test_values_already_fetched_are_kept(self):
+        self.shots[1].description = 'modified'
+        shotgun_api3.DB['Shot'][1]['description'] = 'renamed'
+
+        self.assertEqual(self.shots[0].description, 'renamed')
+        self.assertEqual(self.shots[1].description, 'modified')
+        self.assertEqual(self.shots[1].modified_fields(), ['description'])
+
+    def test_siblings_are_weak_references(self):
+        shot = self.shots[0]
+        del self.shots
+        self.sg.clear_cache()
+        gc.collect()
+
+        self.assertEqual(list(shot._siblings.keys()), [1])
+        self.assertEqual(shot.description, 'shot 1')
+        self.assertEqual(len(shotgun_api3.calls('find')), 1)
+
+    def test_single_entity_is_reloaded(self):
+        self.sg.clear_cache()
+        shot = self.sg.Shot(1, fields=['code'])
+        self.assertIsNone(shot._siblings)
+        del shotgun_api3.CALLS[:]
+
+        self.assertEqual(shot.description, 'shot 1')
+        self.assertEqual(len(shotgun_api3.calls('find_one')), 1)
+
+    def test_pickled_entity_has_no_siblings(self):
+        self.assertIsNone(pickle.loads(pickle.dumps(self.shots[0]))._siblings)
+
+
+class WithoutSiblingFetchTest(unittest.TestCase):
+
+    def test_each_entity_is_reloaded(self):
+        sg = make_shotgun(shots())
+        found = sg.Shots(fields=['code'])
+
+        self.assertIsNone(found[0]._siblings)
+        self.assertEqual([s.description for s in found], ['shot %d' % i for i in range(1, 6)])
+        self.assertEqual(len(shotgun_api3.calls('find_one')), 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import copy
+import threading
+import time
+import unittest
+
+import shotgun_api3
+
+from helpers import make_shotgun
+
+from sg_wrapper_cache import SingleFlight
+
+threadCount = 8
+
+
+class SingleFlightTest(unittest.TestCase):
+
+    def setUp(self):
+        self.flight = SingleFlight()
+        self.release = threading.Event()
+        self.calls = []
+
+    def call(self, result=None, error=None):
+        self.calls.append(threading.current_thread())
+        self.release.wait()
+        if error is not None:
+            raise error
+        return result
+
+    def run_threads(self, target):
+        ''' Run target in threadCount threads, the first one running the call the others wait for '''
+        outcomes = []
+
+        def run():
+            try:
+                outcomes.append(('result', target()))
+            except BaseException as e:
+                outcomes.append(('error', e))
+
+        threads = [threading.Thread(target=run) for i in range(threadCount)]
+        for thread in threads:
+            thread.start()
+
+        # every other thread waits for the first one
+        while self.flight.saved < threadCount - 1:
+            time.sleep(0.001)
+        self.release.set()
+
+        for thread in threads:
+            thread.join()
+        return outcomes
+
+    def test_one_call_and_a_copy_per_caller(self):
+        result = {'id': 1, 'tags': ['a']}
+        outcomes = self.run_threads(lambda: self.flight.do('key', self.call, result, copyResult=copy.deepcopy))
+
+        self.assertEqual(len(self.calls), 1)
+        values = [value for kind, value in outcomes]
+        self.assertEqual(values, [result] * threadCount)
+        self.assertEqual(len(set(id(v) for v in values)), threadCount)
+        self.assertEqual(len(set(id(v['tags']) for v in values)), threadCount)
+
+    def test_base_exceptions_are_raised_by_every_caller(self):
+        error = KeyboardInterrupt()
+        outcomes = self.run_threads(lambda: self.flight.do('key', self.call, error=error))
+
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(outcomes, [('error', error)] * threadCount)
+        self.assertEqual(self.flight.stats()['inFlight'], 0)
+
+
+class SgFindOneTest(unittest.TestCase):
+
+    def tearDown(self):
+        shotgun_api3.LATENCY = 0.0
+
+    def test_concurrent_calls_send_one_request(self):
+        sg = make_shotgun({'Shot': [{'id': 1, 'code': 'sh001', 'assets': [{'type': 'Asset', 'id': 2}]}]})
+        shotgun_api3.LATENCY = 0.1
+        results = []
+
+        def find():
+            results.append(sg.sg_find_one('Shot', [['id', 'is', 1]], ['code', 'assets']))
+
+        threads = [threading.Thread(target=find) for i in range(threadCount)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(shotgun_api3.calls('find_one')), 1)
+        self.assertEqual(len(results), threadCount)
+        self.assertEqual(len(set(id(r) for r in results)), threadCount)
+        self.assertEqual(len(set(id(r['assets']) for r in results)), threadCount)
+        self.assertTrue(all(r == results[0] for r in results))
+
+
+if __name__ == '__main__':
+    unittest.main()
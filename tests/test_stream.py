@@ -0,0 +1,61 @@
+import types
+import unittest
+
+import shotgun_api3
+
+from helpers import make_shotgun
+
+
+def shots(count=5):
+    return {'Shot': [{'id': i, 'code': 'sh%03d' % i, 'sg_status_list': 'cmpt' if i % 2 else 'ip'}
+                     for i in range(1, count + 1)]}
+
+
+class IterEntitiesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sg = make_shotgun(shots())
+
+    def test_pages_are_fetched_while_iterating(self):
+        iterator = self.sg.iter_entities('Shot', fields=['code'], page_size=2)
+        self.assertEqual(shotgun_api3.calls('find'), [])
+
+        self.assertEqual(next(iterator).code, 'sh001')
+        self.assertEqual(len(shotgun_api3.calls('find')), 1)
+
+        self.assertEqual([s.code for s in iterator], ['sh%03d' % i for i in range(2, 6)])
+        self.assertEqual(len(shotgun_api3.calls('find')), 3)
+
+    def test_full_last_page_ends_with_an_empty_one(self):
+        self.assertEqual(len(list(self.sg.iter_entities('Shot', fields=['code'], page_size=5))), 5)
+        self.assertEqual(len(shotgun_api3.calls('find')), 2)
+
+    def test_filters_and_order(self):
+        found = self.sg.iter_entities('Shot', fields=['code'], order=['desc', 'code'],
+                                      page_size=2, sg_status_list='cmpt')
+        self.assertEqual([s.code for s in found], ['sh005', 'sh003', 'sh001'])
+
+    def test_find_entity_stream(self):
+        found = self.sg.Shots(fields=['code'], stream=True, page_size=2)
+
+        self.assertIsInstance(found, types.GeneratorType)
+        self.assertEqual([s.id for s in found], [1, 2, 3, 4, 5])
+
+    def test_streamed_results_are_not_cached(self):
+        list(self.sg.iter_entities('Shot', fields=['code']))
+
+        self.assertEqual(self.sg.query_cache_stats()['size'], 0)
+        self.assertEqual(self.sg._entities.get('Shot', {}), {})
+
+        self.sg.Shot(1, fields=['code'])
+        self.assertEqual(len(shotgun_api3.calls('find_one')), 1)
+
+    def test_use_cache_registers_the_entities(self):
+        streamed = list(self.sg.iter_entities('Shot', fields=['code'], use_cache=True))
+
+        self.assertIs(self.sg.Shot(1, fields=['code']), streamed[0])
+        self.assertEqual(shotgun_api3.calls('find_one'), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import os
+import subprocess
+import sys
+import unittest
+
+testsDir = os.path.dirname(os.path.abspath(__file__))
+rootDir = os.path.dirname(testsDir)
+script = os.path.join(rootDir, 'scripts', 'userFromEvent.py')
+
+# runs the script with the server calls of sg_wrapper_util replaced,
+# each request being reported on stderr
+harness = '''
+import runpy
+import sys
+
+sys.path[:0] = [%r, %r]
+
+import sg_wrapper_util
+
+
+def get_users_from_events(chunk, sgw=None, onlyUsername=True, chunkSize=500):
+    sys.stderr.write('request %%d-%%d\\n' %% (chunk[0], chunk[-1]))
+    return dict((i, 'user%%d' %% i) for i in chunk)
+
+sg_wrapper_util.get_default_handle = lambda: None
+sg_wrapper_util.get_users_from_events = get_users_from_events
+sys.argv = [%r] + sys.argv[1:]
+runpy.run_path(%r, run_name='__main__')
+''' % (testsDir, rootDir, script, script)
+
+
+def load_script():
+    import imp
+    sys.path[:0] = [testsDir, rootDir]
+    try:
+        return imp.load_source('userFromEvent', script)
+    finally:
+        del sys.path[:2]
+
+
+@unittest.skipIf(sys.version_info[0] > 2, 'userFromEvent is a python 2 script')
+class ParseEventIdsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.module = load_script()
+
+    def test_ids_and_ranges(self):
+        self.assertEqual(list(self.module.parse_event_ids(['3', '10-12', '5-5'])), [3, 10, 11, 12, 5])
+
+    def test_every_token_is_validated_first(self):
+        for token in ('abc', '0', '-3', '5-2', '1-x'):
+            tokens = iter(['1-1000000000', token])
+            self.assertRaises(ValueError, self.module.parse_event_ids, tokens)
+
+
+@unittest.skipIf(sys.version_info[0] > 2, 'userFromEvent is a python 2 script')
+class UserFromEventTest(unittest.TestCase):
+
+    def start(self, *args):
+        return subprocess.Popen([sys.executable, '-c', harness] + list(args),
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    def test_invalid_id_fails_before_the_first_query(self):
+        process = self.start('--chunk-size', '2', '1-5', 'abc')
+        out, err = process.communicate()
+
+        self.assertEqual(process.returncode, 1)
+        self.assertEqual(out, '')
+        self.assertEqual(err, 'Invalid event id: abc\n')
+
+    def test_chunks(self):
+        process = self.start('--chunk-size', '2', '1-3')
+        out, err = process.communicate()
+
+        self.assertEqual(process.returncode, 0)
+        self.assertEqual(len(out.splitlines()), 3)
+        self.assertEqual(err, 'request 1-2\nrequest 3-3\n')
+
+    def test_closed_output_stops_quietly(self):
+        process = self.start('--chunk-size', '10', '1-1000000')
+        process.stdout.readline()
+        process.stdout.close()
+        err = process.stderr.read()
+
+        self.assertEqual(process.wait(), 0)
+        self.assertNotIn('Traceback', err)
+        self.assertNotIn('Broken pipe', err)
+
+
+if __name__ == '__main__':
+    unittest.main()
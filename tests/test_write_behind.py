@@ -0,0 +1,199 @@
+import socket
+import unittest
+
+import shotgun_api3
+
+import sg_wrapper
+
+from helpers import make_shotgun
+
+
+def shots(count=4):
+    return {'Shot': [{'id': i, 'code': 'sh%03d' % i, 'sg_status_list': 'ip'} for i in range(1, count + 1)]}
+
+
+class WriteBehindTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sg = make_shotgun(shots())
+        self.shots = self.sg.Shots()
+        del shotgun_api3.CALLS[:]
+
+    def test_updates_are_merged_and_sent_on_flush(self):
+        self.sg.enable_write_behind(maxSize=None)
+        for shot in self.shots:
+            shot.sg_status_list = 'cmpt'
+            shot.commit()
+        self.shots[0].code = 'renamed'
+        self.shots[0].commit()
+
+        self.assertEqual(shotgun_api3.CALLS, [])
+        self.assertEqual(sorted(self.shots[0].modified_fields()), ['code', 'sg_status_list'])
+
+        self.assertEqual(self.sg.flush(), [])
+        self.assertEqual(shotgun_api3.calls('batch'), [('batch', None)])
+        self.assertEqual(shotgun_api3.DB['Shot'][1]['code'], 'renamed')
+        self.assertEqual(set(s['sg_status_list'] for s in shotgun_api3.DB['Shot'].values()), set(['cmpt']))
+        self.assertEqual([s.modified_fields() for s in self.shots], [[]] * 4)
+
+    def test_size_triggered_flush_failures_are_recorded(self):
+        self.sg.enable_write_behind(maxSize=2)
+        # the batch call, then the update of each entity of the batch
+        shotgun_api3.Shotgun.failures = [shotgun_api3.Fault('rejected')] * 3
+
+        first, second = self.shots[:2]
+        first.sg_status_list = 'cmpt'
+        first.commit()
+        second.sg_status_list = 'cmpt'
+        self.assertTrue(second.commit())
+
+        failures = self.sg.write_behind_failures()
+        self.assertEqual(sorted(e.entity_id() for e, error in failures), [1, 2])
+        self.assertIsInstance(failures[0][1], shotgun_api3.Fault)
+
+        # nothing was sent: the changes are still queued and pending on the entities
+        self.assertEqual(self.sg.write_behind_stats()['pending'], 2)
+        self.assertEqual(first.modified_fields(), ['sg_status_list'])
+        self.assertEqual(second.modified_fields(), ['sg_status_list'])
+        self.assertEqual(shotgun_api3.DB['Shot'][1]['sg_status_list'], 'ip')
+
+        # and sent again once the server accepts them
+        self.assertEqual(self.sg.commit_all(), [])
+        self.assertEqual(shotgun_api3.calls('batch'), [('batch', None)] * 2)
+        self.assertEqual(shotgun_api3.DB['Shot'][1]['sg_status_list'], 'cmpt')
+        self.assertEqual(shotgun_api3.DB['Shot'][2]['sg_status_list'], 'cmpt')
+        self.assertEqual(first.modified_fields(), [])
+        self.assertEqual(self.sg.write_behind_failures(), [])
+        self.assertEqual(self.sg.write_behind_stats()['pending'], 0)
+
+    def test_failed_update_stays_queued(self):
+        self.sg.enable_write_behind(maxSize=1)
+        shotgun_api3.Shotgun.failures = [socket.error(104, 'Connection reset by peer')]
+
+        self.sg.update(self.shots[0], {'code': 'renamed'})
+        self.assertEqual(self.sg.write_behind_stats()['pending'], 1)
+
+        self.sg.clear_cache()
+        self.assertEqual(self.sg.Shot(1).code, 'renamed')
+
+        self.assertEqual(self.sg.flush(), [])
+        self.assertEqual(shotgun_api3.DB['Shot'][1]['code'], 'renamed')
+        self.assertEqual(self.sg.write_behind_stats()['pending'], 0)
+
+    def test_writes_during_a_flush_stay_queued(self):
+        shot = self.shots[0]
+
+        def send(updates):
+            # written while the snapshot is being sent
+            self.sg.update(shot, {'code': 'second'})
+            return self.sg._batch_updates(updates, 10, clearChanges=True)
+
+        self.sg.enable_write_behind(maxSize=None)
+        self.sg._write_buffer._flushFunc = send
+        self.sg.update(shot, {'code': 'first', 'sg_status_list': 'cmpt'})
+
+        self.assertEqual(self.sg.flush(), [])
+        self.assertEqual(shotgun_api3.DB['Shot'][1]['code'], 'first')
+        self.assertEqual(self.sg._pending_fields('Shot', 1), {'code': 'second'})
+        self.assertEqual(shot.code, 'second')
+
+    def test_revert_after_a_failed_flush(self):
+        self.sg.enable_write_behind(maxSize=1)
+        shotgun_api3.Shotgun.failures = [shotgun_api3.Fault('rejected')] * 2
+
+        shot = self.shots[0]
+        self.sg.update(shot, {'code': 'renamed'})
+
+        self.assertEqual(shot.modified_fields(), ['code'])
+        shot.revert()
+        self.assertEqual(shot.code, 'sh001')
+
+        # the reverted value is no longer queued
+        self.assertEqual(self.sg.write_behind_stats()['pending'], 0)
+        self.assertEqual(self.sg.flush(), [])
+        self.assertEqual(shotgun_api3.DB['Shot'][1]['code'], 'sh001')
+
+    def test_fields_modified_again_stay_modified(self):
+        self.sg.enable_write_behind(maxSize=None)
+        shot = self.shots[0]
+        shot.code = 'first'
+        shot.commit()
+        shot.code = 'second'
+
+        self.sg.flush()
+
+        self.assertEqual(shotgun_api3.DB['Shot'][1]['code'], 'first')
+        self.assertEqual(shot.modified_fields(), ['code'])
+        self.assertEqual(shot.code, 'second')
+
+    def test_reads_see_the_queued_values(self):
+        self.sg.enable_write_behind(maxSize=None)
+        shot = self.shots[0]
+        self.sg.update(shot, {'code': 'queued'})
+
+        self.sg.clear_cache()
+        self.assertEqual(self.sg.Shot(1).code, 'queued')
+        self.assertEqual(shotgun_api3.DB['Shot'][1]['code'], 'sh001')
+
+    def test_context_manager_raises_the_failures(self):
+        def write():
+            with self.sg.write_behind(maxSize=1):
+                # the flush of the update, then the flush sending it again on exit
+                shotgun_api3.Shotgun.failures = [shotgun_api3.Fault('rejected')] * 4
+                self.sg.update(self.shots[0], {'code': 'renamed'})
+
+        self.assertRaises(sg_wrapper.ShotgunWrapperError, write)
+        self.assertIsNone(self.sg._write_buffer)
+
+    def test_disable_returns_every_failure(self):
+        self.sg.enable_write_behind(maxSize=2)
+        shotgun_api3.Shotgun.failures = [shotgun_api3.Fault('rejected')] * 2 + [None]
+        self.sg.update(self.shots[0], {'code': 'renamed'})
+        self.sg.update(self.shots[1], {'code': 'renamed'})
+        self.assertEqual([e.entity_id() for e, error in self.sg.write_behind_failures()], [1])
+
+        shotgun_api3.Shotgun.failures = [shotgun_api3.Fault('rejected')] * 2
+        failures = self.sg.disable_write_behind()
+        self.assertEqual([e.entity_id() for e, error in failures], [1])
+        self.assertEqual(shotgun_api3.DB['Shot'][2]['code'], 'renamed')
+        self.assertEqual(self.shots[0].modified_fields(), ['code'])
+
+
+class CommitAllTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sg = make_shotgun(shots())
+        self.shots = self.sg.Shots()
+        for shot in self.shots:
+            shot.sg_status_list = 'cmpt'
+        del shotgun_api3.CALLS[:]
+
+    def test_rejected_batch_is_sent_update_by_update(self):
+        shotgun_api3.Shotgun.failures = [shotgun_api3.Fault('rejected'), None, shotgun_api3.Fault('rejected')]
+
+        failures = self.sg.commit_all(batchSize=2)
+        self.assertEqual([e.entity_id() for e, error in failures], [2])
+        self.assertEqual([c[0] for c in shotgun_api3.calls()], ['batch', 'update', 'update', 'batch'])
+        self.assertEqual([s.modified_fields() for s in self.shots], [[], ['sg_status_list'], [], []])
+
+    def test_connection_error_stops_the_commit(self):
+        error = socket.error(104, 'Connection reset by peer')
+        shotgun_api3.Shotgun.failures = [error]
+
+        failures = self.sg.commit_all(batchSize=2)
+        self.assertEqual(sorted(e.entity_id() for e, _ in failures), [1, 2, 3, 4])
+        self.assertTrue(all(e is error for _, e in failures))
+        self.assertEqual(shotgun_api3.calls(), [('batch', None)])
+        self.assertEqual([s.modified_fields() for s in self.shots], [['sg_status_list']] * 4)
+
+    def test_connection_error_while_sending_update_by_update(self):
+        shotgun_api3.Shotgun.failures = [shotgun_api3.Fault('rejected'), None, socket.error()]
+
+        failures = self.sg.commit_all(batchSize=2)
+        self.assertEqual(sorted(e.entity_id() for e, _ in failures), [2, 3, 4])
+        self.assertEqual(len(shotgun_api3.calls()), 3)
+        self.assertEqual(shotgun_api3.DB['Shot'][1]['sg_status_list'], 'cmpt')
+
+
+if __name__ == '__main__':
+    unittest.main()